@@ -0,0 +1,73 @@
+# pylint: disable = logging-fstring-interpolation, protected-access
+"""Mesure de la mémoire occupée par les cartes : octets par mot énoncé, stockage dict avant / en colonnes après"""
+
+__author__ = "Romuald Thion"
+
+import sys
+import time
+from cog_maps import (
+    CM_LA_MINE_FILENAME,
+    CM_FUTUR_FILENAME,
+    THESAURUS_FILENAME,
+    LEVELS,
+    CogMaps,
+)
+
+
+def deep_size(value, seen=None) -> int:
+    """Taille en octets d'un objet et de tout ce qu'il référence, chaque objet n'étant compté qu'une fois"""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if hasattr(value, "nbytes") and hasattr(value, "dtype"):
+        # tableau numpy, éventuellement une vue qui ne possède pas ses données
+        return size + (0 if value.flags.owndata else value.nbytes)
+    if isinstance(value, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += deep_size(vars(value), seen)
+    return size
+
+
+def measure(levels: dict) -> tuple[int, int, int]:
+    """Nombre de mots énoncés, taille des cartes et taille des cartes et de leur index, sur tous les niveaux"""
+    nb_words = sum(len(words) for words in levels[LEVELS[0]].cog_maps.values())
+    seen: set[int] = set()
+    maps_size = sum(deep_size(a_map._CogMaps__cog_maps, seen) for a_map in levels.values())
+    index_size = sum(deep_size(a_map.index, seen) for a_map in levels.values())
+    return nb_words, maps_size, maps_size + index_size
+
+
+def before(filename, thesaurus) -> dict:
+    """Stockage dict, un niveau après l'autre par apply"""
+    levels = {LEVELS[0]: CogMaps(filename)}
+    for previous, level in zip(LEVELS, LEVELS[1:]):
+        levels[previous].thesaurus = thesaurus[level]
+        levels[level], _ = levels[previous].apply(with_unknown=False)
+    return levels
+
+
+def after(filename, thesaurus) -> dict:
+    """Stockage en colonnes, tous les niveaux en une passe par apply_many"""
+    levels, _ = CogMaps(filename, columnar=True).apply_many(thesaurus, with_unknown=False)
+    return levels
+
+
+if __name__ == "__main__":
+    the_thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
+    print(f"{'fichier':<30} {'stockage':<10} {'mots':>8} {'o/mot cartes':>14} {'o/mot +index':>14} {'temps (ms)':>12}")
+    for a_filename in (CM_LA_MINE_FILENAME, CM_FUTUR_FILENAME):
+        for name, build in (("dict", before), ("colonnes", after)):
+            start = time.perf_counter_ns()
+            the_levels = build(a_filename, the_thesaurus)
+            for a_level in the_levels.values():
+                a_level.index  # pylint: disable=pointless-statement
+            duration = (time.perf_counter_ns() - start) / 10 ** 6
+            words, maps_bytes, all_bytes = measure(the_levels)
+            print(
+                f"{a_filename.name:<30} {name:<10} {words:>8} {maps_bytes / words:>14.1f} {all_bytes / words:>14.1f} {duration:>12.1f}"
+            )
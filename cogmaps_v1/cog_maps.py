@@ -6,15 +6,23 @@ __author__ = "Romuald Thion"
 # %%
 import locale
 import csv
+import json
 import logging
+import sys
 import time
 from math import exp
-from typing import Union, Tuple, Iterator, Optional, Iterable
-from collections import Counter, defaultdict
-from itertools import product, zip_longest
+from typing import Union, Tuple, Iterator, Optional, Iterable, Hashable, Callable, Mapping, Sequence
+from collections import Counter, defaultdict, OrderedDict
+from itertools import product, zip_longest, islice
 from functools import partial, singledispatchmethod
+from concurrent.futures import ProcessPoolExecutor
 from pprint import pprint  # pylint: disable=unused-import
 from pathlib import Path
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import eigsh
 
 # import pandas as pd
 
@@ -35,13 +43,19 @@ Level = str
 CogMapsType = dict[Ident, list[Word]]
 WeightsType = dict[Position, float]
 WeightsMapType = dict[str, WeightsType]
-ThesaurusType = dict[Word, Word]
+ThesaurusType = Mapping[Word, Word]
 ThesaurusMapType = dict[Level, ThesaurusType]
 IndexType = dict[Word, list[Tuple[Ident, Position]]]
 OccurrencesType = dict[Word, float]
 OccurrencesInPositionsType = dict[Position, Counter[Word]]
 MatrixType = dict[Word, dict[Word, float]]
 PartitionType = list[Ident]
+# des segments de cartes : à une étiquette, les identifiants des cartes du segment
+SegmentsType = Mapping[Hashable, Iterable[Ident]]
+VocabularyType = list[Word]
+# cartes encodées : une ligne par carte, une colonne par position, PADDING en fin de ligne
+CodesType = np.ndarray
+SparseMatrixType = sparse.csr_matrix
 
 
 INPUT_DIR = Path("./input")
@@ -57,6 +71,8 @@ CM_FUTUR_FILENAME = INPUT_DIR / "cartes_cog_mine_futur.csv"
 THESAURUS_FILENAME = INPUT_DIR / "thesaurus.csv"
 WEIGHTS_MAP_FILENAME = INPUT_DIR / "coefficients.csv"
 OUTPUT_DIR = Path("output")
+# cache disque des entrées analysées, voir cog_maps_cache
+CACHE_DIR = Path("cache")
 
 # pour les I/O
 CSV_PARAMS = {"delimiter": ";", "quotechar": '"'}
@@ -76,24 +92,892 @@ CONCEPT_LVL: Level = "concept"
 MOTHER_LVL: Level = "mother"
 GD_MOTHER_LVL: Level = "gd_mother"
 LEVELS = [BASE_LVL, CONCEPT_LVL, MOTHER_LVL, GD_MOTHER_LVL]
+# la racine de l'arbre du thésaurus, au-dessus du dernier niveau
+THESAURUS_ROOT: Word = "racine"
+
+# formats d'export de la matrice de co-occurrences
+TRIPLETS_FORMAT = "triplets"
+NPZ_FORMAT = "npz"
+DENSE_FORMAT = "dense"
+MATRIX_FORMATS = [TRIPLETS_FORMAT, NPZ_FORMAT, DENSE_FORMAT]
+# la matrice complète comme auparavant, les formats creux sont à demander (--matrix-format de la CLI)
+DEFAULT_MATRIX_FORMAT = DENSE_FORMAT
+
+# identifiant de bourrage des cartes encodées
+PADDING: int = -1
+# en dessous, une case de la matrice mise à jour par différence est considérée nulle
+ROUNDING_TOLERANCE: float = 1e-9
+
+# nombre de cartes par morceau lu par le chargement en flux
+DEFAULT_CHUNK_SIZE: int = 10_000
+
+# budget mémoire par défaut du cache des résultats par pondération/partition (en octets)
+DEFAULT_CACHE_BUDGET: int = 256 * 2 ** 20
+
+
+def encode_cog_maps(
+    cog_maps: CogMapsType, vocabulary: Optional[VocabularyType] = None
+) -> Tuple[VocabularyType, CodesType]:
+    """Encode les cartes en entiers : le vocabulaire (ordre de première apparition si non fourni) et
+    le tableau (cartes x positions) des identifiants de mots, complété par PADDING"""
+    vocabulary = {word: i for i, word in enumerate(vocabulary or [])}
+    max_len = max((len(words) for words in cog_maps.values()), default=0)
+    codes = np.full((len(cog_maps), max_len), PADDING, dtype=np.int32)
+    for row, words in enumerate(cog_maps.values()):
+        codes[row, : len(words)] = [vocabulary.setdefault(word, len(vocabulary)) for word in words]
+    return list(vocabulary), codes
+
+
+def pad_codes(codes: CodesType, width: int) -> CodesType:
+    """Complète les cartes encodées par PADDING jusqu'à la largeur width"""
+    return np.pad(codes, ((0, 0), (0, width - codes.shape[1])), constant_values=PADDING)
+
+
+def offsets_to_codes(offsets: np.ndarray, word_ids: np.ndarray) -> CodesType:
+    """Cartes encodées (cartes x positions) depuis la forme à plat : les identifiants de mots de toutes les cartes
+    mis bout à bout dans word_ids, ceux de la carte i étant word_ids[offsets[i]:offsets[i+1]]"""
+    lengths = np.diff(offsets)
+    codes = np.full((len(lengths), int(lengths.max(initial=0))), PADDING, dtype=np.int32)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    codes[rows, np.arange(len(word_ids)) - np.repeat(offsets[:-1], lengths)] = word_ids
+    return codes
+
+
+def compact_codes(codes: CodesType, keep: np.ndarray) -> CodesType:
+    """Retire de chaque carte encodée les mots hors du masque keep, en conservant leur ordre, et ramène la largeur
+    à celle de la plus longue carte restante"""
+    keep = keep & (codes != PADDING)
+    # tri stable : les mots conservés en tête de ligne, dans leur ordre
+    order = np.argsort(~keep, axis=1, kind="stable")
+    compacted = np.where(np.take_along_axis(keep, order, axis=1), np.take_along_axis(codes, order, axis=1), PADDING)
+    return compacted[:, : int(keep.sum(axis=1).max(initial=0))].astype(np.int32)
+
+
+def resize_array(array: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+    """Agrandit un tableau à la forme shape en complétant par des zéros"""
+    return np.pad(array, [(0, new - old) for old, new in zip(array.shape, shape)])
+
+
+def weights_kernel(weights: WeightsType, max_len: int) -> np.ndarray:
+    """Noyau des poids par distance entre deux mots d'une même carte : 1.0 à distance nulle, weights[d] sinon"""
+    kernel = np.array([weights.get(distance, 0.0) for distance in range(max_len)], dtype=np.float64)
+    if max_len:
+        kernel[0] = 1.0
+    return kernel
+
+
+def weights_matrix(weights_map: WeightsMapType, max_len: int) -> np.ndarray:
+    """Matrice (positions x pondérations) des poids : la colonne j donne les poids des positions 1 à max_len
+    pour la j-ème pondération de weights_map"""
+    return np.array(
+        [[weights.get(position, 0.0) for weights in weights_map.values()] for position in range(1, max_len + 1)],
+        dtype=np.float64,
+    ).reshape(max_len, len(weights_map))
+
+
+def count_positions(codes: CodesType, nb_words: int) -> np.ndarray:
+    """Matrice (mots x positions) du nombre d'occurrences de chaque mot à chaque position (la colonne 0 est la position 1)"""
+    max_len = codes.shape[1]
+    _, columns = np.nonzero(codes != PADDING)
+    flat = codes[codes != PADDING].astype(np.int64) * max_len + columns
+    return np.bincount(flat, minlength=nb_words * max_len).reshape(nb_words, max_len)
+
+
+def map_positions_counts(codes: CodesType, nb_words: int) -> SparseMatrixType:
+    """Contribution de chaque carte au comptage par position : matrice creuse (cartes x (mots x positions)),
+    telle que la somme de ses lignes, remise en forme (mots, positions), donne count_positions"""
+    max_len = codes.shape[1]
+    maps, columns = np.nonzero(codes != PADDING)
+    flat = codes[maps, columns].astype(np.int64) * max_len + columns
+    return sparse.csr_matrix(
+        (np.ones(len(flat), dtype=np.int64), (maps, flat)), shape=(codes.shape[0], nb_words * max_len)
+    )
+
+
+def cooccurrences_pairs(codes: CodesType, kernel: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Contribution de chaque carte aux co-occurrences pondérées par kernel : les quadruplets (carte, ligne, colonne, poids)
+
+    Pour chaque distance d, on apparie les colonnes i et i+d de codes en une seule opération.
+    """
+    max_len = codes.shape[1]
+    maps, rows, cols, values = [], [], [], []
+    for distance in range(max_len):
+        if kernel[distance] == 0.0:
+            continue
+        left, right = codes[:, : max_len - distance], codes[:, distance:]
+        valid = (left != PADDING) & (right != PADDING)
+        which, _ = np.nonzero(valid)
+        left, right = left[valid], right[valid]
+        weight = np.full(left.shape, kernel[distance])
+        maps.append(which)
+        rows.append(left)
+        cols.append(right)
+        values.append(weight)
+        # la matrice est symétrique : on ajoute les paires dans l'autre sens
+        if distance:
+            maps.append(which)
+            rows.append(right)
+            cols.append(left)
+            values.append(weight)
+
+    if not rows:
+        return tuple(np.empty(0, dtype=dtype) for dtype in (np.intp, np.int32, np.int32, np.float64))  # type: ignore
+    return np.concatenate(maps), np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+
+
+def pairs_to_matrix(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, nb_words: int) -> SparseMatrixType:
+    """Somme des triplets (ligne, colonne, poids) en une matrice creuse CSR (nb_words x nb_words)"""
+    matrix = sparse.coo_matrix((values, (rows, cols)), shape=(nb_words, nb_words)).tocsr()
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def cooccurrences_matrix(codes: CodesType, kernel: np.ndarray, nb_words: int) -> SparseMatrixType:
+    """Matrice creuse des co-occurrences pondérées par kernel : les triplets de cooccurrences_pairs sommés via COO"""
+    _, rows, cols, values = cooccurrences_pairs(codes, kernel)
+    return pairs_to_matrix(rows, cols, values, nb_words)
+
+
+def scale_sym(matrix: SparseMatrixType, scale: np.ndarray) -> SparseMatrixType:
+    """Multiplie la case (i,j) par scale[i] * scale[j], sur les seules cases non nulles : diag(scale) @ m @ diag(scale)
+    sans produit matriciel"""
+    coo = matrix.tocoo()
+    values = coo.data * scale[coo.row] * scale[coo.col]
+    return sparse.csr_matrix((values, (coo.row, coo.col)), shape=matrix.shape)
+
+
+def normalize_sym(matrix: SparseMatrixType) -> SparseMatrixType:
+    """normalisation symétrique : (i,j) devient (i,j)/sqrt((i,i) * (j,j))"""
+    return scale_sym(matrix, np.power(matrix.diagonal(), -0.5))
+
+
+def threshold_matrix(matrix: SparseMatrixType, threshold: float) -> SparseMatrixType:
+    """Les seules cases d'au moins threshold, les autres sont mises à zéro"""
+    coo = matrix.tocoo()
+    keep = coo.data >= threshold
+    return sparse.csr_matrix((coo.data[keep], (coo.row[keep], coo.col[keep])), shape=matrix.shape)
+
+
+def spectral_vectors(affinity: SparseMatrixType, nb_components: int, random_state=None) -> np.ndarray:
+    """Les nb_components vecteurs propres principaux de D^-1/2 A D^-1/2, D les degrés de l'affinité A symétrisée,
+    par valeur propre décroissante"""
+    affinity = (affinity + affinity.T) / 2
+    degrees = np.asarray(affinity.sum(axis=1)).ravel()
+    scale = np.zeros_like(degrees)
+    np.power(degrees, -0.5, out=scale, where=degrees > 0)
+    normalized = scale_sym(affinity, scale)
+    nb_rows = normalized.shape[0]
+    if nb_components < nb_rows - 1:
+        start = np.random.default_rng(random_state).uniform(-1, 1, nb_rows)
+        _, vectors = eigsh(normalized, k=nb_components, which="LA", v0=start)
+    else:
+        # trop peu de lignes pour la méthode creuse
+        _, vectors = np.linalg.eigh(normalized.toarray())
+    return vectors[:, ::-1][:, :nb_components]
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Lignes ramenées à la norme 1, les lignes nulles restent nulles"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def spectral_embedding(affinity: SparseMatrixType, nb_components: int, random_state=None) -> np.ndarray:
+    """Plongement spectral (Ng, Jordan, Weiss) : les vecteurs de spectral_vectors, lignes ramenées à la norme 1"""
+    return normalize_rows(spectral_vectors(affinity, nb_components, random_state))
+
+
+def modularity(affinity: SparseMatrixType, labels: np.ndarray) -> float:
+    """Modularité (Newman) de la partition labels du graphe pondéré d'affinité symétrisée, sans les boucles"""
+    affinity = (affinity + affinity.T) / 2
+    affinity = (affinity - sparse.diags(affinity.diagonal())).tocoo()
+    total = affinity.data.sum()
+    if total == 0:
+        return 0.0
+    nb_labels = labels.max() + 1
+    same = labels[affinity.row] == labels[affinity.col]
+    inside = np.bincount(labels[affinity.row[same]], weights=affinity.data[same], minlength=nb_labels)
+    degrees = np.bincount(labels[affinity.row], weights=affinity.data, minlength=nb_labels)
+    return float((inside / total - (degrees / total) ** 2).sum())
+
+
+def timed(stage: str, function: Callable, *args, **kwargs):
+    """Appelle function(*args, **kwargs) en journalisant sa durée en INFO"""
+    start = time.perf_counter_ns()
+    result = function(*args, **kwargs)
+    logger.info("%s, duration %fms", stage, round((time.perf_counter_ns() - start) / 10 ** 6, 2))
+    return result
+
+
+def prepare_affinity(matrix: SparseMatrixType, normalize: bool = False, threshold: float = 0.05) -> SparseMatrixType:
+    """L'affinité à regrouper : normalisation symétrique si normalize, puis seuillage à threshold"""
+    if normalize:
+        matrix = timed("cluster: normalize", normalize_sym, matrix)
+    return timed("cluster: threshold", threshold_matrix, matrix, threshold)
+
+
+def cluster_matrix(
+    matrix: SparseMatrixType,
+    n_clusters: int,
+    *,
+    normalize: bool = False,
+    threshold: float = 0.05,
+    spectral: bool = False,
+    random_state=None,
+) -> np.ndarray:
+    """Le numéro de cluster de chaque ligne d'une matrice de co-occurrences creuse, par k-means (sklearn)
+
+    Etapes : normalisation symétrique si normalize, seuillage à threshold, plongement spectral si spectral, puis
+    k-means sur les lignes creuses ou sur le plongement. La durée de chaque étape est journalisée en INFO.
+    """
+    from sklearn.cluster import KMeans  # pylint: disable=import-outside-toplevel
+
+    matrix = prepare_affinity(matrix, normalize, threshold)
+    if spectral:
+        matrix = timed("cluster: embedding", spectral_embedding, matrix, n_clusters, random_state)
+    clustering = KMeans(n_clusters, random_state=random_state)
+    return timed("cluster: kmeans", clustering.fit_predict, matrix)
+
+
+@dataclass
+class Clustering:
+    """Un k-means : le numéro de cluster de chaque ligne, ses scores et la durée du fit en ms"""
+
+    n_clusters: int
+    labels: np.ndarray
+    silhouette: float
+    modularity: float
+    duration: float
+
+
+ClusteringTaskType = Tuple[Union[np.ndarray, SparseMatrixType], SparseMatrixType, int, Optional[int]]
+
+
+def fit_clustering(task: ClusteringTaskType) -> Clustering:
+    """Tâche de cluster_sweep : k-means à n_clusters des lignes de data et ses scores, silhouette sur data et
+    modularité sur l'affinité"""
+    # pylint: disable=import-outside-toplevel
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    data, affinity, n_clusters, random_state = task
+    start = time.perf_counter_ns()
+    labels = KMeans(n_clusters, random_state=random_state).fit_predict(data)
+    duration = (time.perf_counter_ns() - start) / 10 ** 6
+    nb_labels = len(np.unique(labels))
+    silhouette = silhouette_score(data, labels) if 1 < nb_labels < data.shape[0] else float("nan")
+    return Clustering(n_clusters, labels, float(silhouette), modularity(affinity, labels), duration)
+
+
+def cluster_sweep(
+    matrix: SparseMatrixType,
+    all_n_clusters: Iterable[int],
+    *,
+    normalize: bool = False,
+    threshold: float = 0.05,
+    spectral: bool = False,
+    random_state=None,
+    jobs: int = 1,
+) -> dict[int, Clustering]:
+    """cluster_matrix pour chaque nombre de clusters de all_n_clusters : l'affinité et le plongement spectral (au
+    plus grand nombre de clusters, tronqué ensuite) ne sont calculés qu'une fois, les k-means sont répartis sur jobs
+    processus (0 pour tous les coeurs)"""
+    all_n_clusters = sorted(all_n_clusters)
+    affinity = prepare_affinity(matrix, normalize, threshold)
+    if spectral:
+        vectors = timed("cluster: embedding", spectral_vectors, affinity, all_n_clusters[-1], random_state)
+        tasks = [(normalize_rows(vectors[:, :k]), affinity, k, random_state) for k in all_n_clusters]
+    else:
+        tasks = [(affinity, affinity, k, random_state) for k in all_n_clusters]
+
+    if jobs == 1:
+        results = [fit_clustering(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs or None) as executor:
+            results = list(executor.map(fit_clustering, tasks))
+    for result in results:
+        logger.info(
+            "cluster_sweep: %i clusters, silhouette %f, modularity %f, duration %fms",
+            result.n_clusters,
+            result.silhouette,
+            result.modularity,
+            round(result.duration, 2),
+        )
+    return {result.n_clusters: result for result in results}
+
+
+class PartitionView(Mapping):
+    """Vue en lecture seule des cartes sélectionnées par une partition, sans copie des cartes"""
+
+    def __init__(self, cog_maps: CogMapsType, selected: set[Ident]):
+        self.__cog_maps = cog_maps
+        self.__selected = selected
+
+    def __getitem__(self, identifier: Ident) -> list[Word]:
+        if identifier not in self.__selected:
+            raise KeyError(identifier)
+        return self.__cog_maps[identifier]
+
+    def __iter__(self) -> Iterator[Ident]:
+        return (identifier for identifier in self.__cog_maps if identifier in self.__selected)
+
+    def __len__(self) -> int:
+        return sum(1 for identifier in self.__selected if identifier in self.__cog_maps)
+
+
+class Thesaurus(Mapping):
+    """Thésaurus figé, en lecture seule : à un mot, son image au niveau supérieur.
+
+    Les images sont internées et la table de hachage associe à chaque mot l'indice de son image : une seule
+    recherche par mot. Un mot sans image n'est jamais ajouté à la table, thesaurus[word] renvoie alors unknown
+    (DEFAULT_CONCEPT par défaut) ou lève KeyError si unknown est None. in, len et l'itération ne portent que sur
+    les couples effectivement définis."""
+
+    def __init__(self, mapping: Optional[Mapping[Word, Word]] = None, *, unknown: Optional[Word] = DEFAULT_CONCEPT):
+        images: dict[Word, int] = {}
+        self.__table = {word: images.setdefault(image, len(images)) for word, image in (mapping or {}).items()}
+        self.__images = tuple(images)
+        self.__unknown = unknown
+
+    @property
+    def unknown(self) -> Optional[Word]:
+        """L'image renvoyée pour un mot sans image, None pour lever KeyError"""
+        return self.__unknown
+
+    @property
+    def images(self) -> tuple[Word, ...]:
+        """Les images distinctes, dans l'ordre de première apparition"""
+        return self.__images
+
+    def __getitem__(self, word: Word) -> Word:
+        image = self.__table.get(word)
+        if image is not None:
+            return self.__images[image]
+        if self.__unknown is None:
+            raise KeyError(word)
+        return self.__unknown
+
+    def get(self, word: Word, default=None):
+        image = self.__table.get(word)
+        return default if image is None else self.__images[image]
+
+    def __contains__(self, word) -> bool:
+        return word in self.__table
+
+    def __iter__(self) -> Iterator[Word]:
+        return iter(self.__table)
+
+    def __len__(self) -> int:
+        return len(self.__table)
+
+    def __repr__(self) -> str:
+        return f"<Thesaurus of {len(self)} words to {len(self.__images)} images, unknown={self.__unknown!r}>"
+
+
+def check_new_ids(ids: Iterable[Ident], seen: set[Ident], source: str) -> None:
+    """Vérifie qu'aucun des identifiants de cartes ids n'a déjà été vu (ni n'est répété), puis les ajoute à seen
+
+    Partagé par tous les chargements : une carte en double lève ValueError au lieu d'être écrasée"""
+    ids = list(ids)
+    duplicates = seen.intersection(ids)
+    if len(set(ids)) != len(ids):
+        duplicates.update(ident for ident, count in Counter(ids).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"{source} maps {sorted(duplicates)} already exist")
+    seen.update(ids)
+
+
+@dataclass
+class EncodedChunk:
+    """Un morceau de cartes lues en flux, à plat : les mots de la carte ids[i] sont les identifiants
+    word_ids[offsets[i]:offsets[i+1]] du vocabulaire partagé"""
+
+    ids: np.ndarray
+    offsets: np.ndarray
+    word_ids: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def codes(self) -> CodesType:
+        """Les cartes du morceau encodées, complétées par PADDING"""
+        return offsets_to_codes(self.offsets, self.word_ids)
+
+
+class ColumnarMaps(Mapping):
+    """Cartes en lecture seule stockées en colonnes, façon CSR, sur un vocabulaire interné :
+    les mots de la carte ids[i] sont word_ids[offsets[i]:offsets[i+1]], aux positions correspondantes de positions
+    (à partir de 1). Les listes de mots sont décodées à la demande."""
+
+    def __init__(self, ids: np.ndarray, offsets: np.ndarray, word_ids: np.ndarray, vocabulary: VocabularyType):
+        self.ids = ids
+        self.offsets = offsets
+        self.word_ids = word_ids
+        self.vocabulary = vocabulary
+        lengths = np.diff(offsets)
+        self.positions = (np.arange(len(word_ids)) - np.repeat(offsets[:-1], lengths) + 1).astype(np.int32)
+        # à un identifiant, sa ligne : construit à la première lecture
+        self.__rows: Optional[dict[Ident, int]] = None
+
+    @staticmethod
+    def from_codes(ids: np.ndarray, codes: CodesType, vocabulary: VocabularyType) -> "ColumnarMaps":
+        """Depuis des cartes encodées (cartes x positions) complétées par PADDING"""
+        present = codes != PADDING
+        offsets = np.concatenate([[0], np.cumsum(present.sum(axis=1))]).astype(np.int64)
+        return ColumnarMaps(ids, offsets, codes[present].astype(np.int32), vocabulary)
+
+    @staticmethod
+    def from_chunks(chunks: Sequence[EncodedChunk], vocabulary: VocabularyType) -> "ColumnarMaps":
+        """Depuis les morceaux de CogMaps.load_cog_maps_chunks, mis bout à bout"""
+        check_new_ids((ident for chunk in chunks for ident in chunk.ids.tolist()), set(), "ColumnarMaps.from_chunks")
+        if not chunks:
+            empty = np.empty(0, dtype=np.int64)
+            return ColumnarMaps(empty, np.zeros(1, dtype=np.int64), empty.astype(np.int32), vocabulary)
+        starts = np.cumsum([0] + [len(chunk.word_ids) for chunk in chunks[:-1]])
+        offsets = [chunk.offsets[:-1] + start for chunk, start in zip(chunks, starts)]
+        offsets.append([starts[-1] + chunks[-1].offsets[-1]])
+        return ColumnarMaps(
+            np.concatenate([chunk.ids for chunk in chunks]),
+            np.concatenate(offsets).astype(np.int64),
+            np.concatenate([chunk.word_ids for chunk in chunks]),
+            vocabulary,
+        )
+
+    @property
+    def codes(self) -> CodesType:
+        """Les cartes encodées (cartes x positions), complétées par PADDING"""
+        return offsets_to_codes(self.offsets, self.word_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """La taille en octets des tableaux, hors vocabulaire"""
+        return self.ids.nbytes + self.offsets.nbytes + self.word_ids.nbytes + self.positions.nbytes
+
+    def __getitem__(self, identifier: Ident) -> list[Word]:
+        if self.__rows is None:
+            self.__rows = {ident: row for row, ident in enumerate(self.ids.tolist())}
+        row = self.__rows[identifier]
+        return [self.vocabulary[i] for i in self.word_ids[self.offsets[row] : self.offsets[row + 1]].tolist()]
+
+    def __iter__(self) -> Iterator[Ident]:
+        return iter(self.ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class ColumnarIndex(Mapping):
+    """Vue index inverse de ColumnarMaps : à un mot, les couples (id, pos) des cartes où il apparait.
+
+    Les mots sont dans l'ordre de première apparition, leurs couples dans l'ordre des cartes puis des positions,
+    comme CogMaps.index. Les listes sont construites à la demande depuis un tri des word_ids."""
+
+    def __init__(self, maps: ColumnarMaps):
+        self.__maps = maps
+        nb_entries, nb_words = len(maps.word_ids), len(maps.vocabulary)
+        self.__order = np.argsort(maps.word_ids, kind="stable")
+        counts = np.bincount(maps.word_ids, minlength=nb_words)
+        self.__starts = np.concatenate([[0], np.cumsum(counts)])
+        first = np.full(nb_words, nb_entries)
+        np.minimum.at(first, maps.word_ids, np.arange(nb_entries))
+        present = np.nonzero(counts)[0]
+        present = present[np.argsort(first[present], kind="stable")]
+        self.__words = {maps.vocabulary[i]: i for i in present.tolist()}
+        # la ligne de chaque mot énoncé
+        self.__rows = np.repeat(np.arange(len(maps.ids)), np.diff(maps.offsets))
+
+    def __getitem__(self, word: Word) -> list[Tuple[Ident, Position]]:
+        i = self.__words[word]
+        entries = self.__order[self.__starts[i] : self.__starts[i + 1]]
+        return list(zip(self.__maps.ids[self.__rows[entries]].tolist(), self.__maps.positions[entries].tolist()))
+
+    def __iter__(self) -> Iterator[Word]:
+        return iter(self.__words)
+
+    def __len__(self) -> int:
+        return len(self.__words)
+
+    def __contains__(self, word) -> bool:
+        return word in self.__words
+
+
+def sparse_to_nested(matrix: SparseMatrixType, vocabulary: VocabularyType) -> MatrixType:
+    """Adaptateur de la matrice creuse vers le dictionnaire de dictionnaires historique"""
+    nested: MatrixType = defaultdict(lambda: defaultdict(float))  # type: ignore
+    for row, word in enumerate(vocabulary):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start < end:
+            columns = [vocabulary[col] for col in matrix.indices[start:end]]
+            nested[word] = defaultdict(float, zip(columns, matrix.data[start:end].tolist()))
+    return nested
+
+
+@dataclass
+class CacheStats:
+    """Compteurs d'un attribut dynamique : lectures servies par le cache, calculs, recalculs et invalidations"""
+
+    hits: int = 0
+    misses: int = 0
+    recomputes: int = 0
+    invalidations: int = 0
+
+
+class derived:  # pylint: disable=invalid-name
+    """Décorateur d'attribut dynamique paresseux : calculé à la première lecture, puis servi par le cache
+    de l'instance jusqu'à ce que l'une de ses entrées (attribut de base ou autre attribut dynamique) change.
+
+    Utilisé comme @derived("cog_maps", "weights") sur la méthode de calcul.
+    """
+
+    def __init__(self, *inputs: str):
+        self.inputs = inputs
+        self.name = ""
+        self.compute = None
+
+    def __call__(self, compute):
+        self.compute = compute
+        self.__doc__ = compute.__doc__
+        return self
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj._cache.get(self.name, lambda: self.compute(obj))  # pylint: disable=protected-access
+
+    def __set__(self, obj, value):
+        raise TypeError(f"{type(obj).__name__}.{self.name} does not support direct assignment")
+
+
+def estimate_size(value, sample: int = 32) -> int:
+    """Estimation (grossière) de l'empreinte mémoire en octets d'un résultat calculé
+
+    Pour les conteneurs python, on extrapole la taille des sample premiers éléments à tout le conteneur.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if sparse.issparse(value):
+        return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict) and value:
+        items = list(islice(value.items(), sample))
+        size += len(value) * sum(sys.getsizeof(key) + estimate_size(val, sample) for key, val in items) // len(items)
+    elif isinstance(value, (list, tuple)) and value:
+        items = value[:sample]
+        size += len(value) * sum(estimate_size(val, sample) for val in items) // len(items)
+    return size
+
+
+@dataclass
+class ResultCacheStats:
+    """Compteurs du cache LRU des résultats"""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    nbytes: int = 0
+
+
+class ResultCache:
+    """Cache LRU borné en mémoire des résultats, les moins récemment utilisés sont évincés au-delà de max_bytes"""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BUDGET):
+        self.__max_bytes = max_bytes
+        self.stats = ResultCacheStats()
+        self.__entries: OrderedDict[Hashable, Tuple[object, int]] = OrderedDict()
+
+    @property
+    def max_bytes(self) -> int:
+        """Le budget mémoire en octets"""
+        return self.__max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int) -> None:
+        self.__max_bytes = value
+        self.__shrink()
+
+    def __shrink(self) -> None:
+        """Evince les valeurs les plus anciennes tant que le budget est dépassé"""
+        while self.stats.nbytes > self.__max_bytes:
+            evicted, (_, evicted_size) = self.__entries.popitem(last=False)
+            self.stats.nbytes -= evicted_size
+            self.stats.evictions += 1
+            logger.debug(f"ResultCache: evicted {evicted}")
+        self.stats.entries = len(self.__entries)
+
+    def get(self, key: Hashable, default=None):
+        """Renvoie la valeur associée à key et la marque comme la plus récente"""
+        if key not in self.__entries:
+            self.stats.misses += 1
+            return default
+        self.stats.hits += 1
+        self.__entries.move_to_end(key)
+        return self.__entries[key][0]
+
+    def put(self, key: Hashable, value) -> None:
+        """Ajoute une valeur et évince les plus anciennes tant que le budget est dépassé"""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logger.debug(f"ResultCache.put: {key} of {size} bytes exceeds budget {self.max_bytes}")
+            return
+        self.discard(key)
+        self.__entries[key] = (value, size)
+        self.stats.nbytes += size
+        self.__shrink()
+
+    def discard(self, key: Hashable) -> None:
+        """Retire une valeur si elle est présente"""
+        if key in self.__entries:
+            _, size = self.__entries.pop(key)
+            self.stats.nbytes -= size
+            self.stats.entries = len(self.__entries)
+
+    def clear(self) -> None:
+        """Vide le cache"""
+        self.__entries.clear()
+        self.stats.nbytes = self.stats.entries = 0
+
+
+class DerivedCache:
+    """Cache des attributs dynamiques d'une instance, avec le graphe de dépendances déclaré par derived
+
+    Les valeurs calculées sont aussi conservées dans un ResultCache, indexées par l'empreinte (fingerprint)
+    des attributs de base dont elles dépendent : revenir à des poids ou une partition déjà vus ne recalcule rien.
+    """
+
+    def __init__(self, owner: type, fingerprint: Callable[[str], Hashable], max_bytes: int = DEFAULT_CACHE_BUDGET):
+        inputs = {name: attr.inputs for name, attr in vars(owner).items() if isinstance(attr, derived)}
+        # pour chaque entrée, les attributs qui en dépendent (transitivement)
+        self.dependents: dict[str, set[str]] = defaultdict(set)
+        # pour chaque attribut, les attributs de base dont il dépend (transitivement)
+        self.roots: dict[str, list[str]] = {}
+        for name in inputs:
+            todo, roots = list(inputs[name]), set()
+            while todo:
+                source = todo.pop()
+                if source not in inputs:
+                    roots.add(source)
+                if name not in self.dependents[source]:
+                    self.dependents[source].add(name)
+                    todo.extend(inputs.get(source, ()))
+            self.roots[name] = sorted(roots)
+        self.fingerprint = fingerprint
+        self.values: dict = {}
+        self.computed: set[str] = set()
+        self.stats: dict[str, CacheStats] = {name: CacheStats() for name in inputs}
+        self.results = ResultCache(max_bytes)
+
+    def get(self, name: str, compute):
+        """Renvoie la valeur en cache de name, ou la calcule via compute()"""
+        stats = self.stats[name]
+        if name in self.values:
+            stats.hits += 1
+            return self.values[name]
+        stats.misses += 1
+        key = (name, *(self.fingerprint(root) for root in self.roots[name]))
+        value = self.results.get(key)
+        if value is None:
+            if name in self.computed:
+                stats.recomputes += 1
+            value = compute()
+            self.computed.add(name)
+            self.results.put(key, value)
+        self.values[name] = value
+        return value
+
+    def seed(self, name: str, value) -> None:
+        """Place dans le cache une valeur de name déjà connue, qui n'aura pas à être calculée"""
+        self.values[name] = value
+        self.results.put((name, *(self.fingerprint(root) for root in self.roots[name])), value)
+
+    def invalidate(self, *inputs: str) -> None:
+        """Retire du cache les attributs qui dépendent de l'une des entrées"""
+        for name in set().union(*(self.dependents[source] for source in inputs)):
+            if self.values.pop(name, None) is not None:
+                self.stats[name].invalidations += 1
+                logger.debug(f"DerivedCache.invalidate: {name}")
+
+    def discard(self, *names: str, cascade: bool = True) -> None:
+        """Retire du cache les attributs donnés et, si cascade, ceux qui en dépendent"""
+        for name in names:
+            if self.values.pop(name, None) is not None:
+                self.stats[name].invalidations += 1
+        if cascade:
+            self.invalidate(*names)
+
+    def rekey(self) -> None:
+        """Après une mise à jour en place des valeurs, réindexe les résultats conservés sur les empreintes courantes"""
+        self.results.clear()
+        for name, value in self.values.items():
+            self.results.put((name, *(self.fingerprint(root) for root in self.roots[name])), value)
+
+
+@dataclass
+class SegmentsAggregates:
+    """Agrégats calculés pour plusieurs segments de cartes à la fois, empilés selon l'axe 0 dans l'ordre de labels.
+    Les mots suivent vocabulary, les positions commencent à 1 en colonne 0."""
+
+    labels: list[Hashable]
+    vocabulary: VocabularyType
+    # nombre de cartes de chaque segment
+    sizes: np.ndarray
+    # (segments x mots x positions) : nombre d'occurrences de chaque mot à chaque position
+    positions: np.ndarray
+    # (segments x mots) : occurrences pondérées par weights
+    occurrences: np.ndarray
+    # (segments x mots x mots) : matrices de co-occurrences pondérées par weights, si demandées
+    matrices: Optional[np.ndarray] = None
+
+
+@dataclass
+class CompiledThesaurus:
+    """Thésaurus à plusieurs niveaux compilé sur un vocabulaire de mots énoncés (le niveau BASE_LVL).
+
+    Pour chaque niveau, lookups[level] donne l'identifiant de l'image au niveau de chaque identifiant
+    du niveau précédent, et unknowns[level] si cette image est DEFAULT_CONCEPT."""
+
+    vocabularies: dict[Level, VocabularyType]
+    lookups: dict[Level, np.ndarray]
+    unknowns: dict[Level, np.ndarray]
+
+    @property
+    def table(self) -> np.ndarray:
+        """Table (niveaux x mots énoncés) : l'identifiant à chaque niveau de chaque mot énoncé, par composition"""
+        table = [np.arange(len(self.vocabularies[LEVELS[0]]), dtype=np.int32)]
+        for level in LEVELS[1:]:
+            table.append(self.lookups[level][table[-1]])
+        return np.stack(table)
+
+    def project(self, codes: CodesType) -> np.ndarray:
+        """Projette en une seule indirection des cartes encodées au niveau de base vers tous les niveaux :
+        le tableau (niveaux x cartes x positions), PADDING conservé"""
+        return np.where(codes == PADDING, PADDING, self.table[:, codes])
+
+
+def compile_thesaurus(thesaurus_map: ThesaurusMapType, vocabulary: VocabularyType) -> CompiledThesaurus:
+    """Compile les niveaux du thésaurus en tableaux d'indirection entre identifiants entiers, en partant de vocabulary.
+
+    Le vocabulaire d'un niveau est celui des images du niveau précédent, dans leur ordre de première apparition."""
+    logger.debug(f"compile_thesaurus({len(thesaurus_map)} levels, {len(vocabulary)} words)")
+    vocabularies, lookups, unknowns = {LEVELS[0]: vocabulary}, {}, {}
+    previous = vocabulary
+    for level in LEVELS[1:]:
+        images = [thesaurus_map[level].get(word, DEFAULT_CONCEPT) for word in previous]
+        ids = {word: i for i, word in enumerate(dict.fromkeys(images))}
+        vocabularies[level] = list(ids)
+        lookups[level] = np.array([ids[image] for image in images], dtype=np.int32)
+        unknowns[level] = np.array([image == DEFAULT_CONCEPT for image in images], dtype=bool)
+        previous = vocabularies[level]
+    return CompiledThesaurus(vocabularies, lookups, unknowns)
+
+
+TreeNodeType = Tuple[Level, Word]
+
+
+class ThesaurusTree:
+    """Arbre du thésaurus, construit une fois : la racine (root, root) à la profondeur 0, puis les mots du niveau
+    le plus général (GD_MOTHER_LVL) à la profondeur 1, jusqu'aux mots énoncés (BASE_LVL) à la profondeur len(LEVELS).
+
+    Les noeuds sont numérotés par profondeur, puis par parent, puis par mot : les identifiants ne dépendent que du
+    thésaurus, un parent précède ses fils et les fils d'un noeud sont contigus, de offsets[node] à offsets[node + 1].
+    Un mot dont l'image n'est pas un noeud du niveau supérieur est ignoré."""
+
+    def __init__(self, thesaurus_map: ThesaurusMapType, root: Word = THESAURUS_ROOT):
+        logger.debug(f"ThesaurusTree({len(thesaurus_map)} levels)")
+        # le niveau de chaque profondeur
+        self.levels: list[Level] = [root, *LEVELS[::-1]]
+        self.nodes: list[TreeNodeType] = [(root, root)]
+        self.ids: dict[TreeNodeType, int] = {(root, root): 0}
+        parents, depths = [PADDING], [0]
+        for depth, (level, upper) in enumerate(zip(self.levels[1:], self.levels), 1):
+            if depth == 1:
+                pairs = {(0, image) for image in thesaurus_map[level].values()}
+            else:
+                pairs = {(self.ids.get((upper, image), PADDING), word) for word, image in thesaurus_map[upper].items()}
+            for parent, word in sorted(pairs):
+                if parent == PADDING:
+                    logger.warning(f"ThesaurusTree: {word} at {level} has no parent at {upper}")
+                    continue
+                self.ids[(level, word)] = len(self.nodes)
+                self.nodes.append((level, word))
+                parents.append(parent)
+                depths.append(depth)
+        self.parents = np.array(parents, dtype=np.int32)
+        self.depths = np.array(depths, dtype=np.int32)
+        # les fils étant contigus et rangés par parent, les décalages se déduisent du nombre de fils
+        self.offsets = np.concatenate([[1], 1 + np.cumsum(np.bincount(self.parents[1:], minlength=len(self)))])
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def parent(self, node: int) -> Optional[int]:
+        """Le parent de node, None pour la racine"""
+        parent = int(self.parents[node])
+        return None if parent == PADDING else parent
+
+    def children(self, node: int) -> range:
+        """Les fils de node"""
+        return range(self.offsets[node], self.offsets[node + 1])
+
+    def depth_range(self, depth: int) -> range:
+        """Les noeuds de profondeur depth"""
+        return range(*np.searchsorted(self.depths, [depth, depth + 1]).tolist())
+
+    def node_weights(self, all_occurrences: Mapping[Level, Mapping[Word, float]]) -> np.ndarray:
+        """Le poids de chaque noeud, lu dans les occurrences de son niveau, NaN si le mot n'y apparait pas"""
+        no_occurrences: Mapping[Word, float] = {}
+        return np.array(
+            [all_occurrences.get(level, no_occurrences).get(word, np.nan) for (level, word) in self.nodes], dtype=float
+        )
+
+    def aggregate(self, weights: np.ndarray) -> np.ndarray:
+        """Agrège les poids de bas en haut, en une passe des plus profonds vers la racine : chaque noeud reçoit son
+        poids plus celui de tous ses descendants"""
+        totals = np.array(weights, dtype=float)
+        for depth in range(int(self.depths[-1]), 0, -1):
+            nodes = self.depth_range(depth)
+            np.add.at(totals, self.parents[nodes.start : nodes.stop], totals[nodes.start : nodes.stop])
+        return totals
+
+    def children_sums(self, weights: np.ndarray) -> np.ndarray:
+        """La somme des poids des fils de chaque noeud, 0.0 pour une feuille"""
+        return np.bincount(self.parents[1:], weights=weights[1:], minlength=len(self))
 
 
 class CogMaps:  # pylint: disable=too-many-instance-attributes
     """Conteneur pour un ensemble de cartes cognitives.
 
-    La classe a 4 attributs dynamiques paresseus, qui sont calculés quand nécessaire et
+    La classe a des attributs dynamiques paresseus (déclarés par @derived), qui sont calculés quand nécessaire et
     renvoyés directement lors des appels subséquents :
 
-    - self.__index : reflété par index
-    - self.__occurrences_in_positions : reflété par occurrences_in_positions
-    - self.__occurrences : reflété par occurrences
-    - self.__matrix : reflété par matrix
+    - index : l'index inverse des mots (une vue ColumnarIndex si les cartes sont stockées en colonnes)
+    - occurrences_in_position : le nombre d'occurrences de chaque mot à chaque position
+    - occurrences : les occurrences pondérées
+    - vocabulary et codes : les cartes encodées en entiers
+    - all_ids, all_codes, mask : toutes les cartes encodées, et le masque de celles sélectionnées par partition
+    - map_counts et map_pairs : la contribution de chaque carte, calculée une fois pour toutes les partitions
+    - positions_counts : nombre de chaque mot à chaque position, en matrice
+    - sparse_matrix : la matrice creuse scipy des co-occurrences
+    - matrix : vue dict de dict de sparse_matrix
 
-    Ces attributs dynamiques sont remis à zéro (via invalidate) quand on modifie l'un des attributs suivants :
+    Chacun déclare ses entrées. Quand on modifie l'un des attributs de base suivants, seuls les attributs
+    dynamiques qui en dépendent sont remis à zéro (via invalidate) :
 
     - self.cog_maps : les cartes cognitives
     - self.weights : le système de poids en cours
     - self.partition : le sous-ensemble des cartes actuellement sélectionnés
+
+    Une partition est une vue : cog_maps ne recopie pas les cartes, et les agrégats (positions_counts,
+    occurrences, sparse_matrix) sont des sommes masquées des contributions de chaque carte.
+
+    Avec columnar=True, et pour les niveaux produits par apply_many, les cartes sont stockées en colonnes
+    (ColumnarMaps : ids, offsets, word_ids, positions) : cog_maps, index et words en sont des vues.
+
+    Les compteurs de lectures et de calculs de chaque attribut dynamique sont dans cache_stats.
     """
 
     # listes des mots considérés comme vides et exlcus de la carte
@@ -109,23 +993,50 @@ class CogMaps:  # pylint: disable=too-many-instance-attributes
         """Charge les cartes brutes depuis le fichier CSV"""
         logger.debug(f"CogMaps.load_cog_maps({filename})")
 
-        cog_maps = {}
+        cog_maps: CogMapsType = {}
+        seen: set[Ident] = set()
         with open(filename, encoding=ENCODING) as csvfile:
             reader = csv.reader(csvfile, **CSV_PARAMS)
             for row in reader:
                 # indice 0 : l'id de la carte
                 # indices 1 et suivants : les mots de la carte
                 identifier = int(row[0])
+                check_new_ids([identifier], seen, "CogMaps.load_cog_maps")
                 # on élimine les mots vides et NULL et on filtre les cartes qui ne respectent pas le prédicat
-                cog_maps[identifier] = [
-                    CogMaps.clean_word(w) for w in row[1:] if CogMaps.clean_word(w) not in CogMaps.EMPTY_WORDS
-                ]
+                words = map(CogMaps.clean_word, row[1:])
+                cog_maps[identifier] = [w for w in words if w not in CogMaps.EMPTY_WORDS]
 
         logger.info(
             f"CogMaps.load_cog_maps: {len(cog_maps)} maps with {sum(len(l) for l in cog_maps.values())} words in total"
         )
         return cog_maps
 
+    @staticmethod
+    def load_cog_maps_chunks(
+        filename: StringOrPath, vocabulary: Optional[dict[Word, int]] = None, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[EncodedChunk]:
+        """Charge en flux les cartes du fichier CSV, par morceaux de chunk_size cartes encodées en int32.
+
+        Chaque mot est interné une seule fois dans vocabulary (mot -> identifiant), complété au fil de la lecture
+        et partagé entre les morceaux : seuls le vocabulaire et les tableaux d'entiers restent en mémoire."""
+        logger.debug(f"CogMaps.load_cog_maps_chunks({filename}, {chunk_size})")
+        vocabulary = {} if vocabulary is None else vocabulary
+        with open(filename, encoding=ENCODING) as csvfile:
+            reader = csv.reader(csvfile, **CSV_PARAMS)
+            while True:
+                ids, offsets, word_ids = [], [0], []
+                for row in islice(reader, chunk_size):
+                    ids.append(int(row[0]))
+                    for word in map(CogMaps.clean_word, row[1:]):
+                        if word not in CogMaps.EMPTY_WORDS:
+                            word_ids.append(vocabulary.setdefault(word, len(vocabulary)))
+                    offsets.append(len(word_ids))
+                if not ids:
+                    return
+                yield EncodedChunk(
+                    np.array(ids, dtype=np.int64), np.array(offsets, dtype=np.int64), np.array(word_ids, dtype=np.int32)
+                )
+
     @staticmethod
     def load_weights(filename: StringOrPath) -> WeightsMapType:
         """Charge les poids depuis le fichier CSV"""
@@ -157,11 +1068,11 @@ class CogMaps:  # pylint: disable=too-many-instance-attributes
         Assure l'application de CogMaps.clean_word
         """
         logger.debug(f"CogMaps.load_thesaurus({filename})")
-        # defaultdict(lambda: DEFAULT_CONCEPT)
-        thesaurus_map: ThesaurusMapType = {
-            CONCEPT_LVL: defaultdict(lambda: DEFAULT_CONCEPT),  # word -> concept
-            MOTHER_LVL: defaultdict(lambda: DEFAULT_CONCEPT),  # concept -> mother
-            GD_MOTHER_LVL: defaultdict(lambda: DEFAULT_CONCEPT),  # mother -> grand_mother
+        # les tables en cours de construction, figées en Thesaurus à la fin
+        thesaurus_map: dict[Level, dict[Word, Word]] = {
+            CONCEPT_LVL: {},  # word -> concept
+            MOTHER_LVL: {},  # concept -> mother
+            GD_MOTHER_LVL: {},  # mother -> grand_mother
         }
 
         def check_and_add(level: Level, src: Word, dst: Word):
@@ -195,43 +1106,121 @@ class CogMaps:  # pylint: disable=too-many-instance-attributes
 
         logger.info(f"CogMaps.load_thesaurus: {len(thesaurus_map)} levels")
         # words to {len(set(thesaurus.values()))} concepts")
-        return thesaurus_map
+        return {level: Thesaurus(thesaurus) for level, thesaurus in thesaurus_map.items()}
 
-    def __init__(self, cog_maps_filename=None):
+    def __init__(self, cog_maps_filename=None, *, cache_budget: int = DEFAULT_CACHE_BUDGET, columnar: bool = False):
         # le fichier duquel lire les cartes cognitives
         self.__cog_maps_filename: Optional[StringOrPath] = cog_maps_filename
-        # les cartes elles-mêmes : à un id, la liste des mots
-        self.__cog_maps: CogMapsType = {}
+        # toutes les cartes elles-mêmes : à un id, la liste des mots, ou leur stockage en colonnes
+        self.__cog_maps: Union[CogMapsType, ColumnarMaps] = {}
         # le thesaurus
-        self.__thesaurus: ThesaurusType = {}
-        # l'index inverse : à un mot, la liste des positions (id_ligne, pos_dans_la ligne) où il apparait
-        self.__index: Optional[IndexType] = None
+        self.__thesaurus: Thesaurus = Thesaurus()
         # les poids des positions par défaut : tout le monde à 1
         self.__weights: WeightsType = DEFAULT_WEIGHTS
-        # le nombre d'occurences, pondérées par weights
-        self.__occurrences: Optional[OccurrencesType] = None
-        # dans chaque positions, le nombre d'occurences de chaque mot
-        self.__occurrences_in_positions: Optional[OccurrencesInPositionsType] = None
-        # la matrice de co-occurrences pondérée par weights
-        self.__matrix: Optional[MatrixType] = None
+        # la version des cartes, incrémentée à chaque affectation de cog_maps
+        self.__version: int = 0
+        # les valeurs des attributs dynamiques, et celles déjà calculées pour d'autres poids/partitions
+        self._cache = DerivedCache(CogMaps, self.fingerprint, cache_budget)
         # pour une carte dérivée, sa carte parente
         self.__parent: Optional[CogMaps] = None
 
-        if cog_maps_filename is not None:
-            self.__cog_maps_full = CogMaps.load_cog_maps(cog_maps_filename)
-            self.__cog_maps = self.__cog_maps_full
-        # la partition courante, actuellement sélectionnée
-        self.__partition = None
+        if cog_maps_filename is not None and columnar:
+            vocabulary: dict[Word, int] = {}
+            chunks = list(CogMaps.load_cog_maps_chunks(cog_maps_filename, vocabulary))
+            self.__cog_maps = ColumnarMaps.from_chunks(chunks, list(vocabulary))
+        elif cog_maps_filename is not None:
+            self.__cog_maps = CogMaps.load_cog_maps(cog_maps_filename)
+        # la partition courante, actuellement sélectionnée, et l'ensemble de ses identifiants
+        self.__partition: Optional[PartitionType] = None
+        self.__selected: Optional[set[Ident]] = None
 
-    def invalidate(self) -> None:
-        """Invalide les attributs privés qui dependent de cog_maps"""
-        self.__index = None
-        self.__occurrences_in_positions = None
-        self.__occurrences = None
-        self.__matrix = None
+    @staticmethod
+    def from_store(
+        store: Union[CogMapsType, ColumnarMaps],
+        filename: Optional[StringOrPath] = None,
+        parent: Optional["CogMaps"] = None,
+    ) -> "CogMaps":
+        """Construit des cartes sur un stockage déjà prêt, dictionnaire ou en colonnes (sans passer alors par des
+        listes de mots : cog_maps et index en sont des vues). Des cartes dérivées de parent en reprennent les poids."""
+        new_cog_maps = CogMaps()
+        # pylint: disable=protected-access
+        new_cog_maps.__cog_maps = store  # type: ignore
+        new_cog_maps.__cog_maps_filename = filename
+        if parent is not None:
+            new_cog_maps.__parent = parent
+            new_cog_maps.__weights = parent.__weights.copy()
+        return new_cog_maps
+
+    @staticmethod
+    def from_chunks(
+        chunks: Iterable[EncodedChunk], vocabulary: dict[Word, int], filename: Optional[StringOrPath] = None
+    ) -> "CogMaps":
+        """Construit des cartes depuis les morceaux de load_cog_maps_chunks, qui partagent vocabulary.
+
+        Le comptage par position et la matrice de co-occurrences (poids par défaut) sont sommés morceau par morceau,
+        et placés dans le cache : seul le morceau courant est décodé en tableau (cartes x positions). Les morceaux
+        sont tous conservés, en colonnes d'entiers, comme stockage des cartes : la mémoire n'est pas bornée par la
+        taille d'un morceau, elle croît avec le fichier, mais sans listes de mots ni tableau complet."""
+        logger.debug(f"CogMaps.from_chunks({filename})")
+        kept: list[EncodedChunk] = []
+        seen: set[Ident] = set()
+        counts = np.zeros((0, 0), dtype=np.int64)
+        matrix = sparse.csr_matrix((0, 0))
+        for chunk in chunks:
+            check_new_ids(chunk.ids.tolist(), seen, "CogMaps.from_chunks")
+            chunk_codes = chunk.codes
+            nb_words = len(vocabulary)
+            chunk_counts = count_positions(chunk_codes, nb_words)
+            shape = (nb_words, max(counts.shape[1], chunk_counts.shape[1]))
+            counts = resize_array(counts, shape) + resize_array(chunk_counts, shape)
+            matrix.resize((nb_words, nb_words))
+            kernel = weights_kernel(DEFAULT_WEIGHTS, chunk_codes.shape[1])
+            matrix = matrix + cooccurrences_matrix(chunk_codes, kernel, nb_words)
+            kept.append(chunk)
+
+        new_cog_maps = CogMaps.from_store(ColumnarMaps.from_chunks(kept, list(vocabulary)), filename)
+        # pylint: disable=protected-access
+        new_cog_maps._cache.seed("positions_counts", counts)
+        new_cog_maps._cache.seed("sparse_matrix", matrix.tocsr())
+        logger.info(f"CogMaps.from_chunks: {len(seen)} maps with {int(counts.sum())} words in total")
+        return new_cog_maps
+
+    def invalidate(self, *inputs: str) -> None:
+        """Invalide les attributs dynamiques qui dependent des entrées données (toutes par défaut)"""
+        self._cache.invalidate(*(inputs or ("cog_maps", "weights", "partition")))
+
+    def fingerprint(self, name: str) -> Hashable:
+        """Empreinte d'un attribut de base, qui indexe les résultats conservés dans le cache"""
+        # les valeurs elles-mêmes et non leur hash : deux états distincts ne partagent jamais une clef
+        if name == "weights":
+            return tuple(sorted(self.__weights.items()))
+        if name == "partition":
+            return None if self.__partition is None else frozenset(self.__partition)
+        if name == "cog_maps":
+            return self.__version
+        raise ValueError(f"CogMaps.fingerprint unknown input {name}")
+
+    @property
+    def cache_stats(self) -> dict[str, CacheStats]:
+        """Les compteurs du cache pour chaque attribut dynamique"""
+        return self._cache.stats
+
+    @property
+    def results_stats(self) -> ResultCacheStats:
+        """Les compteurs (succès, éviction, taille) du cache des résultats par poids/partition"""
+        return self._cache.results.stats
+
+    @property
+    def cache_budget(self) -> int:
+        """Le budget mémoire en octets du cache des résultats par poids/partition"""
+        return self._cache.results.max_bytes
+
+    @cache_budget.setter
+    def cache_budget(self, max_bytes: int) -> None:
+        self._cache.results.max_bytes = max_bytes
 
     def __len__(self) -> int:
-        return len(self.__cog_maps)
+        return len(self.cog_maps)
 
     def __repr__(self) -> str:
         if self.__parent:
@@ -246,55 +1235,190 @@ class CogMaps:  # pylint: disable=too-many-instance-attributes
         return self.__cog_maps_filename
 
     @property
-    def cog_maps(self) -> CogMapsType:
-        """Les cartes elles mêmes"""
-        return self.__cog_maps
+    def cog_maps(self) -> Mapping[Ident, list[Word]]:
+        """Les cartes elles mêmes, restreintes à la partition courante s'il y en a une"""
+        if self.__selected is None:
+            return self.__cog_maps
+        return PartitionView(self.__cog_maps, self.__selected)
 
     @cog_maps.setter
     def cog_maps(self, values: CogMapsType) -> None:
-        """On contrôle l'affectation sur cog_maps"""
+        """On contrôle l'affectation sur cog_maps, qui remplace toutes les cartes et annule la partition"""
         if not isinstance(values, dict):
             raise TypeError(f"CogMaps.cog_maps does not support direct assignment from {type(values)}")
         self.__cog_maps = values
-        self.invalidate()
+        self.__partition = self.__selected = None
+        self.__version += 1
+        self.invalidate("cog_maps")
+        # les résultats des anciennes cartes ne resserviront plus
+        self._cache.results.clear()
+
+    def add_maps(self, cog_maps: CogMapsType) -> None:
+        """Ajoute des cartes : les attributs dynamiques déjà calculés sont mis à jour par différence,
+        en ajoutant la contribution des seules nouvelles cartes"""
+        logger.debug(f"CogMaps.add_maps({len(self)}, {len(cog_maps)})")
+        duplicates = cog_maps.keys() & self.__cog_maps.keys()
+        if duplicates:
+            raise ValueError(f"CogMaps.add_maps maps {sorted(duplicates)} already exist")
+        self.__materialize()
+        self.__cog_maps.update(cog_maps)
+        # le vocabulaire porte sur toutes les cartes, partition ou non : il reçoit les mots de toutes les nouvelles
+        all_maps = list(cog_maps.values())
+        if self.__selected is not None:
+            cog_maps = {ident: words for ident, words in cog_maps.items() if ident in self.__selected}
+        self.__update(cog_maps, +1, vocabulary_maps=all_maps)
+
+    def remove_maps(self, identifiers: Iterable[Ident]) -> None:
+        """Retire des cartes : les attributs dynamiques déjà calculés sont mis à jour par différence,
+        en retirant la contribution des seules cartes retirées"""
+        identifiers = set(identifiers)
+        logger.debug(f"CogMaps.remove_maps({len(self)}, {len(identifiers)})")
+        unknown = identifiers - self.__cog_maps.keys()
+        if unknown:
+            raise KeyError(f"CogMaps.remove_maps unknown maps {sorted(unknown)}")
+        # les lignes de codes à conserver, dans l'ordre de cog_maps
+        selected = list(self.cog_maps)
+        keep = np.fromiter((ident not in identifiers for ident in selected), bool, len(selected))
+        removed = {ident: self.__cog_maps[ident] for ident in selected if ident in identifiers}
+        self.__materialize()
+        for identifier in identifiers:
+            del self.__cog_maps[identifier]
+        self.__update(removed, -1, keep)
+
+    def __materialize(self) -> None:
+        """Avant une modification en place, remplace un stockage ColumnarMaps par le dictionnaire des cartes décodées,
+        et sa vue index par un index modifiable.
+
+        Les valeurs indexées par vocabulary (relues du cache des résultats ou placées par from_chunks) ne peuvent être
+        mises à jour qu'avec lui : il est alors lu ici, sur les cartes d'avant la modification"""
+        if not self._cache.values.keys().isdisjoint(("codes", "positions_counts", "sparse_matrix")):
+            _ = self.vocabulary
+        if not isinstance(self.__cog_maps, dict):
+            self.__cog_maps = dict(self.__cog_maps)
+            if isinstance(self._cache.values.get("index"), ColumnarIndex):
+                self._cache.values["index"] = defaultdict(list, self._cache.values["index"].items())
+
+    def __update(
+        self,
+        delta: CogMapsType,
+        sign: int,
+        keep: Optional[np.ndarray] = None,
+        vocabulary_maps: Optional[Iterable[list[Word]]] = None,
+    ) -> None:
+        """Met à jour en place les attributs dynamiques en cache en ajoutant (sign=+1) ou retirant (sign=-1)
+        la contribution des cartes de delta, keep étant alors les lignes de codes à conserver.
+
+        Les mots des cartes vocabulary_maps (par défaut celles de delta) sont ajoutés à vocabulary, qui porte sur
+        toutes les cartes : delta peut n'en être que la partie dans la partition courante.
+        Les identifiants du vocabulaire restent stables : un mot qui n'apparait plus reste dans vocabulary,
+        mais plus dans index ni words."""
+        values = self._cache.values
+        # la matrice dict de dict et les occurrences seront reconstruites depuis sparse_matrix et positions_counts
+        self._cache.discard("matrix", "occurrences")
+        # les contributions par carte de toutes les cartes seront recalculées si une partition les demande
+        self._cache.discard("all_ids", "all_codes", "mask", "map_counts", "map_pairs", cascade=False)
+
+        if "index" in values:
+            index = values["index"]
+            for identifier, words in delta.items():
+                for pos, word in enumerate(words, start=1):
+                    if sign > 0:
+                        index[word].append((identifier, pos))
+                    else:
+                        index[word].remove((identifier, pos))
+                        if not index[word]:
+                            del index[word]
+
+        if "occurrences_in_position" in values:
+            in_positions = values["occurrences_in_position"]
+            for words in delta.values():
+                for pos, word in enumerate(words, start=1):
+                    in_positions.setdefault(pos, Counter())[word] += sign
+                    if in_positions[pos][word] <= 0:
+                        del in_positions[pos][word]
+            for pos in [pos for pos, counter in in_positions.items() if not counter]:
+                del in_positions[pos]
+
+        if "vocabulary" in values:
+            vocabulary = values["vocabulary"]
+            known = set(vocabulary)
+            for a_map in delta.values() if vocabulary_maps is None else vocabulary_maps:
+                for word in a_map:
+                    if word not in known:
+                        known.add(word)
+                        vocabulary.append(word)
+
+            if not values.keys().isdisjoint(("codes", "positions_counts", "sparse_matrix")):
+                # les cartes restantes sont dans l'ordre de cog_maps : les ajouts à la fin
+                _, delta_codes = encode_cog_maps(delta, vocabulary)
+
+            if "codes" in values:
+                codes = values["codes"]
+                if sign > 0:
+                    width = max(codes.shape[1], delta_codes.shape[1])
+                    values["codes"] = np.vstack([pad_codes(codes, width), pad_codes(delta_codes, width)])
+                else:
+                    codes = codes[keep]
+                    # on garde une largeur égale à la plus longue carte restante
+                    values["codes"] = codes[:, : int((codes != PADDING).sum(axis=1).max(initial=0))]
+
+            if "positions_counts" in values:
+                counts = values["positions_counts"]
+                delta_counts = count_positions(delta_codes, len(vocabulary))
+                shape = (len(vocabulary), max(counts.shape[1], delta_counts.shape[1]))
+                counts = resize_array(counts, shape) + sign * resize_array(delta_counts, shape)
+                # largeur de la plus longue carte restante : la dernière position encore occupée
+                values["positions_counts"] = counts[:, : int(np.flatnonzero(counts.any(axis=0)).max(initial=-1)) + 1]
+
+            if "sparse_matrix" in values:
+                matrix = values["sparse_matrix"].copy()
+                matrix.resize((len(vocabulary), len(vocabulary)))
+                kernel = weights_kernel(self.__weights, delta_codes.shape[1])
+                matrix = matrix + sign * cooccurrences_matrix(delta_codes, kernel, len(vocabulary))
+                # on nettoie les résidus d'arrondis des cases retombées à zéro
+                matrix.data[np.abs(matrix.data) < ROUNDING_TOLERANCE] = 0.0
+                matrix.eliminate_zeros()
+                values["sparse_matrix"] = matrix
+        else:
+            # sans vocabulaire, la contribution des cartes ne peut être placée : recalcul à la prochaine lecture
+            self._cache.discard("codes", "positions_counts", "sparse_matrix")
+
+        self.__version += 1
+        self._cache.rekey()
 
     @property
-    def thesaurus(self) -> ThesaurusType:
+    def thesaurus(self) -> Thesaurus:
         """Le thesaurus"""
         return self.__thesaurus
 
     @thesaurus.setter
     def thesaurus(self, data: ThesaurusType) -> None:  # pylint: disable=no-self-use
-        """Contrôle de l'affectation sur thesaurus"""
-        self.__thesaurus = data
+        """Contrôle de l'affectation sur thesaurus : un dictionnaire est figé en Thesaurus"""
+        self.__thesaurus = data if isinstance(data, Thesaurus) else Thesaurus(data)
 
     def dump(self, filename: StringOrPath) -> None:
         """Ecrit les cartes dans un fichier"""
         logger.debug(f"CogMaps.dump({len(self)}, {filename})")
         with open(filename, "w", newline="", encoding=ENCODING) as csvfile:
             writer = csv.writer(csvfile, **CSV_PARAMS)
-            for i, words in self.__cog_maps.items():
+            for i, words in self.cog_maps.items():
                 writer.writerow([i] + words)  # type: ignore
         logger.info(f"CogMaps.dump to {filename}")
 
-    @property
+    @derived("cog_maps", "partition")
     def index(self) -> IndexType:
         """Index "pivot" des cartes : pour chaque mot, donne les couples (id, pos) des cartes où il apparait"""
-        if self.__index is None:
-            logger.debug(f"CogMaps.create_index({len(self)})")
-            self.__index = defaultdict(list)
-            for identifier, words in self.__cog_maps.items():
-                for pos, word in enumerate(words):
-                    # NOTE : on fait commencer les positions à 1
-                    value = (identifier, pos + 1)
-                    self.__index[word].append(value)
-            logger.info(f"CogMaps.create_index: {len(self.__index)} different words")
-        return self.__index
-
-    @index.setter
-    def index(self, _) -> None:  # pylint: disable=no-self-use
-        """On bloque l'affectation sur index"""
-        raise TypeError("CogMaps.index does not support direct assignment")
+        logger.debug(f"CogMaps.create_index({len(self)})")
+        if self.__partition is None and isinstance(self.__cog_maps, ColumnarMaps):
+            return ColumnarIndex(self.__cog_maps)  # type: ignore
+        index: IndexType = defaultdict(list)
+        for identifier, words in self.cog_maps.items():
+            for pos, word in enumerate(words):
+                # NOTE : on fait commencer les positions à 1
+                value = (identifier, pos + 1)
+                index[word].append(value)
+        logger.info(f"CogMaps.create_index: {len(index)} different words")
+        return index
 
     @property
     def words(self) -> Iterator[Word]:
@@ -311,88 +1435,174 @@ class CogMaps:  # pylint: disable=too-many-instance-attributes
         if not isinstance(values, dict):
             raise NotImplementedError(f"CogMaps.weights cannot dispatch {type(values)}")
         self.__weights = values
-        # invalidation des attributs dynamiques
-        self.invalidate()
+        # invalidation des attributs dynamiques qui dépendent des poids
+        self.invalidate("weights")
 
     @property
-    def partition(self) -> PartitionType:
-        """Les identifiants actuellement sélectionnés"""
+    def partition(self) -> Optional[PartitionType]:
+        """Les identifiants actuellement sélectionnés, None pour toutes les cartes"""
         return self.__partition
 
     @partition.setter
-    def partition(self, values: PartitionType):
-        if not isinstance(values, Iterable):
+    def partition(self, values: Optional[PartitionType]):
+        if values is not None and not isinstance(values, Iterable):
             raise NotImplementedError(f"CogMaps.partition cannot dispatch {type(values)}")
-        self.__partition = values
-        self.__cog_maps = {ident:val for ident, val in self.__cog_maps_full.items() if ident in self.__partition}
+        self.__partition = None if values is None else list(values)
+        self.__selected = None if values is None else set(self.__partition)
         # invalidation des attributs dynamiques
-        self.invalidate()
-
-    @property
+        self.invalidate("partition")
+
+    @derived("cog_maps")
+    def all_ids(self) -> np.ndarray:
+        """Les identifiants de toutes les cartes, partition ou non"""
+        if isinstance(self.__cog_maps, ColumnarMaps):
+            return self.__cog_maps.ids
+        return np.fromiter(self.__cog_maps, dtype=np.int64, count=len(self.__cog_maps))
+
+    @derived("cog_maps", "vocabulary")
+    def all_codes(self) -> CodesType:
+        """Toutes les cartes encodées, partition ou non, dans l'ordre de all_ids"""
+        logger.debug(f"CogMaps.all_codes({len(self.__cog_maps)})")
+        if isinstance(self.__cog_maps, ColumnarMaps):
+            return self.__cog_maps.codes
+        _, codes = encode_cog_maps(self.__cog_maps, self.vocabulary)
+        return codes
+
+    @derived("all_ids", "partition")
+    def mask(self) -> np.ndarray:
+        """Masque booléen sur all_ids des cartes de la partition courante"""
+        if self.__partition is None:
+            return np.ones(len(self.all_ids), dtype=bool)
+        return np.isin(self.all_ids, self.__partition)
+
+    @derived("all_codes", "vocabulary")
+    def map_counts(self) -> SparseMatrixType:
+        """Contribution de chaque carte de all_codes au comptage par position, voir map_positions_counts"""
+        logger.debug(f"CogMaps.map_counts({len(self.__cog_maps)})")
+        return map_positions_counts(self.all_codes, len(self.vocabulary))
+
+    @derived("all_codes", "weights")
+    def map_pairs(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Contribution de chaque carte de all_codes aux co-occurrences pondérées, voir cooccurrences_pairs"""
+        logger.debug(f"CogMaps.map_pairs({len(self.__cog_maps)})")
+        return cooccurrences_pairs(self.all_codes, weights_kernel(self.weights, self.all_codes.shape[1]))
+
+    @derived("positions_counts", "vocabulary", "weights")
     def occurrences(self) -> OccurrencesType:
         """Pour chaque mot, donne son poids comme étant la somme pondérées des positions où il apparait, soit pi(mot) le nombre de fois où mot apparait en position i
         p(mot) = a1*p1(mot) + a2*p2(mot) + ... + an*pn(mot)
         """
+        logger.debug(f"CogMaps.occurrences({len(self)})")  # {self.__weights}
+        counts = self.positions_counts
+        # on utilise weights.get pour donner un poids par défaut de 0.0
+        # aux positions dont le poids n'est pas défini
+        weighted = counts @ weights_matrix({"weights": self.weights}, counts.shape[1])[:, 0]
+        present = counts.sum(axis=1) > 0
+        return {self.vocabulary[i]: weighted[i] for i in np.flatnonzero(present).tolist()}
+
+    def aggregate_segments(
+        self, segments: Union[SegmentsType, Sequence[Hashable]], *, with_matrix: bool = False
+    ) -> SegmentsAggregates:
+        """Calcule en une seule passe groupée les agrégats de plusieurs segments de cartes, sans tenir compte de partition
+
+        segments est soit un dictionnaire étiquette -> identifiants de cartes (un segment par étiquette, une carte
+        peut être dans plusieurs segments), soit une étiquette par carte dans l'ordre de all_ids (None exclut la carte).
+        Les contributions de chaque carte (map_counts, map_pairs) sont sommées par segment via une matrice creuse
+        d'appartenance (segments x cartes).
+        """
+        if not isinstance(segments, Mapping):
+            if len(segments) != len(self.all_ids):
+                raise ValueError(f"CogMaps.aggregate_segments expects {len(self.all_ids)} labels, got {len(segments)}")
+            grouped: dict[Hashable, list[Ident]] = defaultdict(list)
+            for identifier, label in zip(self.all_ids.tolist(), segments):
+                if label is not None:
+                    grouped[label].append(identifier)
+            segments = grouped
+        logger.debug(f"CogMaps.aggregate_segments({len(self)}, {len(segments)} segments, {with_matrix=})")
+
+        labels = list(segments)
+        row_of = {identifier: row for row, identifier in enumerate(self.all_ids.tolist())}
+        members = [(k, row_of[ident]) for k, label in enumerate(labels) for ident in segments[label] if ident in row_of]
+        seg_rows = np.array([k for k, _ in members], dtype=np.int64)
+        map_rows = np.array([row for _, row in members], dtype=np.int64)
+        groups = sparse.csr_matrix(
+            (np.ones(len(members)), (seg_rows, map_rows)), shape=(len(labels), len(self.all_ids))
+        )
 
-        if self.__occurrences is None:
-            logger.debug(f"CogMaps.occurrences({len(self.__cog_maps)})")  # {self.__weights}
-            self.__occurrences = {}
-            # on ne garde que la seconde composante de l'index
-            second = lambda x: x[1]
-            # à chaque mot la liste de ses positions (en oubliant l'id de carte)
-            position_index = {word: list(map(second, positions)) for word, positions in self.index.items()}
-            # pour chaque mot et ses poitions
-            for word, positions in position_index.items():
-                # on remplace la position par son poids et on somme
-                # on utilise dict.get pour donner un poids par défaut de 0.0
-                # aux positions dont le poids n'est pas défini
-                self.__occurrences[word] = sum(map(lambda pos: self.weights.get(pos, 0.0), positions))
-
-        return self.__occurrences
-
-    @occurrences.setter
-    def occurrences(self, _) -> None:  # pylint: disable=no-self-use
-        """On bloque l'affectation sur occurrences"""
-        raise TypeError("CogMaps.occurrences does not support direct assignment")
+        nb_words, width = len(self.vocabulary), self.all_codes.shape[1]
+        positions = (groups @ self.map_counts).toarray().reshape(len(labels), nb_words, width)
+        occurrences = positions @ weights_matrix({"weights": self.weights}, width)[:, 0]
+        matrices = None
+        if with_matrix:
+            maps, rows, cols, values = self.map_pairs
+            pairs = sparse.csr_matrix(
+                (values, (maps, rows.astype(np.int64) * nb_words + cols)),
+                shape=(len(self.all_ids), nb_words * nb_words),
+            )
+            matrices = (groups @ pairs).toarray().reshape(len(labels), nb_words, nb_words)
+
+        return SegmentsAggregates(
+            labels=labels,
+            vocabulary=self.vocabulary,
+            sizes=np.asarray(groups.sum(axis=1)).ravel().astype(np.int64),
+            positions=positions.astype(np.int64),
+            occurrences=occurrences,
+            matrices=matrices,
+        )
+
+    @derived("map_counts", "mask", "codes")
+    def positions_counts(self) -> np.ndarray:
+        """Matrice (mots x positions) : le nombre de fois où chaque mot du vocabulaire apparait à chaque position
+
+        C'est la somme masquée par la partition des contributions de chaque carte
+        """
+        logger.debug(f"CogMaps.positions_counts({len(self)})")
+        width = self.all_codes.shape[1]
+        counts = (self.map_counts.T @ self.mask).reshape(len(self.vocabulary), width)
+        # on ne garde que les positions des cartes sélectionnées
+        return counts[:, : self.codes.shape[1]]
+
+    def occurrences_many(self, weights_map: WeightsMapType) -> np.ndarray:
+        """Occurrences pondérées pour toute une famille de pondérations en un seul produit matriciel
+
+        Renvoie la matrice (mots x pondérations) : les lignes suivent vocabulary, les colonnes weights_map
+        """
+        logger.debug(f"CogMaps.occurrences_many({len(self)}, {len(weights_map)})")
+        counts = self.positions_counts
+        return counts @ weights_matrix(weights_map, counts.shape[1])
 
     def dump_occurrences_many(self, filename: StringOrPath, weights_map: WeightsMapType) -> None:
         """Genère les positions pondérées pour une famille de pondérations"""
         header = ["mot", "nb_occurrences", *weights_map.keys()]
         logger.debug("CogMaps.dump_occurences_many: header %s", header)
-        occurrences = {}
-
-        for name, weights in weights_map.items():
-            self.weights = weights
-            occurrences[name] = self.occurrences
+        occurrences = self.occurrences_many(weights_map).tolist()
+        nb_occurrences = self.positions_counts.sum(axis=1).tolist()
+        order = self.__sorted_words_ids()
 
         with open(filename, "w", newline="", encoding=ENCODING) as csvfile:
             writer = csv.writer(csvfile, **CSV_PARAMS)
             writer.writerow(header)
-            for word in sorted(self.words):
+            for i in order:
                 # ici, affichage avec la locale
                 # https://stackoverflow.com/questions/1823058/how-to-print-number-with-commas-as-thousands-separators
-                # row = [f"{round(occurrences[name][word], 2):n}" for name in weights_map]
-                row = [f"{round(occurrences[name][word], 2)}" for name in weights_map]
-                writer.writerow((word, len(self.index[word]), *row))
+                # row = [f"{round(value, 2):n}" for value in occurrences[i]]
+                row = [f"{round(value, 2)}" for value in occurrences[i]]
+                writer.writerow((self.vocabulary[i], nb_occurrences[i], *row))
         logger.info("CogMaps.dump_occurences_many to %s", filename)
 
-    @property
+    @derived("index")
     def occurrences_in_position(self) -> OccurrencesInPositionsType:
         """Pour chaque position, calcule le nombre d'occurence de chaque mot dans cette position"""
+        logger.debug(f"CogMaps.occurrences_in_position({len(self)})")
+        words_in_pos = defaultdict(list)
 
-        if self.__occurrences_in_positions is None:
-            logger.debug(f"CogMaps.occurrences_in_position({len(self)})")
-            words_in_pos = defaultdict(list)
+        for word, positions in self.index.items():
+            for (_, position) in positions:
+                words_in_pos[position].append(word)
 
-            for word, positions in self.index.items():
-                for (_, position) in positions:
-                    words_in_pos[position].append(word)
-
-            self.__occurrences_in_positions = {position: Counter(words) for (position, words) in words_in_pos.items()}
-            logger.info(
-                f"CogMaps.occurrences_in_position: {len(self.__occurrences_in_positions)} positions (longest map)"
-            )
-        return self.__occurrences_in_positions
+        occurrences_in_positions = {position: Counter(words) for (position, words) in words_in_pos.items()}
+        logger.info(f"CogMaps.occurrences_in_position: {len(occurrences_in_positions)} positions (longest map)")
+        return occurrences_in_positions
 
     def dump_occurrences_in_position(self, filename: StringOrPath):
         """Sauvegarde pour chaque position, la liste des mots énoncés et leur nombre d'occurences (le produit de compute_histogram_pos) au format csv"""
@@ -418,14 +1628,13 @@ class CogMaps:  # pylint: disable=too-many-instance-attributes
         # les mots qui n'ont pas d'image
         unknown_report = defaultdict(list)
         # pour chaque carte, on garde son identifiant
-        for identifier, words in self.__cog_maps.items():
-            # on remplace chacun de ses mots par son image dans le thesaurus
-            concept_maps[identifier] = [
-                self.__thesaurus[word] for word in words if (self.__thesaurus[word] != DEFAULT_CONCEPT or with_unknown)
-            ]
+        for identifier, words in self.cog_maps.items():
+            # on remplace chacun de ses mots par son image dans le thesaurus, une seule recherche par mot
+            images = [self.__thesaurus.get(word, DEFAULT_CONCEPT) for word in words]
+            concept_maps[identifier] = [image for image in images if image != DEFAULT_CONCEPT or with_unknown]
             # on ajoute les mots qui n'ont pas d'image
-            for word in words:
-                if self.__thesaurus[word] == DEFAULT_CONCEPT:
+            for word, image in zip(words, images):
+                if image == DEFAULT_CONCEPT:
                     unknown_report[word].append(identifier)
 
         logger.info(
@@ -443,9 +1652,7 @@ class CogMaps:  # pylint: disable=too-many-instance-attributes
         # on reprend la même carte de poids
         new_cog_maps.__weights = self.__weights.copy()  # pylint: disable=protected-access
         # on utilise le même nom de fichier
-        path = Path(self.filename)
-        # pylint: disable=protected-access
-        new_cog_maps.__cog_maps_filename = f"concepts_of_{path.stem}{path.suffix}"
+        new_cog_maps.__cog_maps_filename = concepts_filename(self.filename)  # pylint: disable=protected-access
 
         # on utilise le fait que le rapport des unknnows est une cog_maps aussi
         unknowns_maps = CogMaps()
@@ -454,22 +1661,99 @@ class CogMaps:  # pylint: disable=too-many-instance-attributes
         return new_cog_maps, unknowns_maps
 
     def apply_many(self, thesaurus_maps, *, with_unknown=True):
-        """Génération des 4 niveaux cartes du thesaurus (base, concept, mother, gd_mother) et les 3 rapports d'erreur"""
+        """Génération des 4 niveaux cartes du thesaurus (base, concept, mother, gd_mother) et les 3 rapports d'erreur
+
+        Le thésaurus est compilé en tableaux d'indirection sur le vocabulaire, puis les codes des cartes
+        sont projetés vers tous les niveaux en une seule fois : les cartes de chaque niveau sont construites
+        directement depuis leurs codes."""
         logger.debug(f"CogMaps.apply_many({len(self)}, {len(thesaurus_maps)})")
+        compiled = compile_thesaurus(thesaurus_maps, self.vocabulary)
+        identifiers = self.all_ids[self.mask]
+        projected = compiled.project(self.codes)
+        # les mots encore présents au niveau courant : sans les inconnus des niveaux précédents si not with_unknown
+        present = self.codes != PADDING
         the_maps = {BASE_LVL: self}
         the_reports = {}
-        # le thesaurus a plusieurs niveau. On va appliquer chacun
-        for i, level in enumerate(LEVELS[1::]):
-            previous_level = LEVELS[i]
-            the_maps[previous_level].thesaurus = thesaurus_maps[level]
-            the_new_maps, the_unknowns_maps = the_maps[previous_level].apply(with_unknown=with_unknown)
-            the_maps[level] = the_new_maps
-            the_reports[level] = the_unknowns_maps
-            # le rapport des mots qui n'ont pas d'image, on le produit tout de suite
+        for i, level in enumerate(LEVELS[1::], start=1):
+            previous_level = LEVELS[i - 1]
+            previous_maps = the_maps[previous_level]
+            previous_maps.thesaurus = thesaurus_maps[level]
+            previous_codes = projected[i - 1]
+            unknown = present & compiled.unknowns[level][np.where(present, previous_codes, 0)]
+            if not with_unknown:
+                present = present & ~unknown
+
+            store = ColumnarMaps.from_codes(
+                identifiers, compact_codes(projected[i], present), compiled.vocabularies[level]
+            )
+            new_cog_maps = CogMaps.from_store(store, concepts_filename(previous_maps.filename), previous_maps)
+
+            # les mots qui n'ont pas d'image, dans l'ordre des cartes puis des positions
+            unknown_report = defaultdict(list)
+            rows, columns = np.nonzero(unknown)
+            previous_vocabulary = compiled.vocabularies[previous_level]
+            for word, identifier in zip(previous_codes[rows, columns].tolist(), identifiers[rows].tolist()):
+                unknown_report[previous_vocabulary[word]].append(identifier)
+            unknowns_maps = CogMaps.from_store(dict(unknown_report), parent=previous_maps)
+
+            logger.info(
+                f"CogMaps.apply_many: {level} {len(new_cog_maps)} concept maps with {int(present.sum())} words, {len(unknown_report)} unknown words ({DEFAULT_CONCEPT}) in {len(rows)} maps"
+            )
+            the_maps[level] = new_cog_maps
+            the_reports[level] = unknowns_maps
 
         return the_maps, the_reports
 
-    @property
+    def __sorted_words_ids(self) -> list[int]:
+        """Les identifiants des mots présents dans les cartes, triés par ordre alphabétique des mots"""
+        present = [i for i, word in enumerate(self.vocabulary) if word in self.index]
+        return sorted(present, key=self.vocabulary.__getitem__)
+
+    @derived("cog_maps")
+    def vocabulary(self) -> VocabularyType:
+        """Le vocabulaire : le mot de chaque identifiant entier utilisé par codes et sparse_matrix,
+        dans l'ordre de première apparition dans toutes les cartes, partition ou non (ou celui du stockage en colonnes)
+        """
+        if isinstance(self.__cog_maps, ColumnarMaps):
+            return list(self.__cog_maps.vocabulary)
+        return list(dict.fromkeys(word for words in self.__cog_maps.values() for word in words))
+
+    @derived("all_codes", "mask")
+    def codes(self) -> CodesType:
+        """Les cartes encodées : une ligne par carte, l'identifiant du mot à chaque position, PADDING au-delà"""
+        logger.debug(f"CogMaps.codes({len(self)})")
+        codes = self.all_codes if self.__partition is None else self.all_codes[self.mask]
+        # on garde une largeur égale à la plus longue carte sélectionnée
+        codes = codes[:, : int((codes != PADDING).sum(axis=1).max(initial=0))]
+        logger.info(f"CogMaps.codes: {len(self.vocabulary)} words, codes of shape {codes.shape}")
+        return codes
+
+    @derived("map_pairs", "mask", "vocabulary")
+    def sparse_matrix(self) -> SparseMatrixType:
+        """Matrice creuse (CSR) des co-occurrences pondérée par weights, lignes et colonnes indexées par vocabulary
+
+        C'est la somme masquée par la partition des contributions de chaque carte
+        """
+        logger.debug(f"CogMaps.sparse_matrix({len(self)})")
+        start = time.perf_counter_ns()
+        maps, rows, cols, values = self.map_pairs
+        if self.__partition is not None:
+            selected = self.mask[maps]
+            rows, cols, values = rows[selected], cols[selected], values[selected]
+        matrix = pairs_to_matrix(rows, cols, values, len(self.vocabulary))
+        logger.info(
+            "CogMaps.sparse_matrix: %i non-zero cells, duration %fms",
+            matrix.nnz,
+            round((time.perf_counter_ns() - start) / 10 ** 6, 2),
+        )
+        return matrix
+
+    def cooccurrences(self, *, dense: bool = False) -> Tuple[Union[SparseMatrixType, np.ndarray], VocabularyType]:
+        """La matrice de co-occurrences, creuse ou dense, et le vocabulaire qui indexe ses lignes et colonnes"""
+        matrix = self.sparse_matrix.toarray() if dense else self.sparse_matrix
+        return matrix, self.vocabulary
+
+    @derived("sparse_matrix", "vocabulary")
     def matrix(self) -> MatrixType:
         """Calcule la matrice de co-occurrences des mots d'une carte
 
@@ -480,37 +1764,181 @@ class CogMaps:  # pylint: disable=too-many-instance-attributes
 
         en jouant avec l'attribut self.weight, on peut obtenir différentes
         pondération de la distance inter-mots
+
+        C'est une vue construite paresseusement depuis sparse_matrix, seules les cases non nulles sont présentes
+        """
+        logger.debug(f"CogMaps.matrix({len(self)})")
+        return sparse_to_nested(self.sparse_matrix, self.vocabulary)
+
+    def dump_matrix(self, filename: StringOrPath, matrix_format: str = DEFAULT_MATRIX_FORMAT) -> None:
+        """Ecrit la matrice de co-occurrences au format matrix_format :
+
+        - TRIPLETS_FORMAT : CSV (ligne; colonne; poids) des seules cases non nulles, trié par mots
+        - NPZ_FORMAT : binaire numpy de la matrice creuse CSR et de son vocabulaire, relu par load_matrix
+        - DENSE_FORMAT : CSV de la matrice complète mots x mots
         """
-        if self.__matrix is None:
-            logger.debug(f"CogMaps.matrix({len(self)})")
-            start = time.perf_counter_ns()
-            self.__matrix = defaultdict(lambda: defaultdict(float))  # type: ignore
-
-            for _, words in self.cog_maps.items():
-                pos_prod = product(enumerate(words), enumerate(words))
-                for (pos_row, word_row), (pos_col, word_col) in pos_prod:
-                    distance = abs(pos_row - pos_col)
-                    weigthed_distance = self.weights.get(distance, 0.0) if distance else 1.0
-                    self.__matrix[word_row][word_col] += weigthed_distance
-            logger.info("CogMaps.matrix: duration %fms", round((time.perf_counter_ns() - start) / 10 ** 6, 2))
-        return self.__matrix
-
-    def dump_matrix(self, filename: StringOrPath) -> None:
-        """Ecrit les cartes depuis le dict/dic python"""
-        logger.debug(f"CogMaps.dump_matrix({len(self.matrix)}, {filename})")
-        words = sorted(self.words)
+        logger.debug(f"CogMaps.dump_matrix({self.sparse_matrix.nnz}, {filename}, {matrix_format})")
+        if matrix_format not in MATRIX_FORMATS:
+            raise ValueError(f"CogMaps.dump_matrix unknown format {matrix_format}, expected one of {MATRIX_FORMATS}")
+
+        if matrix_format == NPZ_FORMAT:
+            matrix = self.sparse_matrix
+            # mêmes clefs que scipy.sparse.save_npz, pour rester lisible par scipy.sparse.load_npz
+            np.savez_compressed(
+                filename,
+                format=np.array(b"csr"),
+                shape=np.array(matrix.shape),
+                data=matrix.data,
+                indices=matrix.indices,
+                indptr=matrix.indptr,
+                vocabulary=np.array(self.vocabulary, dtype=np.str_),
+            )
+            logger.info(f"CogMaps.dump_matrix: {filename}")
+            return
+
+        # on réordonne lignes et colonnes par ordre alphabétique des mots
+        order = self.__sorted_words_ids()
+        words = [self.vocabulary[i] for i in order]
+        matrix = self.sparse_matrix[order][:, order]
         with open(filename, "w", newline="", encoding=ENCODING) as csvfile:
             writer = csv.writer(csvfile, **CSV_PARAMS)
-            writer.writerow(["/"] + words)
-            for row_word in words:
-                writer.writerow([row_word] + [str(round(self.matrix[row_word][col_word], 2)) for col_word in words])
+            if matrix_format == TRIPLETS_FORMAT:
+                coo = matrix.tocoo()
+                writer.writerow(["ligne", "colonne", "poids"])
+                writer.writerows(
+                    (words[row], words[col], str(round(value, 2)))
+                    for row, col, value in zip(coo.row.tolist(), coo.col.tolist(), coo.data.tolist())
+                )
+            else:
+                writer.writerow(["/"] + words)
+                for row_word, row in zip(words, matrix.toarray().tolist()):
+                    writer.writerow([row_word] + [str(round(value, 2)) for value in row])
         logger.info(f"CogMaps.dump_matrix: {filename}")
 
+    @staticmethod
+    def load_matrix(filename: StringOrPath) -> Tuple[SparseMatrixType, VocabularyType]:
+        """Relit une matrice écrite par dump_matrix au format NPZ_FORMAT"""
+        logger.debug(f"CogMaps.load_matrix({filename})")
+        with np.load(filename) as data:
+            matrix = sparse.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+            vocabulary = data["vocabulary"].tolist()
+        return matrix, vocabulary
+
+    def dense_matrix(
+        self, words: Optional[Sequence[Word]] = None, out: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, list[Word]]:
+        """La matrice de co-occurrences dense restreinte aux mots words, dans cet ordre (par défaut les mots présents
+        par ordre alphabétique), écrite dans out s'il est fourni, et la liste de ses mots"""
+        order = self.__words_ids(words)
+        words = [self.vocabulary[i] for i in order]
+        return self.sparse_matrix[order][:, order].toarray(out=out), words
+
+    def __words_ids(self, words: Optional[Sequence[Word]] = None) -> list[int]:
+        """Les identifiants des mots words, par défaut les mots présents par ordre alphabétique"""
+        if words is None:
+            return self.__sorted_words_ids()
+        ids = {word: i for i, word in enumerate(self.vocabulary)}
+        return [ids[word] for word in words]
+
+    def clusterize(
+        self,
+        n_clusters: int = 5,
+        words: Optional[Sequence[Word]] = None,
+        *,
+        normalize: bool = False,
+        threshold: float = 0.05,
+        spectral: bool = False,
+        random_state=None,
+    ) -> dict[int, list[Word]]:
+        """Regroupe les mots words (par défaut les mots présents par ordre alphabétique) en n_clusters clusters depuis
+        la matrice de co-occurrences creuse, voir cluster_matrix : à chaque cluster, ses mots dans l'ordre de words"""
+        logger.debug(f"CogMaps.clusterize({n_clusters}, {normalize}, {threshold}, {spectral})")
+        order = self.__words_ids(words)
+        labels = cluster_matrix(
+            self.sparse_matrix[order][:, order],
+            n_clusters,
+            normalize=normalize,
+            threshold=threshold,
+            spectral=spectral,
+            random_state=random_state,
+        )
+        return labels_to_clusters(labels, [self.vocabulary[i] for i in order])
+
+    def clusterize_sweep(
+        self,
+        all_n_clusters: Iterable[int],
+        words: Optional[Sequence[Word]] = None,
+        *,
+        normalize: bool = False,
+        threshold: float = 0.05,
+        spectral: bool = False,
+        random_state=None,
+        jobs: int = 1,
+    ) -> Tuple[dict[int, Clustering], list[Word]]:
+        """clusterize pour chaque nombre de clusters de all_n_clusters, voir cluster_sweep : les k-means et leurs
+        scores, et les mots de leurs lignes (voir labels_to_clusters)"""
+        logger.debug(f"CogMaps.clusterize_sweep({all_n_clusters}, {normalize}, {threshold}, {spectral})")
+        order = self.__words_ids(words)
+        results = cluster_sweep(
+            self.sparse_matrix[order][:, order],
+            all_n_clusters,
+            normalize=normalize,
+            threshold=threshold,
+            spectral=spectral,
+            random_state=random_state,
+            jobs=jobs,
+        )
+        return results, [self.vocabulary[i] for i in order]
+
+    def materialize_matrix(self, filename: StringOrPath, words: Optional[Sequence[Word]] = None) -> Path:
+        """Ecrit la matrice de co-occurrences dense (voir dense_matrix) directement dans le fichier .npy filename
+        projeté en mémoire, et ses mots dans le fichier voisin vocabulary_sidecar(filename).
+
+        D'autres scripts ou processus s'y attachent ensuite sans copie ni recalcul par attach_matrix."""
+        logger.debug(f"CogMaps.materialize_matrix({filename})")
+        nb_words = len(self.__sorted_words_ids()) if words is None else len(words)
+        out = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float64, shape=(nb_words, nb_words))
+        _, words = self.dense_matrix(words, out)
+        out.flush()
+        del out
+        with open(vocabulary_sidecar(filename), "w", encoding=ENCODING) as file:
+            json.dump(words, file, ensure_ascii=False)
+        logger.info(f"CogMaps.materialize_matrix: {filename} ({nb_words} words)")
+        return Path(filename)
+
+    @staticmethod
+    def attach_matrix(filename: StringOrPath) -> Tuple[np.ndarray, VocabularyType]:
+        """S'attache en lecture seule, sans copie, à une matrice écrite par materialize_matrix : le tableau projeté
+        en mémoire et les mots de ses lignes et colonnes"""
+        logger.debug(f"CogMaps.attach_matrix({filename})")
+        with open(vocabulary_sidecar(filename), encoding=ENCODING) as file:
+            words = json.load(file)
+        return np.load(filename, mmap_mode="r"), words
+
+
+def labels_to_clusters(labels: np.ndarray, words: Sequence[Word]) -> dict[int, list[Word]]:
+    """Outil : à chaque numéro de cluster, ses mots dans l'ordre de words, words[i] étant au cluster labels[i]"""
+    clusters = defaultdict(list)
+    for word, label in zip(words, labels.tolist()):
+        clusters[label].append(word)
+    return dict(sorted(clusters.items()))
+
+
+def vocabulary_sidecar(filename: StringOrPath) -> Path:
+    """Outil : le fichier des mots d'une matrice écrite par CogMaps.materialize_matrix"""
+    return Path(filename).with_suffix(".vocabulary.json")
+
 
-def gen_filename(outdir: StringOrPath, base: StringOrPath, suffix: str) -> Path:
+def gen_filename(outdir: StringOrPath, base: StringOrPath, suffix: str, extension: str = "csv") -> Path:
     """Outil : Génère un nom de fichier standardisé pour les résultats de calcul"""
     # return Path(outdir) / Path(f"{Path(base).stem}_{suffix}.csv")
-    return Path(outdir) / f"{Path(base).stem}_{suffix}.csv"
+    return Path(outdir) / f"{Path(base).stem}_{suffix}.{extension}"
+
+
+def concepts_filename(filename: StringOrPath) -> str:
+    """Outil : le nom de fichier des cartes obtenues en appliquant un niveau du thésaurus à celles de filename"""
+    path = Path(filename)
+    return f"concepts_of_{path.stem}{path.suffix}"
 
 
 def compose(src: dict, dst: dict):
@@ -518,49 +1946,178 @@ def compose(src: dict, dst: dict):
     return {k: dst.get(v, DEFAULT_CONCEPT) for k, v in src.items()}
 
 
-def generate_results(
-    output_dir: StringOrPath,
+# suffixes des fichiers de résultats
+OCCURRENCES_SUFFIX = "occurrences"
+POSITIONS_SUFFIX = "positions"
+MATRIX_SUFFIX = "matrice"
+UNKNOWN_SUFFIX = "inconnus"
+
+# les entrées partagées par les tâches de generate_all_results, chargées une fois par processus par init_worker
+WORKER_CONTEXT: dict = {}
+
+# une tâche de generate_all_results, un jeu de cartes : (output_dir, cog_maps_filename, weights_names, matrix_format)
+ResultsTaskType = Tuple[StringOrPath, StringOrPath, Sequence[str], str]
+
+
+def load_levels(
     cog_maps_filename: StringOrPath,
     thesaurus_filename: StringOrPath,
+    with_unknown: bool,
+    cache_dir: Optional[StringOrPath] = None,
+    thesaurus_map: Optional[ThesaurusMapType] = None,
+) -> Tuple[dict[Level, CogMaps], dict[Level, CogMaps]]:
+    """Les cartes de chaque niveau et les rapports des mots sans image, depuis le cache disque s'il y en a un"""
+    if cache_dir is not None:
+        from cog_maps_cache import InputsCache  # pylint: disable=import-outside-toplevel
+
+        return InputsCache(cache_dir).load_levels(cog_maps_filename, thesaurus_filename, with_unknown=with_unknown)
+    if thesaurus_map is None:
+        thesaurus_map = CogMaps.load_thesaurus_map(thesaurus_filename)
+    return CogMaps(cog_maps_filename).apply_many(thesaurus_map, with_unknown=with_unknown)
+
+
+def init_worker(
+    thesaurus_filename: StringOrPath,
+    thesaurus_map: ThesaurusMapType,
+    weights_map: WeightsMapType,
+    with_unknown: bool,
+    cache_dir: Optional[StringOrPath],
+) -> None:
+    """Initialise les entrées partagées d'un processus de calcul"""
+    WORKER_CONTEXT.clear()
+    WORKER_CONTEXT.update(
+        thesaurus_filename=thesaurus_filename,
+        thesaurus_map=thesaurus_map,
+        weights_map=weights_map,
+        with_unknown=with_unknown,
+        cache_dir=cache_dir,
+    )
+
+
+def generate_task_results(task: ResultsTaskType) -> dict[Level, CogMaps]:
+    """Produit les résultats d'un jeu de cartes dans le contexte de init_worker, ses niveaux n'étant chargés qu'ici :
+    cartes, occurrences, positions et rapport des inconnus de chaque niveau, puis une matrice par pondération"""
+    output_dir, cog_maps_filename, weights_names, matrix_format = task
+    all_maps, all_reports = load_levels(
+        cog_maps_filename,
+        WORKER_CONTEXT["thesaurus_filename"],
+        WORKER_CONTEXT["with_unknown"],
+        WORKER_CONTEXT["cache_dir"],
+        WORKER_CONTEXT["thesaurus_map"],
+    )
+    weights_map = WORKER_CONTEXT["weights_map"]
+    # application partielle qui génère un préfixe de nom
+    get_name = partial(gen_filename, output_dir, cog_maps_filename)
+    matrix_extension = "npz" if matrix_format == NPZ_FORMAT else "csv"
+
+    for level, a_map in all_maps.items():
+        a_map.dump(get_name(level))
+        a_map.dump_occurrences_many(get_name(f"{level}_{OCCURRENCES_SUFFIX}"), weights_map)
+        a_map.dump_occurrences_in_position(get_name(f"{level}_{POSITIONS_SUFFIX}"))
+        if level in all_reports:
+            all_reports[level].dump(get_name(f"{level}_{UNKNOWN_SUFFIX}"))
+        for weights_name in weights_names:
+            a_map.weights = weights_map[weights_name]
+            a_map.dump_matrix(get_name(f"{level}_{MATRIX_SUFFIX}_{weights_name}", matrix_extension), matrix_format)
+    return all_maps
+
+
+def run_task(task: ResultsTaskType) -> StringOrPath:
+    """generate_task_results dans un processus de calcul : les cartes restent dans le processus, seul le nom du jeu
+    de cartes traité est renvoyé"""
+    generate_task_results(task)
+    return task[1]
+
+
+def generate_all_results(
+    output_dir: StringOrPath,
+    cog_maps_filenames: Sequence[StringOrPath],
+    thesaurus_filename: StringOrPath,
     weights_filename: StringOrPath,
     with_unknown: bool = False,
-    weights_name: str = DEFAULT_WEIGHTS_NAME,
-) -> list[Tuple[Level, CogMaps]]:
-    """ "Wrapper principal utilisé par la CLI et la GUI"""
+    weights_names: Union[str, Sequence[str]] = DEFAULT_WEIGHTS_NAME,
+    matrix_format: str = DEFAULT_MATRIX_FORMAT,
+    cache_dir: Optional[StringOrPath] = None,
+    jobs: Optional[int] = 1,
+    return_maps: bool = True,
+) -> Optional[dict[StringOrPath, dict[Level, CogMaps]]]:
+    """Produit les résultats de plusieurs jeux de cartes : les jeux sont indépendants, et répartis sur jobs processus
+    (tous les coeurs si jobs vaut None ou 0, en séquence si 1), chaque processus ne chargeant que ses jeux.
+
+    Le thésaurus et les poids sont chargés une seule fois et transmis une fois à chaque processus.
+    Renvoie les cartes de chaque niveau de chaque jeu si return_maps, rien sinon : en parallèle, elles sont alors
+    relues dans le processus principal (depuis le cache disque s'il y en a un)."""
     logger.debug(f"output_dir = {output_dir}")
-    logger.debug(f"cog_maps_filename = {cog_maps_filename}")
+    logger.debug(f"cog_maps_filenames = {cog_maps_filenames}")
     logger.debug(f"thesaurus_filename = {thesaurus_filename}")
     logger.debug(f"weights_filename = {weights_filename}")
     logger.debug(f"with_unknown = {with_unknown}")
+    logger.debug(f"matrix_format = {matrix_format}")
+    logger.debug(f"cache_dir = {cache_dir}")
+    logger.debug(f"jobs = {jobs}")
 
     # crée le dossier de sortie si besoin
     Path(output_dir).mkdir(parents=True, exist_ok=True)
-    # application partielle qui génère un préfixe de nom
-    get_name = partial(gen_filename, output_dir, cog_maps_filename)
-    # constantes
-    occurrences_suffix = "occurrences"
-    positions_suffix = "positions"
-    matrix_suffix = "matrice"
-    unknown_suffix = "inconnus"
-
-    # chargement des entrées
-    the_thesaurus = CogMaps.load_thesaurus_map(thesaurus_filename)
-    the_weights = CogMaps.load_weights(weights_filename)
-    the_cog_maps = CogMaps(cog_maps_filename)
-    all_maps, all_reports = the_cog_maps.apply_many(the_thesaurus, with_unknown=with_unknown)
-
-    # on produit tout les résultats
-    for a_lvl, a_map in all_maps.items():
-        a_map.dump(get_name(a_lvl))
-        a_map.dump_occurrences_many(get_name(f"{a_lvl}_{occurrences_suffix}"), the_weights)
-        a_map.dump_occurrences_in_position(get_name(f"{a_lvl}_{positions_suffix}"))
-        a_map.weights = the_weights[weights_name]
-        a_map.dump_matrix(get_name(f"{a_lvl}_{matrix_suffix}_{weights_name}"))
-
-    for a_lvl, a_report in all_reports.items():
-        a_report.dump(get_name(f"{a_lvl}_{unknown_suffix}"))
+    if isinstance(weights_names, str):
+        weights_names = [weights_names]
+
+    # chargement des entrées, depuis le cache disque s'il y en a un
+    if cache_dir is not None:
+        from cog_maps_cache import InputsCache  # pylint: disable=import-outside-toplevel
+
+        inputs_cache = InputsCache(cache_dir)
+        the_thesaurus = inputs_cache.load_thesaurus_map(thesaurus_filename)
+        the_weights = inputs_cache.load_weights(weights_filename)
+    else:
+        the_thesaurus = CogMaps.load_thesaurus_map(thesaurus_filename)
+        the_weights = CogMaps.load_weights(weights_filename)
+    context = (thesaurus_filename, the_thesaurus, the_weights, with_unknown, cache_dir)
+
+    tasks: list[ResultsTaskType] = [
+        (output_dir, filename, weights_names, matrix_format) for filename in cog_maps_filenames
+    ]
+    if jobs == 1:
+        init_worker(*context)
+        results = {task[1]: generate_task_results(task) for task in tasks}
+        WORKER_CONTEXT.clear()
+        return results if return_maps else None
+
+    with ProcessPoolExecutor(max_workers=jobs or None, initializer=init_worker, initargs=context) as executor:
+        for filename in executor.map(run_task, tasks):
+            logger.debug(f"generate_all_results: {filename} done")
+    if not return_maps:
+        return None
+    # les cartes ne passent pas d'un processus à l'autre (leurs valeurs dérivées ne sont pas sérialisables)
+    return {
+        filename: load_levels(filename, thesaurus_filename, with_unknown, cache_dir, the_thesaurus)[0]
+        for filename in cog_maps_filenames
+    }
 
-    return all_maps
+
+def generate_results(
+    output_dir: StringOrPath,
+    cog_maps_filename: StringOrPath,
+    thesaurus_filename: StringOrPath,
+    weights_filename: StringOrPath,
+    with_unknown: bool = False,
+    weights_name: str = DEFAULT_WEIGHTS_NAME,
+    matrix_format: str = DEFAULT_MATRIX_FORMAT,
+    cache_dir: Optional[StringOrPath] = None,
+    jobs: Optional[int] = 1,
+) -> dict[Level, CogMaps]:
+    """ "Wrapper principal utilisé par la CLI et la GUI, pour un seul jeu de cartes, voir generate_all_results"""
+    results = generate_all_results(
+        output_dir,
+        [cog_maps_filename],
+        thesaurus_filename,
+        weights_filename,
+        with_unknown,
+        weights_name,
+        matrix_format,
+        cache_dir,
+        jobs,
+    )
+    return results[cog_maps_filename]  # type: ignore
 
 
 WITH_UNKNOWNS = False
@@ -0,0 +1,201 @@
+# pylint: disable = logging-fstring-interpolation
+"""Cache disque des entrées analysées : poids, thésaurus, cartes et niveaux du thésaurus déjà appliqués
+
+Chaque entrée est rangée dans un dossier nommé par l'empreinte (sha256) du contenu des fichiers sources et des
+paramètres : modifier un fichier source change l'empreinte, l'ancienne entrée n'est simplement plus lue.
+Les tableaux des cartes en colonnes (ids, offsets, word_ids) sont des .npy relus en mémoire projetée (mmap).
+Pour éviter de relire les sources, leur empreinte est retenue tant que leur date de modification et leur taille
+ne changent pas.
+"""
+
+__author__ = "Romuald Thion"
+
+import json
+import logging
+import os
+import shutil
+from hashlib import sha256
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+from cog_maps import (
+    BASE_LVL,
+    CACHE_DIR,
+    LEVELS,
+    ColumnarMaps,
+    CogMaps,
+    Level,
+    StringOrPath,
+    Thesaurus,
+    ThesaurusMapType,
+    WeightsMapType,
+    concepts_filename,
+)
+
+logger = logging.getLogger(f"COGNITIVE_MAP.{__name__}")
+
+# à incrémenter quand le format des entrées change
+CACHE_FORMAT_VERSION = 1
+# la table des empreintes des fichiers sources déjà lus
+DIGESTS_FILENAME = "digests.json"
+# les tableaux d'un stockage en colonnes
+COLUMNS = ("ids", "offsets", "word_ids")
+
+
+class InputsCache:
+    """Cache disque des entrées, dans le dossier directory.
+
+    hits et misses comptent les entrées relues depuis le cache et celles (re)calculées depuis les sources.
+    """
+
+    def __init__(self, directory: StringOrPath = CACHE_DIR):
+        # le dossier n'est créé qu'à la première écriture
+        self.directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self.directory / DIGESTS_FILENAME, encoding="utf-8") as file:
+                self.__digests: dict[str, list] = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.__digests = {}
+
+    def file_digest(self, filename: StringOrPath) -> str:
+        """L'empreinte du contenu d'un fichier source, recalculée seulement si sa date ou sa taille ont changé"""
+        path = Path(filename).resolve()
+        stat = path.stat()
+        known = self.__digests.get(str(path))
+        if known is not None and known[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return known[2]
+        digest = sha256(path.read_bytes()).hexdigest()
+        self.__digests[str(path)] = [stat.st_mtime_ns, stat.st_size, digest]
+        # écriture dans un fichier temporaire puis remplacement : les processus concurrents lisent une table entière
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f"{DIGESTS_FILENAME}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(self.__digests, file)
+        os.replace(tmp, self.directory / DIGESTS_FILENAME)
+        return digest
+
+    def key(self, kind: str, *filenames: StringOrPath, **params) -> str:
+        """L'empreinte d'une entrée : sa nature, le contenu de ses fichiers sources et ses paramètres"""
+        content = [
+            CACHE_FORMAT_VERSION,
+            kind,
+            [self.file_digest(filename) for filename in filenames],
+            sorted(params.items()),
+        ]
+        return sha256(json.dumps(content).encode("utf-8")).hexdigest()
+
+    def __entry(self, key: str, build) -> Path:
+        """Le dossier de l'entrée key, construit via build(dossier) s'il n'existe pas encore"""
+        entry = self.directory / key
+        if entry.is_dir():
+            self.hits += 1
+            return entry
+        self.misses += 1
+        # écriture dans un dossier temporaire, renommé une fois complet : une entrée est entière ou absente
+        tmp = self.directory / f"{key}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        build(tmp)
+        try:
+            tmp.rename(entry)
+        except OSError:
+            # un autre processus a écrit la même entrée entre temps
+            shutil.rmtree(tmp, ignore_errors=True)
+        logger.debug(f"InputsCache: new entry {entry}")
+        return entry
+
+    def load_weights(self, filename: StringOrPath) -> WeightsMapType:
+        """CogMaps.load_weights, via le cache"""
+
+        def build(entry: Path):
+            with open(entry / "weights.json", "w", encoding="utf-8") as file:
+                json.dump(CogMaps.load_weights(filename), file, ensure_ascii=False)
+
+        entry = self.__entry(self.key("weights", filename), build)
+        with open(entry / "weights.json", encoding="utf-8") as file:
+            return {
+                name: {int(pos): value for pos, value in weights.items()} for name, weights in json.load(file).items()
+            }
+
+    def load_thesaurus_map(self, filename: StringOrPath) -> ThesaurusMapType:
+        """CogMaps.load_thesaurus_map, via le cache"""
+
+        def build(entry: Path):
+            with open(entry / "thesaurus.json", "w", encoding="utf-8") as file:
+                json.dump(
+                    {level: dict(thesaurus) for level, thesaurus in CogMaps.load_thesaurus_map(filename).items()},
+                    file,
+                    ensure_ascii=False,
+                )
+
+        entry = self.__entry(self.key("thesaurus", filename), build)
+        with open(entry / "thesaurus.json", encoding="utf-8") as file:
+            return {level: Thesaurus(thesaurus) for level, thesaurus in json.load(file).items()}
+
+    def load_cog_maps(self, filename: StringOrPath) -> CogMaps:
+        """CogMaps(filename), stocké en colonnes, via le cache"""
+
+        def build(entry: Path):
+            save_store(entry, BASE_LVL, CogMaps(filename, columnar=True).cog_maps)  # type: ignore
+
+        entry = self.__entry(self.key("cog_maps", filename), build)
+        return CogMaps.from_store(load_store(entry, BASE_LVL), filename)
+
+    def load_levels(
+        self, cog_maps_filename: StringOrPath, thesaurus_filename: StringOrPath, *, with_unknown=True
+    ) -> Tuple[dict[Level, CogMaps], dict[Level, CogMaps]]:
+        """CogMaps(cog_maps_filename).apply_many(thesaurus, with_unknown=with_unknown), via le cache :
+        les cartes de chaque niveau et les rapports des mots sans image"""
+        thesaurus_map = self.load_thesaurus_map(thesaurus_filename)
+
+        def build(entry: Path):
+            all_maps, all_reports = CogMaps(cog_maps_filename, columnar=True).apply_many(
+                thesaurus_map, with_unknown=with_unknown
+            )
+            for level, a_map in all_maps.items():
+                save_store(entry, level, a_map.cog_maps)  # type: ignore
+            with open(entry / "reports.json", "w", encoding="utf-8") as file:
+                json.dump(
+                    {level: list(report.cog_maps.items()) for level, report in all_reports.items()},
+                    file,
+                    ensure_ascii=False,
+                )
+
+        entry = self.__entry(
+            self.key("levels", cog_maps_filename, thesaurus_filename, with_unknown=with_unknown), build
+        )
+        all_maps = {BASE_LVL: CogMaps.from_store(load_store(entry, BASE_LVL), cog_maps_filename)}
+        all_reports = {}
+        with open(entry / "reports.json", encoding="utf-8") as file:
+            reports = json.load(file)
+        for previous_level, level in zip(LEVELS, LEVELS[1:]):
+            parent = all_maps[previous_level]
+            parent.thesaurus = thesaurus_map[level]
+            all_maps[level] = CogMaps.from_store(load_store(entry, level), concepts_filename(parent.filename), parent)
+            all_reports[level] = CogMaps.from_store(dict(reports[level]), parent=parent)
+        return all_maps, all_reports
+
+    def clear(self) -> None:
+        """Vide le cache"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.__digests = {}
+
+
+def save_store(entry: Path, name: str, store: ColumnarMaps) -> None:
+    """Enregistre un stockage en colonnes : un .npy par tableau et le vocabulaire en json"""
+    for column in COLUMNS:
+        np.save(entry / f"{name}_{column}.npy", getattr(store, column))
+    with open(entry / f"{name}_vocabulary.json", "w", encoding="utf-8") as file:
+        json.dump(store.vocabulary, file, ensure_ascii=False)
+
+
+def load_store(entry: Path, name: str) -> ColumnarMaps:
+    """Relit un stockage en colonnes enregistré par save_store, tableaux en mémoire projetée"""
+    arrays = [np.load(entry / f"{name}_{column}.npy", mmap_mode="r") for column in COLUMNS]
+    with open(entry / f"{name}_vocabulary.json", encoding="utf-8") as file:
+        vocabulary = json.load(file)
+    return ColumnarMaps(*arrays, vocabulary)
@@ -12,8 +12,11 @@ from cog_maps import (
     THESAURUS_FILENAME,
     WEIGHTS_MAP_FILENAME,
     OUTPUT_DIR,
+    CACHE_DIR,
     DEFAULT_WEIGHTS_NAME,
-    generate_results,
+    DEFAULT_MATRIX_FORMAT,
+    MATRIX_FORMATS,
+    generate_all_results,
 )
 
 logging.basicConfig()
@@ -27,8 +30,9 @@ def get_parser():
         "--maps",
         "-m",
         action="store",
-        default=CM_LA_MINE_FILENAME,
-        help=f"fichier csv des cartes cognitives, au format (id; mot 1; mot 2, ...), par défaut '{CM_LA_MINE_FILENAME}'",
+        nargs="+",
+        default=[CM_LA_MINE_FILENAME],
+        help=f"fichier(s) csv des cartes cognitives, au format (id; mot 1; mot 2, ...), par défaut '{CM_LA_MINE_FILENAME}'",
     )
     res.add_argument(
         "--thesaurus",
@@ -48,8 +52,17 @@ def get_parser():
         "--weights-name",
         "-n",
         action="store",
-        default=DEFAULT_WEIGHTS_NAME,
-        help=f"nom de la pondération à utiliser, par défaut '{DEFAULT_WEIGHTS_NAME}'",
+        nargs="+",
+        default=[DEFAULT_WEIGHTS_NAME],
+        help=f"nom(s) de la ou des pondérations des matrices, par défaut '{DEFAULT_WEIGHTS_NAME}'",
+    )
+    res.add_argument(
+        "--matrix-format",
+        "-f",
+        action="store",
+        default=DEFAULT_MATRIX_FORMAT,
+        choices=MATRIX_FORMATS,
+        help=f"format d'export de la matrice de co-occurrences, par défaut '{DEFAULT_MATRIX_FORMAT}'",
     )
     res.add_argument(
         "--output",
@@ -58,6 +71,27 @@ def get_parser():
         default=OUTPUT_DIR,
         help=f"dossier des fichiers de sortie, par défaut '{OUTPUT_DIR}'",
     )
+    res.add_argument(
+        "--cache-dir",
+        "-c",
+        action="store",
+        default=CACHE_DIR,
+        help=f"dossier du cache des entrées déjà analysées, par défaut '{CACHE_DIR}'",
+    )
+    res.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="relit et recalcule toutes les entrées, sans utiliser ni remplir le cache",
+    )
+    res.add_argument(
+        "--jobs",
+        "-j",
+        action="store",
+        type=int,
+        default=1,
+        help="nombre de processus de calcul en parallèle, 0 pour tous les coeurs, par défaut 1",
+    )
     res.add_argument(
         "--unknown",
         "-u",
@@ -93,9 +127,10 @@ if __name__ == "__main__":
 
     Path(args.output).mkdir(parents=True, exist_ok=True)
 
-    if not Path(args.maps).is_file():
-        logger.critical(f"Le fichier {args.maps} est introuvable")
-        sys.exit(1)
+    for maps in args.maps:
+        if not Path(maps).is_file():
+            logger.critical(f"Le fichier {maps} est introuvable")
+            sys.exit(1)
     if not Path(args.thesaurus).is_file():
         logger.critical(f"Le fichier {args.thesaurus} est introuvable")
         sys.exit(1)
@@ -103,4 +138,4 @@ if __name__ == "__main__":
         logger.critical(f"Le fichier {args.weights} est introuvable")
         sys.exit(1)
 
-    generate_results(output_dir=args.output, cog_maps_filename=args.maps, thesaurus_filename=args.thesaurus, weights_filename=args.weights, with_unknown=args.unknown, weights_name=args.weights_name)
+    generate_all_results(output_dir=args.output, cog_maps_filenames=args.maps, thesaurus_filename=args.thesaurus, weights_filename=args.weights, with_unknown=args.unknown, weights_names=args.weights_name, matrix_format=args.matrix_format, cache_dir=None if args.no_cache else args.cache_dir, jobs=args.jobs, return_maps=False)
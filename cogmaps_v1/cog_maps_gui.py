@@ -5,17 +5,20 @@
 __author__ = "Romuald Thion"
 
 import logging
+import multiprocessing
+import os
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, ttk, scrolledtext
 from cog_maps import (
-    generate_results,
+    generate_all_results,
     INPUT_DIR,
     CM_LA_MINE_FILENAME,
     CM_FUTUR_FILENAME,
     THESAURUS_FILENAME,
     WEIGHTS_MAP_FILENAME,
     OUTPUT_DIR,
+    CACHE_DIR,
 )
 
 # violemment repris de
@@ -85,9 +88,21 @@ def uploader(variable, *, directory=False):
 
 
 def compute(_event=None):
-    """Lance le calcul"""
-    generate_results(output_dir.get(), cm_la_mine.get(), thesaurus.get(), weights.get(), with_unknown.get())
-    generate_results(output_dir.get(), cm_mine_futur.get(), thesaurus.get(), weights.get(), with_unknown.get())
+    """Lance le calcul, des deux jeux de cartes à la fois"""
+    # nombre de processus de calcul : ce script n'est pas protégé par if __name__ == "__main__", un processus
+    # lancé par spawn ou forkserver le réexécuterait et ouvrirait une nouvelle fenêtre, on reste alors en séquence.
+    # Lu au moment du calcul, pour ne pas figer la méthode de lancement dès l'import
+    jobs = os.cpu_count() if multiprocessing.get_start_method() == "fork" else 1
+    generate_all_results(
+        output_dir.get(),
+        [cm_la_mine.get(), cm_mine_futur.get()],
+        thesaurus.get(),
+        weights.get(),
+        with_unknown.get(),
+        cache_dir=CACHE_DIR,
+        jobs=jobs,
+        return_maps=False,
+    )
 
 
 # découpage en 3 panneaux
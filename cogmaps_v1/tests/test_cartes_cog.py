@@ -4,12 +4,34 @@
 # %%
 
 from collections import defaultdict, Counter
+from itertools import product
 from pathlib import Path
 import pytest
-from cog_maps import CogMaps, CSV_PARAMS, ENCODING, DEFAULT_WEIGHTS_NAME
+import numpy as np
+from scipy import sparse
+from cog_maps import (
+    generate_all_results,
+    normalize_sym,
+    labels_to_clusters,
+    CogMaps,
+    Thesaurus,
+    ThesaurusTree,
+    CSV_PARAMS,
+    ENCODING,
+    DEFAULT_WEIGHTS_NAME,
+    DENSE_FORMAT,
+    TRIPLETS_FORMAT,
+    NPZ_FORMAT,
+    LEVELS,
+    BASE_LVL,
+    CONCEPT_LVL,
+    DEFAULT_CONCEPT,
+)
+from cog_maps_cache import InputsCache
 
 COGMAPS_FILENAME = Path("input/cartes_cog_small.csv")
 WEIGHTS_FILENAME = Path("input/coefficients.csv")
+THESAURUS_FILENAME = Path("input/thesaurus.csv")
 DUMP_CONTENT = """1;pollution;inondation;boom;travail;retombée
 2;richesse;malédiction;travail;destruction;histoire;frein;blocage;coutumier
 4;travail;pollution;plainte
@@ -121,3 +143,437 @@ class TestCognitiveMap:
         test_maps = CogMaps(COGMAPS_FILENAME)
         filename = tmp_path / "dump_position.csv"
         test_maps.dump_occurrences_in_position(filename)
+
+    def test_matrix_same_as_naive(self):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        test_maps.weights = CogMaps.load_weights(WEIGHTS_FILENAME)[DEFAULT_WEIGHTS_NAME]
+        # l'ancien calcul, en python pur
+        naive = defaultdict(lambda: defaultdict(float))
+        for words in test_maps.cog_maps.values():
+            for (pos_row, word_row), (pos_col, word_col) in product(enumerate(words), enumerate(words)):
+                distance = abs(pos_row - pos_col)
+                naive[word_row][word_col] += test_maps.weights.get(distance, 0.0) if distance else 1.0
+        for word_row, row in naive.items():
+            for word_col, value in row.items():
+                assert test_maps.matrix[word_row][word_col] == pytest.approx(value)
+
+        matrix, vocabulary = test_maps.cooccurrences(dense=True)
+        assert vocabulary == list(test_maps.words)
+        assert matrix.shape == (42, 42)
+        assert (matrix == matrix.T).all()
+        i, j = vocabulary.index("pollution"), vocabulary.index("travail")
+        assert matrix[i, j] == pytest.approx(naive["pollution"]["travail"])
+
+    def test_dump_matrix_formats(self, tmp_path):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        test_maps.dump_matrix(tmp_path / "dense.csv", DENSE_FORMAT)
+        test_maps.dump_matrix(tmp_path / "triplets.csv", TRIPLETS_FORMAT)
+        test_maps.dump_matrix(tmp_path / "matrix.npz", NPZ_FORMAT)
+        # la matrice complète par défaut
+        test_maps.dump_matrix(tmp_path / "default.csv")
+        assert (tmp_path / "default.csv").read_bytes() == (tmp_path / "dense.csv").read_bytes()
+
+        dense_lines = (tmp_path / "dense.csv").read_text(encoding=ENCODING).splitlines()
+        words = dense_lines[0].split(CSV_PARAMS["delimiter"])[1:]
+        assert words == sorted(test_maps.words)
+        dense = {
+            (cols[0], word): float(value)
+            for cols in (line.split(CSV_PARAMS["delimiter"]) for line in dense_lines[1:])
+            for word, value in zip(words, cols[1:])
+        }
+        triplets = {
+            (cols[0], cols[1]): float(cols[2])
+            for cols in (line.split(CSV_PARAMS["delimiter"]) for line in (tmp_path / "triplets.csv").read_text(encoding=ENCODING).splitlines()[1:])
+        }
+        # seules les cases non nulles sont dans le format creux
+        assert triplets == {cell: value for cell, value in dense.items() if value}
+
+        matrix, vocabulary = CogMaps.load_matrix(tmp_path / "matrix.npz")
+        assert vocabulary == test_maps.vocabulary
+        assert (matrix != test_maps.sparse_matrix).nnz == 0
+
+        with pytest.raises(ValueError):
+            test_maps.dump_matrix(tmp_path / "matrix.txt", "txt")
+
+    def test_occurrences_many(self):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        weights_map = CogMaps.load_weights(WEIGHTS_FILENAME)
+        index = test_maps.index
+        table = test_maps.occurrences_many(weights_map)
+        assert table.shape == (42, len(weights_map))
+        for j, weights in enumerate(weights_map.values()):
+            test_maps.weights = weights
+            # changer les poids ne reconstruit pas l'index
+            assert test_maps.index is index
+            for i, word in enumerate(test_maps.vocabulary):
+                assert table[i, j] == pytest.approx(test_maps.occurrences[word])
+
+    def test_cache_stats(self):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        for weights in CogMaps.load_weights(WEIGHTS_FILENAME).values():
+            test_maps.weights = weights
+            assert test_maps.sparse_matrix.nnz > 0
+            assert len(test_maps.occurrences) == 42
+        stats = test_maps.cache_stats
+        # les attributs indépendants des poids ne sont calculés qu'une fois
+        assert stats["all_codes"].misses == stats["positions_counts"].misses == 1
+        assert stats["positions_counts"].hits > 0
+        assert stats["sparse_matrix"].recomputes == stats["sparse_matrix"].invalidations > 0
+        test_maps.cog_maps = {1: ["a", "b"]}
+        assert stats["all_codes"].invalidations == 1
+        assert test_maps.vocabulary == ["a", "b"]
+        with pytest.raises(TypeError, match=r".*assignment.*"):
+            test_maps.sparse_matrix = None
+
+    def test_results_cache(self):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        weights_map = CogMaps.load_weights(WEIGHTS_FILENAME)
+        test_maps.weights = weights_map["inverse"]
+        inverse_matrix = test_maps.sparse_matrix
+        test_maps.weights = weights_map["arithmetique"]
+        assert test_maps.sparse_matrix is not inverse_matrix
+        # retour à une pondération déjà vue : pas de recalcul
+        test_maps.weights = dict(weights_map["inverse"])
+        assert test_maps.sparse_matrix is inverse_matrix
+        assert test_maps.cache_stats["sparse_matrix"].recomputes == 1
+        assert test_maps.results_stats.hits >= 1
+
+        # budget trop petit : tout est évincé
+        test_maps.cache_budget = 0
+        test_maps.weights = weights_map["pos_3"]
+        assert test_maps.sparse_matrix.nnz > 0
+        test_maps.weights = weights_map["inverse"]
+        assert test_maps.sparse_matrix is not inverse_matrix
+        assert test_maps.results_stats.evictions > 0
+
+    def test_add_remove_maps(self):
+        full_maps = CogMaps.load_cog_maps(COGMAPS_FILENAME)
+        weights = CogMaps.load_weights(WEIGHTS_FILENAME)[DEFAULT_WEIGHTS_NAME]
+        test_maps = CogMaps()
+        test_maps.cog_maps = {ident: words for ident, words in full_maps.items() if ident < 5}
+        test_maps.weights = weights
+        # on force le calcul de tous les attributs avant les mises à jour par différence
+        _ = test_maps.matrix, test_maps.occurrences, test_maps.occurrences_in_position, test_maps.positions_counts
+        test_maps.add_maps({ident: words for ident, words in full_maps.items() if ident >= 5})
+        test_maps.remove_maps([2, 9])
+        with pytest.raises(ValueError):
+            test_maps.add_maps({1: ["mot"]})
+        with pytest.raises(KeyError):
+            test_maps.remove_maps([2])
+
+        ref_maps = CogMaps()
+        ref_maps.cog_maps = {ident: words for ident, words in full_maps.items() if ident not in (2, 9)}
+        ref_maps.weights = weights
+        assert test_maps.cache_stats["sparse_matrix"].recomputes == 0
+        assert test_maps.index == ref_maps.index
+        assert test_maps.occurrences == pytest.approx(ref_maps.occurrences)
+        assert test_maps.occurrences_in_position == ref_maps.occurrences_in_position
+        for word_row in ref_maps.words:
+            assert test_maps.matrix[word_row] == pytest.approx(ref_maps.matrix[word_row])
+        # les mots disparus restent dans le vocabulaire, avec des lignes vides
+        assert set(test_maps.vocabulary) > set(ref_maps.vocabulary)
+        ids = [test_maps.vocabulary.index(word) for word in ref_maps.vocabulary]
+        assert (test_maps.positions_counts[ids] == ref_maps.positions_counts).all()
+        assert test_maps.sparse_matrix.nnz == ref_maps.sparse_matrix.nnz
+
+    @pytest.mark.parametrize("from_results", [False, True])
+    def test_add_remove_maps_without_codes(self, from_results):
+        full_maps = CogMaps.load_cog_maps(COGMAPS_FILENAME)
+        test_maps = CogMaps()
+        test_maps.cog_maps = {ident: words for ident, words in full_maps.items() if ident < 5}
+        if from_results:
+            # positions_counts et sparse_matrix relus du cache des résultats, sans codes ni vocabulary
+            _ = test_maps.positions_counts, test_maps.sparse_matrix
+            test_maps.invalidate()
+            _ = test_maps.positions_counts, test_maps.sparse_matrix
+            assert "codes" not in test_maps._cache.values and "vocabulary" not in test_maps._cache.values
+        else:
+            _ = test_maps.sparse_matrix
+        test_maps.add_maps({ident: words for ident, words in full_maps.items() if ident >= 5})
+        test_maps.remove_maps([2])
+
+        ref_maps = CogMaps()
+        ref_maps.cog_maps = {ident: words for ident, words in full_maps.items() if ident != 2}
+        # les mots disparus restent dans le vocabulaire
+        nb_words = len(test_maps.vocabulary)
+        assert set(test_maps.vocabulary) >= set(ref_maps.vocabulary)
+        assert test_maps.sparse_matrix.shape == (nb_words, nb_words)
+        assert test_maps.sparse_matrix.nnz == ref_maps.sparse_matrix.nnz
+        for word_row in ref_maps.words:
+            assert test_maps.matrix[word_row] == pytest.approx(ref_maps.matrix[word_row])
+        assert test_maps.occurrences == pytest.approx(ref_maps.occurrences)
+
+    def test_add_maps_in_partition(self):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        test_maps.partition = [1, 2]
+        _ = test_maps.sparse_matrix, test_maps.occurrences
+        # la nouvelle carte est hors de la partition, ses mots entrent tout de même dans le vocabulaire
+        test_maps.add_maps({20: ["brandnew", "pollution"]})
+        assert "brandnew" in test_maps.vocabulary and "brandnew" not in test_maps.occurrences
+        weights = CogMaps.load_weights(WEIGHTS_FILENAME)[DEFAULT_WEIGHTS_NAME]
+        test_maps.weights = weights
+        test_maps.partition = [1, 2, 20]
+
+        ref_maps = CogMaps(COGMAPS_FILENAME)
+        ref_maps.add_maps({20: ["brandnew", "pollution"]})
+        ref_maps.weights = weights
+        ref_maps.partition = [1, 2, 20]
+        assert test_maps.occurrences == pytest.approx(ref_maps.occurrences)
+        assert (test_maps.sparse_matrix != ref_maps.sparse_matrix).nnz == 0
+
+    def test_remove_maps_from_file(self):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        codes = test_maps.codes
+        test_maps.remove_maps([1, 10])
+        assert len(test_maps) == 7
+        assert (test_maps.codes == codes[1:-1]).all()
+
+    def test_partition_view(self):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        test_maps.weights = CogMaps.load_weights(WEIGHTS_FILENAME)[DEFAULT_WEIGHTS_NAME]
+        for partition in ([1, 4, 7], [2, 5, 8, 9], [3, 10, 1]):
+            test_maps.partition = partition
+            ref_maps = CogMaps()
+            ref_maps.cog_maps = {ident: words for ident, words in CogMaps.load_cog_maps(COGMAPS_FILENAME).items() if ident in partition}
+            ref_maps.weights = test_maps.weights
+            assert dict(test_maps.cog_maps) == ref_maps.cog_maps
+            assert len(test_maps) == len(partition) - (3 in partition)
+            assert test_maps.index == ref_maps.index
+            assert test_maps.occurrences == pytest.approx(ref_maps.occurrences)
+            for word in ref_maps.words:
+                assert test_maps.matrix[word] == pytest.approx(ref_maps.matrix[word])
+        # les contributions par carte ne sont calculées qu'une fois pour toutes les partitions
+        assert test_maps.cache_stats["map_pairs"].misses == 1
+        test_maps.partition = None
+        assert len(test_maps) == 9
+
+    def test_aggregate_segments(self):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        segments = {"a": [1, 4, 7], "b": [2, 5, 8, 9], "c": [1, 10]}
+        aggregates = test_maps.aggregate_segments(segments, with_matrix=True)
+        assert aggregates.labels == ["a", "b", "c"]
+        assert aggregates.sizes.tolist() == [3, 4, 2]
+        assert aggregates.matrices.shape == (3, 42, 42)
+        for k, partition in enumerate(segments.values()):
+            test_maps.partition = partition
+            width = test_maps.positions_counts.shape[1]
+            assert (aggregates.positions[k, :, :width] == test_maps.positions_counts).all()
+            assert (aggregates.matrices[k] == pytest.approx(test_maps.sparse_matrix.toarray()))
+            for word, value in test_maps.occurrences.items():
+                assert aggregates.occurrences[k, test_maps.vocabulary.index(word)] == pytest.approx(value)
+
+        # une étiquette par carte
+        labels = ["x" if ident % 2 else "y" for ident in test_maps.all_ids]
+        by_label = test_maps.aggregate_segments(labels)
+        assert by_label.labels == ["x", "y"]
+        assert by_label.positions.sum() == sum(len(words) for words in CogMaps.load_cog_maps(COGMAPS_FILENAME).values())
+
+    @pytest.mark.parametrize("with_unknown", [True, False])
+    def test_apply_many_same_as_apply(self, with_unknown):
+        thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        all_maps, all_reports = test_maps.apply_many(thesaurus, with_unknown=with_unknown)
+        # référence : application successive de chaque niveau
+        ref_maps = CogMaps(COGMAPS_FILENAME)
+        for previous, level in zip(LEVELS, LEVELS[1:]):
+            ref_maps.thesaurus = thesaurus[level]
+            ref_maps, ref_report = ref_maps.apply(with_unknown=with_unknown)
+            assert dict(all_maps[level].cog_maps) == ref_maps.cog_maps
+            assert all_maps[level].filename == ref_maps.filename
+            assert all_reports[level].cog_maps == ref_report.cog_maps
+            assert all_maps[level].index == ref_maps.index
+            assert all_maps[previous].thesaurus is thesaurus[level]
+
+    def test_thesaurus_frozen(self):
+        thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
+        sizes = {level: len(a_thesaurus) for level, a_thesaurus in thesaurus.items()}
+        for _ in range(2):
+            test_maps = CogMaps(COGMAPS_FILENAME)
+            test_maps.apply_many(thesaurus)
+            test_maps.thesaurus = thesaurus[CONCEPT_LVL]
+            test_maps.apply()
+        # les mots inconnus n'ont pas été ajoutés
+        assert {level: len(a_thesaurus) for level, a_thesaurus in thesaurus.items()} == sizes
+        concepts = thesaurus[CONCEPT_LVL]
+        assert "mot inconnu" not in concepts
+        assert concepts["mot inconnu"] == DEFAULT_CONCEPT
+        assert concepts.get("mot inconnu") is None
+        assert set(concepts.values()) == set(concepts.images)
+        with pytest.raises(TypeError):
+            concepts["mot inconnu"] = "concept"  # type: ignore
+        strict = Thesaurus(concepts, unknown=None)
+        assert strict == concepts
+        with pytest.raises(KeyError):
+            strict["mot inconnu"]  # pylint: disable=pointless-statement
+
+    def test_thesaurus_tree(self):
+        thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
+        tree = ThesaurusTree(thesaurus)
+        assert tree.nodes[0] == ("racine", "racine") and tree.parent(0) is None
+        assert len(tree) == 1 + len(set(thesaurus[LEVELS[-1]].values())) + sum(map(len, thesaurus.values()))
+        # un parent précède ses fils, qui sont contigus
+        for node in range(len(tree)):
+            for child in tree.children(node):
+                assert tree.parent(child) == node < child
+                assert tree.depths[child] == tree.depths[node] + 1
+        assert [len(tree.depth_range(depth)) for depth in range(len(LEVELS) + 1)] == list(np.bincount(tree.depths))
+        # identifiants stables, quel que soit l'ordre du thésaurus
+        reverse = {level: dict(reversed(list(a_thesaurus.items()))) for level, a_thesaurus in thesaurus.items()}
+        assert ThesaurusTree(reverse).nodes == tree.nodes
+        # agrégation des mots énoncés vers chaque niveau
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        test_maps.weights = CogMaps.load_weights(WEIGHTS_FILENAME)[DEFAULT_WEIGHTS_NAME]
+        all_maps, _ = test_maps.apply_many(thesaurus, with_unknown=False)
+        weights = tree.node_weights({level: a_map.occurrences for level, a_map in all_maps.items()})
+        leaves = np.where(tree.depths == len(LEVELS), np.nan_to_num(weights), 0.0)
+        totals = tree.aggregate(leaves)
+        assert np.allclose(totals[1:], np.nan_to_num(weights)[1:])
+        assert np.isclose(totals[0], sum(all_maps[BASE_LVL].occurrences.values()))
+        internal = tree.depths < len(LEVELS)
+        assert np.allclose(tree.children_sums(totals)[internal], totals[internal])
+
+    def test_load_cog_maps_chunks(self):
+        vocabulary = {}
+        chunks = list(CogMaps.load_cog_maps_chunks(COGMAPS_FILENAME, vocabulary, chunk_size=4))
+        assert [len(chunk) for chunk in chunks] == [4, 4, 1]
+        assert chunks[0].word_ids.dtype == np.int32
+        test_maps = CogMaps.from_chunks(chunks, vocabulary, COGMAPS_FILENAME)
+        ref_maps = CogMaps(COGMAPS_FILENAME)
+        assert dict(test_maps.cog_maps) == ref_maps.cog_maps
+        assert test_maps.vocabulary == ref_maps.vocabulary
+        # comptages et matrice sommés par morceaux, sans recalcul
+        assert (test_maps.positions_counts == ref_maps.positions_counts).all()
+        assert (test_maps.sparse_matrix != ref_maps.sparse_matrix).nnz == 0
+        assert test_maps.occurrences == pytest.approx(ref_maps.occurrences)
+        assert test_maps.cache_stats["map_pairs"].misses == 0
+        with pytest.raises(ValueError):
+            CogMaps.from_chunks(chunks + chunks[:1], vocabulary)
+        # mise à jour par différence des valeurs placées par from_chunks
+        test_maps.add_maps({99: ["pollution", "zzz"]})
+        ref_maps.add_maps({99: ["pollution", "zzz"]})
+        assert test_maps.sparse_matrix.shape == (len(vocabulary) + 1, len(vocabulary) + 1)
+        assert (test_maps.sparse_matrix != ref_maps.sparse_matrix).nnz == 0
+        assert test_maps.occurrences["zzz"] == 1.0
+        assert test_maps.occurrences == pytest.approx(ref_maps.occurrences)
+
+    def test_load_duplicate_ids(self, tmp_path):
+        filename = tmp_path / "duplicates.csv"
+        filename.write_text("1;pollution;nickel\n2;mer\n1;travail\n", encoding=ENCODING)
+        with pytest.raises(ValueError):
+            CogMaps.load_cog_maps(filename)
+        with pytest.raises(ValueError):
+            CogMaps(filename, columnar=True)
+        with pytest.raises(ValueError):
+            vocabulary = {}
+            CogMaps.from_chunks(CogMaps.load_cog_maps_chunks(filename, vocabulary, chunk_size=2), vocabulary)
+
+    def test_columnar_store(self):
+        test_maps = CogMaps(COGMAPS_FILENAME, columnar=True)
+        ref_maps = CogMaps(COGMAPS_FILENAME)
+        assert dict(test_maps.cog_maps) == ref_maps.cog_maps
+        assert test_maps.index == ref_maps.index
+        assert list(test_maps.words) == list(ref_maps.words)
+        assert test_maps.occurrences_in_position == ref_maps.occurrences_in_position
+        assert test_maps.occurrences == pytest.approx(ref_maps.occurrences)
+        # les modifications repassent par le dictionnaire des cartes
+        test_maps.add_maps({11: ["pollution", "nouveau"]})
+        ref_maps.add_maps({11: ["pollution", "nouveau"]})
+        test_maps.remove_maps([1, 4])
+        ref_maps.remove_maps([1, 4])
+        assert dict(test_maps.cog_maps) == ref_maps.cog_maps
+        assert test_maps.index == ref_maps.index
+        assert test_maps.occurrences == pytest.approx(ref_maps.occurrences)
+
+    def test_inputs_cache(self, tmp_path):
+        inputs_cache = InputsCache(tmp_path / "cache")
+        # le dossier n'est créé qu'à la première écriture
+        assert not (tmp_path / "cache").exists()
+        thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
+        ref_maps, ref_reports = CogMaps(COGMAPS_FILENAME).apply_many(thesaurus, with_unknown=False)
+        for _ in range(2):
+            all_maps, all_reports = inputs_cache.load_levels(COGMAPS_FILENAME, THESAURUS_FILENAME, with_unknown=False)
+            for level in LEVELS:
+                assert dict(all_maps[level].cog_maps) == dict(ref_maps[level].cog_maps)
+                assert all_maps[level].filename == ref_maps[level].filename
+            for level, report in ref_reports.items():
+                assert all_reports[level].cog_maps == report.cog_maps
+        # le thesaurus la première fois, puis le thesaurus et les niveaux
+        assert (inputs_cache.misses, inputs_cache.hits) == (2, 2)
+        assert inputs_cache.load_weights(WEIGHTS_FILENAME) == CogMaps.load_weights(WEIGHTS_FILENAME)
+
+        # un fichier modifié n'est plus servi par le cache
+        filename = tmp_path / "cartes.csv"
+        filename.write_text(DUMP_CONTENT, encoding=ENCODING)
+        assert len(inputs_cache.load_cog_maps(filename)) == 9
+        filename.write_text(DUMP_CONTENT + "11;pollution\n", encoding=ENCODING)
+        test_maps = inputs_cache.load_cog_maps(filename)
+        assert test_maps.cog_maps[11] == ["pollution"]
+        assert inputs_cache.misses == 5
+        # la table des empreintes est remplacée d'un bloc, sans fichier temporaire restant
+        assert not list((tmp_path / "cache").glob("*.tmp-*"))
+        assert InputsCache(tmp_path / "cache").file_digest(filename) == inputs_cache.file_digest(filename)
+
+    def test_materialize_matrix(self, tmp_path):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        test_maps.weights = CogMaps.load_weights(WEIGHTS_FILENAME)[DEFAULT_WEIGHTS_NAME]
+        filename = test_maps.materialize_matrix(tmp_path / "matrice.npy")
+        matrix, words = CogMaps.attach_matrix(filename)
+        assert isinstance(matrix, np.memmap)
+        assert words == sorted(test_maps.words)
+        for (i, row_word), (j, col_word) in product(enumerate(words), repeat=2):
+            assert matrix[i, j] == test_maps.matrix[row_word][col_word]
+        # dans un ordre donné
+        words = words[::-1][:5]
+        test_maps.materialize_matrix(filename, words)
+        matrix, attached_words = CogMaps.attach_matrix(filename)
+        assert attached_words == words
+        assert (matrix == test_maps.dense_matrix(words)[0]).all()
+
+    @pytest.mark.parametrize("spectral", [False, True])
+    def test_clusterize(self, spectral):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        test_maps.weights = CogMaps.load_weights(WEIGHTS_FILENAME)[DEFAULT_WEIGHTS_NAME]
+        matrix, words = test_maps.dense_matrix()
+        # normalisation creuse, comme diag^-1/2 @ m @ diag^-1/2
+        dsqrt = np.diag(np.power(matrix.diagonal(), -0.5))
+        assert np.allclose(normalize_sym(sparse.csr_matrix(matrix)).toarray(), dsqrt @ matrix @ dsqrt)
+        clusters = test_maps.clusterize(3, normalize=True, spectral=spectral, random_state=0)
+        assert list(clusters) == [0, 1, 2]
+        assert sorted(word for cluster in clusters.values() for word in cluster) == words
+        assert clusters == test_maps.clusterize(3, normalize=True, spectral=spectral, random_state=0)
+        # dans l'ordre des mots donnés
+        clusters = test_maps.clusterize(3, words[::-1], random_state=0)
+        for cluster in clusters.values():
+            assert cluster == sorted(cluster, reverse=True)
+
+    def test_clusterize_sweep(self):
+        test_maps = CogMaps(COGMAPS_FILENAME)
+        test_maps.weights = CogMaps.load_weights(WEIGHTS_FILENAME)[DEFAULT_WEIGHTS_NAME]
+        results, words = test_maps.clusterize_sweep([3, 2], normalize=True, random_state=0)
+        assert list(results) == [2, 3] and words == sorted(test_maps.words)
+        for n_clusters, result in results.items():
+            assert result.n_clusters == n_clusters and len(result.labels) == len(words)
+            assert -1 <= result.silhouette <= 1 and -0.5 <= result.modularity <= 1
+            # même résultat qu'un clustering seul
+            clusters = test_maps.clusterize(n_clusters, normalize=True, random_state=0)
+            assert labels_to_clusters(result.labels, words) == clusters
+        # en parallèle, avec plongement spectral
+        serial, _ = test_maps.clusterize_sweep([2, 3], spectral=True, random_state=0)
+        parallel, _ = test_maps.clusterize_sweep([2, 3], spectral=True, random_state=0, jobs=2)
+        assert all((serial[k].labels == parallel[k].labels).all() for k in serial)
+
+    def test_generate_all_results_parallel(self, tmp_path):
+        datasets = [COGMAPS_FILENAME, Path("input/cartes_cog_small_cooc.csv")]
+        params = {"weights_names": [DEFAULT_WEIGHTS_NAME, "inverse"], "with_unknown": True}
+        serial = generate_all_results(tmp_path / "serial", datasets, THESAURUS_FILENAME, WEIGHTS_FILENAME, jobs=1, **params)
+        parallel = generate_all_results(
+            tmp_path / "parallel", datasets, THESAURUS_FILENAME, WEIGHTS_FILENAME, jobs=2, return_maps=False, **params
+        )
+        assert parallel is None
+        assert set(serial) == set(datasets) and set(serial[COGMAPS_FILENAME]) == set(LEVELS)
+        files = sorted(path.name for path in (tmp_path / "serial").iterdir())
+        # 2 jeux x 4 niveaux x (cartes, occurrences, positions, 2 matrices) + 2 jeux x 3 rapports
+        assert len(files) == 2 * 4 * 5 + 2 * 3
+        assert files == sorted(path.name for path in (tmp_path / "parallel").iterdir())
+        for name in files:
+            assert (tmp_path / "serial" / name).read_bytes() == (tmp_path / "parallel" / name).read_bytes()
@@ -0,0 +1,65 @@
+# pylint: disable = logging-fstring-interpolation
+"""Mesure du temps de dessin d'un graphe de la gallerie par moteur : graphviz (sous-processus) ou networkx (dans le
+processus), et du temps de la seule mise en style sur le plus gros graphe du niveau de base"""
+
+__author__ = "Romuald Thion"
+
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from cog_maps import CM_LA_MINE_FILENAME, THESAURUS_FILENAME, WEIGHTS_MAP_FILENAME
+from cog_maps_cache import InputsCache
+from draw_graphviz import BACKENDS, DEFAULT_GV_ARGS, draw_graphviz, style_graph
+from vizu_graphs_gallerie import ThresholdSweep
+
+# les graphes mesurés : niveau, poids et seuils, du plus dense au plus petit
+LEVEL = "mother"
+WEIGHTS_NAME = "arithmetique"
+THRESHOLDS = [6.0, 8.0, 10.0, 12.0]
+REPEAT = 3
+# le plus gros graphe : niveau de base, seuil minimal
+STYLE_LEVEL = "base"
+STYLE_THRESHOLD = 1.0
+
+
+def measure(draw, graph, destination) -> float:
+    """Meilleur temps en ms sur REPEAT dessins du graphe"""
+    durations = []
+    for _ in range(REPEAT):
+        start = time.perf_counter_ns()
+        draw(graph, destination)
+        durations.append((time.perf_counter_ns() - start) / 10 ** 6)
+    return min(durations)
+
+
+if __name__ == "__main__":
+    inputs_cache = InputsCache()
+    all_maps, _ = inputs_cache.load_levels(CM_LA_MINE_FILENAME, THESAURUS_FILENAME)
+    the_weights = inputs_cache.load_weights(WEIGHTS_MAP_FILENAME)[WEIGHTS_NAME]
+    a_map = all_maps[LEVEL]
+    a_map.weights = the_weights
+    sweep = ThresholdSweep(a_map)
+    print(f"{'moteur':<10} {'seuil':>6} {'noeuds':>7} {'arcs':>6} {'temps (ms)':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in BACKENDS:
+            draw = partial(draw_graphviz, fontsize="proportional", node_color="weight", backend=backend)
+            for threshold, graph in sweep.graphs(THRESHOLDS):
+                try:
+                    duration = f"{measure(draw, graph, Path(tmp) / 'graph.svg'):>12.1f}"
+                except ImportError as error:
+                    duration = f"{'indisponible':>12} ({error})"
+                print(
+                    f"{backend:<10} {threshold:>6} {graph.number_of_nodes():>7} {graph.number_of_edges():>6} {duration}"
+                )
+
+    base_map = all_maps[STYLE_LEVEL]
+    base_map.weights = the_weights
+    base_graph = ThresholdSweep(base_map).graph(STYLE_THRESHOLD)
+    gv_args = DEFAULT_GV_ARGS | {"fontsize": "proportional", "node_color": "weight"}
+    style_duration = measure(lambda graph, _: style_graph(graph, gv_args), base_graph, None)
+    print(
+        f"{'style':<10} {STYLE_THRESHOLD:>6} {base_graph.number_of_nodes():>7} {base_graph.number_of_edges():>6} "
+        f"{style_duration:>12.1f}"
+    )
@@ -1,83 +1,138 @@
 """Wrapper pour utiliser pygraphviz avec un style custom"""
 
+import json
+import os
+from hashlib import sha256
+from xml.sax.saxutils import escape
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 import networkx as nx
 import matplotlib.colors as colors
 import matplotlib.pyplot as plt
 import numpy as np
 
+# positions des noeuds en points : nom du noeud -> (x, y)
+PositionsType = dict[str, tuple[float, float]]
 
-# pylint: disable = too-many-locals, too-many-statements
-def draw_graphviz(a_graph: nx.Graph, destination: Union[Path, str], /, **gv_args) -> None:
-    """Generates dot and svg using (py)graphviz
+# moteurs de dessin : graphviz (sous-processus via pygraphviz) ou networkx (spring_layout dans le processus, svg seul)
+GRAPHVIZ_BACKEND = "graphviz"
+NETWORKX_BACKEND = "networkx"
+BACKENDS = (GRAPHVIZ_BACKEND, NETWORKX_BACKEND)
+# les algorithmes graphviz qui partent des positions pos des noeuds (sfdp les ignore)
+WARM_START_ALGORITHMS = ("neato", "fdp")
+# pour le moteur networkx : itérations par défaut et échelle en points par racine du nombre de noeuds
+SPRING_ITERATIONS = 50
+POINTS_PER_NODE = 72
 
-    Parameters
-    ----------
-    a_graph : nx.Graph
-        the graph to draw
-    destination:
-        the file to write. Guess format from suffix
 
-    pyargs : dict
-        parameters to send to graphviz
+class LayoutCache:
+    """Cache disque des positions calculées par graphviz, un fichier json par empreinte de graphe et de paramètres"""
 
-    Returns
-    -------
-    int
-        graphviz (twopi) return code
-    """
+    def __init__(self, directory: Union[Path, str]):
+        # le dossier n'est créé qu'à la première écriture
+        self.directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(a_graph: nx.Graph, gv_args: dict) -> str:
+        """L'empreinte de la structure du graphe (noeuds, arcs et leurs poids) et des paramètres
+
+        Les positions de départ n'en font pas partie : une entrée ne dépend pas du graphe dessiné juste avant"""
+        content = [
+            sorted((str(node), weight) for node, weight in a_graph.nodes(data="weight")),
+            sorted(sorted((str(u), str(v))) + [weight] for (u, v, weight) in a_graph.edges(data="weight")),
+            sorted(gv_args.items()),
+        ]
+        return sha256(json.dumps(content, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[PositionsType]:
+        """Les positions de l'empreinte key, None si elles n'ont pas encore été calculées"""
+        try:
+            with open(self.directory / f"{key}.json", encoding="utf-8") as file:
+                positions = {node: tuple(pos) for node, pos in json.load(file).items()}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return positions  # type: ignore
+
+    def lookup(self, a_graph: nx.Graph, gv_args: dict) -> Optional[PositionsType]:
+        """Les positions déjà calculées par draw_graphviz pour a_graph et gv_args, None sinon"""
+        return self.get(self.key(a_graph, DEFAULT_GV_ARGS | gv_args))
 
-    # default arguments
-    gv_args = {
-        "algorithm": "sfdp",
-        "overlap": "scale",
-        "sep": -0.45,
-        "K": 1,
-        "fontsize": 14,
-        "edge_penwidths": 1,
-        "min_edge_penwidths": 0.2,
-        "max_edge_penwidths": 2,
-        "node_color": None,
-        "min_node_size": 0.1,
-        "max_node_size": 1,
-    } | gv_args
+    def put(self, key: str, positions: PositionsType) -> None:
+        """Enregistre les positions de l'empreinte key"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f"{key}.json.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(positions, file, ensure_ascii=False)
+        tmp.replace(self.directory / f"{key}.json")
 
+
+# default arguments
+DEFAULT_GV_ARGS = {
+    "algorithm": "sfdp",
+    "overlap": "scale",
+    "sep": -0.45,
+    "K": 1,
+    "fontsize": 14,
+    "edge_penwidths": 1,
+    "min_edge_penwidths": 0.2,
+    "max_edge_penwidths": 2,
+    "node_color": None,
+    "min_node_size": 0.1,
+    "max_node_size": 1,
+    "pin": False,
+    "maxiter": None,
+    "backend": GRAPHVIZ_BACKEND,
+    "seed": 42,
+}
+
+
+# pylint: disable = too-many-locals, too-many-statements, too-many-branches
+def style_graph(a_graph: nx.Graph, gv_args: dict) -> nx.Graph:
+    """Copie du graphe avec les attributs de style graphviz, gv_args complets (voir DEFAULT_GV_ARGS)
+
+    Epaisseurs des arcs, tailles et couleurs des noeuds sont calculées en tableaux, en un appel chacune, puis écrites
+    en une seule passe sur les noeuds et une sur les arcs"""
     # on fait une copie car on va modifier bcp d'attribut pour avoir le graphviz
     graph = a_graph.copy()
-    node_names = {w: w for w in graph}
-    colormap = plt.cm.get_cmap("inferno")  # plasma
+    nodes = list(graph)
+    colormap = plt.get_cmap("inferno")  # plasma
 
     if nx.is_weighted(graph):
         # on va interpoler les tailles des arcs proportionnel au poids
-        edge_weights = nx.get_edge_attributes(graph, "weight")
-        min_edge_weight = min(edge_weights.values())
-        max_edge_weight = max(edge_weights.values())
+        edge_weights = np.array([weight for (_, _, weight) in graph.edges(data="weight")], dtype=float)
         penwidth_interval = [gv_args["min_edge_penwidths"], gv_args["max_edge_penwidths"]]
-        edge_penwidths = {
-            e: np.interp(v, [min_edge_weight, max_edge_weight], penwidth_interval) for e, v in edge_weights.items()
-        }
+        edge_penwidths = np.interp(edge_weights, [edge_weights.min(), edge_weights.max()], penwidth_interval).tolist()
     else:
-        edge_penwidths = {k: gv_args["edge_penwidths"] for k in graph.edges}
+        edge_penwidths = [gv_args["edge_penwidths"]] * graph.number_of_edges()
 
     # idem pour la taille des noeuds
     inch_factor = 96
     node_size_interval = [gv_args["min_node_size"], gv_args["max_node_size"]]
-    # min_node_size = 10 / inch_factor
-    # max_node_size = min_node_size * 4
-    node_nbs = nx.get_node_attributes(graph, "weight")
-    min_node_nb = min(node_nbs.values())
-    max_node_nb = max(node_nbs.values())
-
-    def compute_size(value):
-        return round(np.interp(value, [min_node_nb, max_node_nb], node_size_interval), 1)
-
-    node_gwidths = {n: compute_size(v) for n, v in node_nbs.items()}
+    node_nbs = np.array([graph.nodes[node]["weight"] for node in nodes], dtype=float)
+    node_gwidths = np.round(np.interp(node_nbs, [node_nbs.min(), node_nbs.max()], node_size_interval), 1)
 
     if isinstance(gv_args["fontsize"], int):
-        node_fontsize = {n: gv_args["fontsize"] for n, v in node_gwidths.items()}
+        node_fontsize = [gv_args["fontsize"]] * len(nodes)
     elif gv_args["fontsize"] == "proportional":
-        node_fontsize = {n: 12 + v * 16 for n, v in node_gwidths.items()}
+        node_fontsize = (12 + node_gwidths * 16).tolist()
+
+    if gv_args["node_color"] is None:
+        node_colors = ["blue"] * len(nodes)
+        node_label = [""] * len(nodes)
+    else:
+        color_attr = nx.get_node_attributes(graph, gv_args["node_color"])
+        colored = [node in color_attr for node in nodes]
+        color_values = np.array([color_attr[node] for node in nodes if node in color_attr], dtype=float)
+        color_norm = colors.Normalize(vmin=color_values.min(), vmax=color_values.max())
+        # équivalent à colors.rgb2hex sur chaque noeud
+        rgbs = iter(np.round(colormap(color_norm(color_values))[:, :3] * 255).astype(int).tolist())
+        node_colors = ["#{:02x}{:02x}{:02x}".format(*next(rgbs)) if has_color else None for has_color in colored]
+        clusters = nx.get_node_attributes(graph, "cluster")
+        node_label = [clusters.get(node, "") for node in nodes]
 
     # graph.graph["fontsize"] = gv_args["fontsize"]
     # graph.graph["fontname"] = "Helvetica"
@@ -89,38 +144,192 @@ def draw_graphviz(a_graph: nx.Graph, destination: Union[Path, str], /, **gv_args
     # -0.4 : OK pour H2
     graph.graph["overlap"] = gv_args["overlap"]  # "false" #scale false prism
     graph.graph["K"] = gv_args["K"]
+    if gv_args["maxiter"] is not None:
+        graph.graph["maxiter"] = gv_args["maxiter"]
 
-    nx.set_node_attributes(graph, values=round(gv_args["min_node_size"] * inch_factor / 5), name="penwidth")  # type: ignore
-    nx.set_node_attributes(graph, values=0, name="margin")
-    nx.set_node_attributes(graph, values=10, name="fontsize")
-    nx.set_node_attributes(graph, values="grey30", name="fontcolor")
-    nx.set_node_attributes(graph, values="circle", name="shape")
-    nx.set_node_attributes(graph, values="shape", name="fixedsize")
-    nx.set_node_attributes(graph, values="filled", name="style")
-    nx.set_node_attributes(graph, values="white", name="color")
-    nx.set_node_attributes(graph, values=node_gwidths, name="width")
-    nx.set_node_attributes(graph, values="Helvetica", name="fontname")
-    nx.set_node_attributes(graph, values=node_fontsize, name="fontsize")
-    nx.set_node_attributes(graph, values="", name="label")
-    nx.set_node_attributes(graph, values=node_names, name="xlabel")
+    # les attributs communs à tous les noeuds, puis ceux propres à chacun, en une écriture par noeud
+    node_style = {
+        "penwidth": round(gv_args["min_node_size"] * inch_factor / 5),
+        "margin": 0,
+        "fontcolor": "grey30",
+        "shape": "circle",
+        "fixedsize": "shape",
+        "style": "filled",
+        "color": "white",
+        "fontname": "Helvetica",
+    }
+    for node, width, fontsize, label, fillcolor in zip(
+        nodes, node_gwidths.tolist(), node_fontsize, node_label, node_colors
+    ):
+        graph.nodes[node].update(node_style, width=width, fontsize=fontsize, label=label, xlabel=node)
+        if fillcolor is not None:
+            graph.nodes[node]["fillcolor"] = fillcolor
 
-    if gv_args["node_color"] is None:
-        node_colors = {k: "blue" for k in graph}
-        node_label = {k: "" for k in graph}
-    else:
-        color_attr = nx.get_node_attributes(graph, gv_args["node_color"])
-        color_norm = colors.Normalize(vmin=min(color_attr.values()), vmax=max(color_attr.values()))
-        node_colors = {k: colors.rgb2hex(colormap(color_norm(v))) for k, v in color_attr.items()}
-        node_label = nx.get_node_attributes(graph, "cluster")
+    edge_style = {"color": "darkgrey", "arrowsize": gv_args["edge_penwidths"] / 2}
+    for (_, _, data), penwidth in zip(graph.edges(data=True), edge_penwidths):
+        data.update(edge_style, penwidth=penwidth)
+    return graph
 
-    nx.set_node_attributes(graph, values=node_label, name="label")
-    nx.set_node_attributes(graph, values=node_colors, name="fillcolor")
 
-    nx.set_edge_attributes(graph, values=edge_penwidths, name="penwidth")
-    nx.set_edge_attributes(graph, values="darkgrey", name="color")
-    nx.set_edge_attributes(graph, values=gv_args["edge_penwidths"] / 2, name="arrowsize")  # type: ignore
+def draw_graphviz(
+    a_graph: nx.Graph,
+    destination: Union[Path, str],
+    /,
+    layout_cache: Optional[LayoutCache] = None,
+    warm_start: Optional[PositionsType] = None,
+    return_positions: bool = False,
+    **gv_args,
+) -> Optional[PositionsType]:
+    """Generates dot and svg using (py)graphviz
+
+    Parameters
+    ----------
+    a_graph : nx.Graph
+        the graph to draw
+    destination:
+        the file to write. Guess format from suffix
+    layout_cache:
+        if given, positions are read from it instead of running the layout, and stored in it after a layout
+    warm_start:
+        initial positions (in points) of the nodes, e.g. the ones returned for the previous graph of a sweep.
+        Pinned when gv_args["pin"] is set. Only used by the algorithms of WARM_START_ALGORITHMS (neato and fdp) and
+        by the networkx backend, ignored otherwise.
+    return_positions:
+        if set, the positions are computed even when neither layout_cache nor warm_start need them
+
+    pyargs : dict
+        parameters to send to graphviz. gv_args["backend"] selects the graphviz (default) or the in-process networkx
+        layout (spring_layout seeded by gv_args["seed"], svg only) with the same styling
+
+    Returns
+    -------
+    dict
+        the positions (in points) of the nodes, None when graphviz laid out and rendered the graph in a single call
+    """
+
+    gv_args = DEFAULT_GV_ARGS | gv_args
+    graph = style_graph(a_graph, gv_args)
 
-    # crée le graph pygraphviz
     pdestination = Path(destination)
+    if gv_args["backend"] == GRAPHVIZ_BACKEND and gv_args["algorithm"] not in WARM_START_ALGORITHMS:
+        warm_start = None
+    key = None if layout_cache is None else layout_cache.key(a_graph, gv_args)
+    positions = None if layout_cache is None else layout_cache.get(key)  # type: ignore
+
+    if gv_args["backend"] == NETWORKX_BACKEND:
+        if pdestination.suffix != ".svg":
+            raise ValueError(f"draw_graphviz: backend {NETWORKX_BACKEND} only writes svg, not {pdestination.suffix}")
+        if positions is None:
+            positions = spring_positions(graph, gv_args, warm_start)
+            if layout_cache is not None:
+                layout_cache.put(key, positions)  # type: ignore
+        write_svg(graph, positions, pdestination)
+        return positions
+    if gv_args["backend"] != GRAPHVIZ_BACKEND:
+        raise ValueError(f"draw_graphviz: unknown backend {gv_args['backend']}, expected one of {BACKENDS}")
+
+    # crée le graph pygraphviz
     py_graph = nx.nx_agraph.to_agraph(graph)
-    py_graph.draw(pdestination, prog=gv_args["algorithm"], format=pdestination.suffix.strip("."))
+    if positions is None and layout_cache is None and not warm_start and not return_positions:
+        # rien à relire ni à conserver : placement et rendu en un seul appel à graphviz
+        py_graph.draw(pdestination, prog=gv_args["algorithm"], format=pdestination.suffix.strip("."))
+        return None
+    if positions is None:
+        if warm_start:
+            # positions de départ en points, inputscale comme l'option -s pour que graphviz les convertisse en pouces
+            py_graph.graph_attr["inputscale"] = 72
+            pin = "!" if gv_args["pin"] else ""
+            for node in py_graph.nodes():
+                if str(node) in warm_start:
+                    node.attr["pos"] = "{:f},{:f}{}".format(*warm_start[str(node)], pin)
+        py_graph.layout(prog=gv_args["algorithm"])
+        positions = {
+            str(node): tuple(float(coord) for coord in node.attr["pos"].rstrip("!").split(",")[:2])
+            for node in py_graph.nodes()
+        }
+        if layout_cache is not None:
+            layout_cache.put(key, positions)  # type: ignore
+    else:
+        for node in py_graph.nodes():
+            node.attr["pos"] = "{:f},{:f}".format(*positions[str(node)])
+
+    # rendu sans nouveau calcul des positions : nop, comme neato -n, lit les positions en points
+    py_graph.draw(pdestination, prog="nop", format=pdestination.suffix.strip("."))
+    return positions  # type: ignore
+
+
+def spring_positions(graph: nx.Graph, gv_args: dict, warm_start: Optional[PositionsType] = None) -> PositionsType:
+    """Positions (en points) calculées dans le processus par nx.spring_layout, graine gv_args["seed"] fixée
+
+    Les noeuds de warm_start partent de leurs positions, épinglés si gv_args["pin"]"""
+    # l'échelle en points croît comme la racine du nombre de noeuds, comme l'aire occupée
+    scale = POINTS_PER_NODE * max(1.0, np.sqrt(graph.number_of_nodes()))
+    initial = None
+    fixed = None
+    if warm_start:
+        initial = {node: np.array(warm_start[str(node)]) / scale for node in graph if str(node) in warm_start}
+        fixed = list(initial) if gv_args["pin"] and initial else None
+    layout = nx.spring_layout(
+        graph,
+        pos=initial,
+        fixed=fixed,
+        iterations=gv_args["maxiter"] or SPRING_ITERATIONS,
+        weight="weight",
+        seed=gv_args["seed"],
+    )
+    return {str(node): (float(x * scale), float(y * scale)) for node, (x, y) in layout.items()}
+
+
+def write_svg(graph: nx.Graph, positions: PositionsType, destination: Path) -> None:
+    """Ecrit le svg du graphe stylé par draw_graphviz aux positions données (en points), arcs puis noeuds comme
+    outputorder=edgesfirst"""
+    inch = 72
+    radius = {node: float(graph.nodes[node]["width"]) * inch / 2 for node in graph}
+    fontsize = {node: float(graph.nodes[node]["fontsize"]) for node in graph}
+    # boîte englobante, avec la place des étiquettes à droite des noeuds
+    xs = [positions[str(node)][0] for node in graph]
+    ys = [positions[str(node)][1] for node in graph]
+    margin = max(radius.values(), default=0) + max(fontsize.values(), default=0) * 6
+    min_x, max_x = min(xs, default=0) - margin, max(xs, default=0) + margin
+    min_y, max_y = min(ys, default=0) - margin, max(ys, default=0) + margin
+
+    def fill(data):
+        # comme graphviz pour style=filled : fillcolor, sinon color, sinon lightgrey
+        return data.get("fillcolor", data.get("color", "lightgrey"))
+
+    def point(node):
+        # y vers le haut pour graphviz, vers le bas en svg
+        x, y = positions[str(node)]
+        return x - min_x, max_y - y
+
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?>',
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{max_x - min_x:.0f}pt" height="{max_y - min_y:.0f}pt" '
+        f'viewBox="0 0 {max_x - min_x:.2f} {max_y - min_y:.2f}">',
+        f'<rect width="100%" height="100%" fill="{graph.graph.get("bgcolor", "white")}"/>',
+    ]
+    for (u, v, data) in graph.edges(data=True):
+        (x1, y1), (x2, y2) = point(u), point(v)
+        lines.append(
+            f'<line x1="{x1:.2f}" y1="{y1:.2f}" x2="{x2:.2f}" y2="{y2:.2f}" '
+            f'stroke="{data["color"]}" stroke-width="{float(data["penwidth"]):.2f}"/>'
+        )
+    for node, data in graph.nodes(data=True):
+        x, y = point(node)
+        lines.append(
+            f'<circle cx="{x:.2f}" cy="{y:.2f}" r="{radius[node]:.2f}" fill="{fill(data)}" '
+            f'stroke="{data["color"]}" stroke-width="{float(data["penwidth"]):.2f}"/>'
+        )
+        text_style = f'font-family="{data["fontname"]}" font-size="{fontsize[node]:.2f}" fill="{data["fontcolor"]}"'
+        if data["label"]:
+            lines.append(
+                f'<text x="{x:.2f}" y="{y:.2f}" text-anchor="middle" dominant-baseline="central" {text_style}>'
+                f'{escape(str(data["label"]))}</text>'
+            )
+        lines.append(
+            f'<text x="{x + radius[node]:.2f}" y="{y - radius[node]:.2f}" {text_style}>'
+            f'{escape(str(data["xlabel"]))}</text>'
+        )
+    lines.append("</svg>")
+    with open(destination, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines))
@@ -0,0 +1,125 @@
+"""Export en lot des heatmaps des cartes cog, sans affichage : une image par (carte, niveau, pondération)
+
+Rendu direct de la matrice par imshow sur une figure Agg (pas de pyplot ni d'affichage interactif), une seule figure
+réutilisée pour toutes les images, matrice réduite par moyenne de blocs pour les grands vocabulaires.
+"""
+
+# pylint: disable=logging-fstring-interpolation
+
+import logging
+import math
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from cog_maps import CM_LA_MINE_FILENAME, CM_FUTUR_FILENAME, THESAURUS_FILENAME, WEIGHTS_MAP_FILENAME
+from cog_maps_cache import InputsCache
+
+logger = logging.getLogger(f"COGNITIVE_MAP.{__name__}")
+if __name__ == "__main__":
+    logging.basicConfig()
+    logger.setLevel(logging.INFO)
+
+# dossier et formats de sortie
+HEATMAP_DIR = Path("heatmaps/")
+FORMATS = ["png", "svg"]
+# au-delà de MAX_SIZE mots, la matrice est réduite par moyenne de blocs
+MAX_SIZE = 300
+# au-delà de MAX_LABELS mots, pas d'étiquettes sur les axes
+MAX_LABELS = 150
+COLORMAP = "RdYlGn_r"
+
+
+def alpha_words(cog_maps):
+    """Les mots d'une carte triés en gérant les accents, comme vizu_heatmap_cluster.cog_maps_to_df"""
+    return sorted(cog_maps.words, key=lambda x: unicodedata.normalize("NFD", x))
+
+
+def downsample(matrix, max_size=MAX_SIZE):
+    """Réduit une matrice carrée à au plus max_size lignes par moyenne de blocs factor x factor, et factor
+
+    Le dernier bloc, incomplet, est moyenné sur ses seules cases réelles"""
+    size = matrix.shape[0]
+    factor = math.ceil(size / max_size) if size > max_size else 1
+    if factor == 1:
+        return matrix, factor
+    nb_blocks = math.ceil(size / factor)
+    padded = np.zeros((nb_blocks * factor, nb_blocks * factor), dtype=matrix.dtype)
+    padded[:size, :size] = matrix
+    sums = padded.reshape(nb_blocks, factor, nb_blocks, factor).sum(axis=(1, 3))
+    # nombre de lignes réelles de chaque bloc
+    real = np.minimum(factor, size - np.arange(nb_blocks) * factor)
+    return sums / np.outer(real, real), factor
+
+
+class HeatmapExporter:
+    """Figure, axes, image et barre de couleurs créés une fois, réutilisés pour chaque matrice exportée"""
+
+    def __init__(self, figsize=(18, 16), cmap=COLORMAP, max_size=MAX_SIZE, max_labels=MAX_LABELS):
+        self.max_size = max_size
+        self.max_labels = max_labels
+        self.figure = Figure(figsize=figsize)
+        FigureCanvasAgg(self.figure)
+        # marges fixes pour les étiquettes, plutôt qu'un tight_layout recalculé à chaque image
+        self.figure.subplots_adjust(left=0.17, bottom=0.17, right=0.95, top=0.95)
+        self.axes = self.figure.add_subplot()
+        self.image = self.axes.imshow(np.zeros((1, 1)), cmap=cmap, interpolation="nearest")
+        self.colorbar = self.figure.colorbar(self.image, ax=self.axes)
+
+    def render(self, matrix, words, title, destinations):
+        """Ecrit la heatmap de matrix (lignes et colonnes words) dans chaque fichier de destinations, format selon
+        le suffixe"""
+        matrix, factor = downsample(matrix, self.max_size)
+        size = matrix.shape[0]
+        self.image.set_data(matrix)
+        self.image.set_extent((-0.5, size - 0.5, size - 0.5, -0.5))
+        self.image.set_clim(matrix.min(initial=0.0), matrix.max(initial=0.0))
+        self.axes.set_xlim(-0.5, size - 0.5)
+        self.axes.set_ylim(size - 0.5, -0.5)
+        if factor == 1 and len(words) <= self.max_labels:
+            ticks = np.arange(size)
+            fontsize = max(4, min(10, 1000 // max(size, 1)))
+            self.axes.set_xticks(ticks, labels=words, rotation=90, fontsize=fontsize)
+            self.axes.set_yticks(ticks, labels=words, fontsize=fontsize)
+        else:
+            self.axes.set_xticks([])
+            self.axes.set_yticks([])
+        self.axes.set_title(title if factor == 1 else f"{title} (blocs de {factor} mots)")
+        for destination in destinations:
+            self.figure.savefig(destination)
+
+
+def export_heatmaps(cog_maps_filename, all_maps, weights_map, output_dir=HEATMAP_DIR, formats=None, exporter=None):
+    """Exporte la heatmap de chaque (niveau, pondération) des cartes all_maps de cog_maps_filename, dans un seul
+    processus et une seule figure. Renvoie les fichiers écrits"""
+    if formats is None:
+        formats = FORMATS
+    if exporter is None:
+        exporter = HeatmapExporter()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    written = []
+    for level_name, a_map in all_maps.items():
+        words = alpha_words(a_map)
+        for weights_name, weights in weights_map.items():
+            start = time.perf_counter()
+            a_map.weights = weights
+            matrix, words = a_map.dense_matrix(words)
+            export_name = Path(output_dir) / f"{Path(cog_maps_filename).stem}_{level_name}_{weights_name}"
+            destinations = [Path(f"{export_name}.{image_format}") for image_format in formats]
+            exporter.render(matrix, words, f"{Path(cog_maps_filename).stem} {level_name} {weights_name}", destinations)
+            written.extend(destinations)
+            logger.info(f"export_heatmaps: {export_name} ({len(words)} words) {time.perf_counter() - start:.2f}s")
+    return written
+
+
+if __name__ == "__main__":
+    inputs_cache = InputsCache()
+    the_weights = inputs_cache.load_weights(WEIGHTS_MAP_FILENAME)
+    the_exporter = HeatmapExporter()
+    for a_filename in (CM_LA_MINE_FILENAME, CM_FUTUR_FILENAME):
+        the_maps, _ = inputs_cache.load_levels(a_filename, THESAURUS_FILENAME)
+        export_heatmaps(a_filename, the_maps, the_weights, exporter=the_exporter)
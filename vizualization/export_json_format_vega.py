@@ -7,16 +7,20 @@ from itertools import islice, accumulate
 from collections import defaultdict
 from pathlib import Path
 from dataclasses import asdict, dataclass
+from functools import partial
 from typing import Tuple, Optional
 from pprint import pprint
 import json
 import logging
 import math
 
+import numpy as np
+
 
 from cog_maps import (
     CogMaps,
     CM_LA_MINE_FILENAME,
+    CM_FUTUR_FILENAME,
     THESAURUS_FILENAME,
     WEIGHTS_MAP_FILENAME,
     DEFAULT_WEIGHTS,
@@ -25,10 +29,24 @@ from cog_maps import (
     CONCEPT_LVL,
     MOTHER_LVL,
     GD_MOTHER_LVL,
+    THESAURUS_ROOT,
+    ThesaurusTree,
 )
+from cog_maps_cache import InputsCache
 
 DEBUG = True
 WRITE_FILES = True
+# format des fichiers écrits : JSON compact ou NDJSON (un objet par ligne)
+JSON_FORMAT = "json"
+NDJSON_FORMAT = "ndjson"
+RECORDS_FORMAT = JSON_FORMAT
+# poids minimal des arcs exportés, None pour tous
+MIN_WEIGHT = None
+# fichier d'export de la matrice (sans extension) de chaque jeu de données
+MATRIX_EXPORTS = {
+    CM_LA_MINE_FILENAME: "viz/data/matrix_inverse",
+    CM_FUTUR_FILENAME: "viz/data/matrix_inverse_futur",
+}
 
 logger = logging.getLogger(f"COGNITIVE_MAP.{__name__}")
 if __name__ == "__main__":
@@ -38,39 +56,10 @@ if __name__ == "__main__":
     else:
         logger.setLevel(logging.INFO)
 
-
-thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
-weights = CogMaps.load_weights(WEIGHTS_MAP_FILENAME)
-mine_map = CogMaps(CM_LA_MINE_FILENAME)
-
-
-all_maps, report = mine_map.apply_many(thesaurus, with_unknown=False)
-for name, a_map in all_maps.items():
-    a_map.weights = weights["inverse"]
-
-
 # %%
-# outil
-
-
-def mk_unique_id():
-    """Générateur d'identifiant"""
-    counter = 0
-
-    def inner():
-        nonlocal counter
-        counter += 1
-        return counter
+# génération du grand dictionnaire de tous les mots de la carte, depuis l'arbre du thésaurus
 
-    return inner
-
-
-unique_id = mk_unique_id()
-
-# %%
-# génération du grand dictionnaire de tous les mots de la carte
-
-ROOT_NAME = "racine"
+ROOT_NAME = THESAURUS_ROOT
 DEPTH = 0
 
 
@@ -86,58 +75,31 @@ class WordInfo:
     depth: int = DEPTH
 
 
-# la racine
 LVL_LAST = LEVELS[-1]
-logger.info(f"adding root {ROOT_NAME} at depth {DEPTH}")
-global_word_map = {(ROOT_NAME, ROOT_NAME): WordInfo(id=0, word=(ROOT_NAME, ROOT_NAME), pid=None, parent=None, depth=0)}
-
-
-# on commence par le niveau le plus haut : les grand-mères
-ROOT_WEIGHT = 0
-DEPTH = 1
-logger.info(f"adding level {LVL_LAST} -> {ROOT_NAME} at depth {DEPTH}")
-for word in set(thesaurus[LVL_LAST].values()):
-    weight = all_maps[LVL_LAST].occurrences[word]
-    ROOT_WEIGHT += weight
-    global_word_map[(LVL_LAST, word)] = WordInfo(
-        id=unique_id(), word=(LVL_LAST, word), pid=0, parent=(ROOT_NAME, ROOT_NAME), weight=weight, depth=DEPTH
-    )
-
-# somme des poids des fils affectée à la racine
-global_word_map[(ROOT_NAME, ROOT_NAME)].weight = ROOT_WEIGHT
-
-# du plus général au plus précis :
-# mother gd_mother
-# concept mother
-# base concept
-
-for lvl_w, lvl_p in zip(LEVELS[::-1][1::], LEVELS[::-1]):
-    DEPTH += 1
-    logger.info(f"adding level {lvl_w} -> {lvl_p} at depth {DEPTH}")
-    for word, parent in thesaurus[lvl_p].items():
-        # print("    ", word, parent)
-        # print("    ", global_word_map[(lvl_p, parent)].pid)
-        weight = all_maps[lvl_w].occurrences.get(word)
-        global_word_map[(lvl_w, word)] = WordInfo(
-            id=unique_id(),
-            word=(lvl_w, word),
-            pid=global_word_map[(lvl_p, parent)].id,
-            parent=(lvl_p, parent),
-            weight=weight,
-            depth=DEPTH,
-        )
 
 
-# %%
-# tests
-
-if DEBUG:
+def tree_weights(tree, maps):
+    """Le poids de chaque noeud de l'arbre du thésaurus dans les cartes de son niveau, NaN si absent, la racine
+    recevant la somme des poids de ses fils"""
+    node_weights = tree.node_weights({lvl: a_map.occurrences for lvl, a_map in maps.items()})
+    node_weights[0] = tree.children_sums(np.nan_to_num(node_weights))[0]
+    return node_weights
+
+
+def build_word_map(tree, node_weights):
+    """Le grand dictionnaire (niveau, mot) -> WordInfo de tous les noeuds de l'arbre du thésaurus"""
+    return {
+        node: WordInfo(
+            id=node_id,
+            word=node,
+            pid=tree.parent(node_id),
+            parent=None if node_id == 0 else tree.nodes[tree.parents[node_id]],
+            weight=None if math.isnan(weight) else weight,
+            depth=int(tree.depths[node_id]),
+        )
+        for node_id, (node, weight) in enumerate(zip(tree.nodes, node_weights.tolist()))
+    }
 
-    print(global_word_map[(BASE_LVL, "travail")])
-    print(global_word_map[(CONCEPT_LVL, "emploi")])
-    print(global_word_map[(MOTHER_LVL, "emploi")])
-    print(global_word_map[(GD_MOTHER_LVL, "travail")])
-# a_wi = global_word_map[(BASE_LVL, "travail")]
 
 # %%
 # transformation au format attendu pour le json
@@ -147,82 +109,156 @@ if DEBUG:
 # { "id": 2, "relief": 0.37859110586383315, "name": "Credit card", "parent": 1, "size": 2541 }
 
 
-objects = [
-    {
-        "id": detail.id,
-        "level": f"{detail.word[0]}",
-        "name": f"{detail.word[1]}",
-        "leaf_weight": round(detail.weight, 2) if detail.depth == 4 else None,
-        "weight": round(detail.weight, 2),
-        "parent": detail.pid,
-        "depth": detail.depth,
-    }
-    for detail in global_word_map.values()
-    if detail.weight is not None
-]
+def thesaurus_records(word_map):
+    """Les noeuds de poids connu de word_map, au format attendu par les specs vega"""
+    return [
+        {
+            "id": detail.id,
+            "level": f"{detail.word[0]}",
+            "name": f"{detail.word[1]}",
+            "leaf_weight": round(detail.weight, 2) if detail.depth == 4 else None,
+            "weight": round(detail.weight, 2),
+            "parent": detail.pid,
+            "depth": detail.depth,
+        }
+        for detail in word_map.values()
+        if detail.weight is not None
+    ]
+
+
 # %%
 
 # vérification de la somme du nickel de mere à gd mere
 
 
-def verif_sum(lvl_1_word):
+def verif_sum(tree, word_map, lvl_1_word):
     """Vérifie si la somme des foils vaut bien celle du père (aux arrondis float près)"""
-    ref = global_word_map[("gd_mother", lvl_1_word)]
-
-    sons = [
-        global_word_map[("mother", word)] for word, parent in thesaurus[GD_MOTHER_LVL].items() if parent == lvl_1_word
-    ]
+    ref = word_map[(GD_MOTHER_LVL, lvl_1_word)]
+    sons = [word_map[tree.nodes[son]] for son in tree.children(ref.id)]
 
     print("ref.weight =", ref.weight)
     print("sons.weight =", sum(map(lambda x: x.weight, sons)))
     print("sons =", list(map(lambda x: x.word[1], sons)))
 
 
-if DEBUG:
-    verif_sum("nickel")
-    verif_sum("travail")
+def verif_all_sums(tree, weights):
+    """Vérifie d'un coup pour tous les noeuds ayant des fils que la somme des fils vaut celle du père, renvoie les
+    noeuds en défaut"""
+    known = np.nan_to_num(weights)
+    has_children = tree.offsets[1:] > tree.offsets[:-1]
+    return [tree.nodes[node] for node in np.flatnonzero(has_children & ~np.isclose(tree.children_sums(known), known))]
 
-# verdict : OK
 
 # %%
 
-if WRITE_FILES:
-    with open("viz/data/thesaurus.json", mode="w", encoding="utf-8") as fp:
-        json.dump(objects, fp, indent=4, ensure_ascii=False)
-else:
-    pprint(objects[:5:])
-
-max_weight = max(detail.weight for detail in global_word_map.values() if detail.weight is not None)
-print(f"max_weight={max_weight}")
+def write_records(records, filename, records_format=RECORDS_FORMAT):
+    """Ecrit au fur et à mesure les objets de l'itérable records, en JSON compact (une liste) ou en NDJSON (un objet
+    par ligne) : la liste complète n'est jamais construite en mémoire. Renvoie le nombre d'objets écrits"""
+    dumps = partial(json.dumps, ensure_ascii=False, separators=(",", ":"))
+    count = 0
+    with open(filename, mode="w", encoding="utf-8") as fp:
+        if records_format == NDJSON_FORMAT:
+            for count, record in enumerate(records, 1):
+                fp.write(dumps(record))
+                fp.write("\n")
+        elif records_format == JSON_FORMAT:
+            fp.write("[")
+            for count, record in enumerate(records, 1):
+                if count > 1:
+                    fp.write(",")
+                fp.write(dumps(record))
+            fp.write("]")
+        else:
+            raise ValueError(f"write_records: unknown format {records_format}")
+    return count
 
 
 # %%
 # export de la matrice des co-occurrences avec poids inverse
 
 
-matrix_obj = [
-    {
-        "level": lvl,
-        "depth": global_word_map[(lvl, src)].depth,
-        "src_name": src,
-        "dst_name": dst,
-        "src": global_word_map[(lvl, src)].id,
-        "dst": global_word_map[(lvl, dst)].id,
-        "weight": round(weight, 2),
-        "log_weight": round(math.log10(weight), 2),
-        "normal_weight": round(
-            weight / math.sqrt(sum(all_maps[lvl].matrix[src].values()) * sum(all_maps[lvl].matrix[dst].values())), 2
-        ),
-    }
-    for lvl in LEVELS[::]
-    for src, out in all_maps[lvl].matrix.items()
-    for dst, weight in out.items()
-    if src != dst
-    # if weight > 0.0
-]
-
-if WRITE_FILES:
-    with open("viz/data/matrix_inverse.json", mode="w", encoding="utf-8") as fp:
-        json.dump(matrix_obj, fp, indent=4, ensure_ascii=False)
-else:
-    pprint(matrix_obj[:5:])
+def row_sums(matrix):
+    """La somme de chaque ligne d'une matrice creuse CSR, en une passe sur ses cases non nulles
+
+    Sommes séquentielles dans l'ordre des colonnes, comme sum(a_map.matrix[word].values())"""
+    data = matrix.data.tolist()
+    return [sum(data[start:end]) for start, end in zip(matrix.indptr[:-1].tolist(), matrix.indptr[1:].tolist())]
+
+
+def matrix_records(maps, word_map, min_weight=None):
+    """Génère les arcs hors diagonale des matrices de co-occurrences de chaque niveau de maps, de poids au moins
+    min_weight, au format attendu par les specs vega
+
+    Les sommes des lignes (degrés) sont calculées une fois par niveau, depuis la matrice creuse"""
+    for lvl, a_map in maps.items():
+        matrix = a_map.sparse_matrix
+        vocabulary = a_map.vocabulary
+        sums = row_sums(matrix)
+        indices, data = matrix.indices.tolist(), matrix.data.tolist()
+        for row, (start, end) in enumerate(zip(matrix.indptr[:-1].tolist(), matrix.indptr[1:].tolist())):
+            src = vocabulary[row]
+            for col, weight in zip(indices[start:end], data[start:end]):
+                if col == row or (min_weight is not None and weight < min_weight):
+                    continue
+                dst = vocabulary[col]
+                yield {
+                    "level": lvl,
+                    "depth": word_map[(lvl, src)].depth,
+                    "src_name": src,
+                    "dst_name": dst,
+                    "src": word_map[(lvl, src)].id,
+                    "dst": word_map[(lvl, dst)].id,
+                    "weight": round(weight, 2),
+                    "log_weight": round(math.log10(weight), 2),
+                    "normal_weight": round(weight / math.sqrt(sums[row] * sums[col]), 2),
+                }
+
+
+if __name__ == "__main__":
+    # entrées relues depuis le cache disque, analysées et thésaurus appliqué
+    inputs_cache = InputsCache()
+    thesaurus = inputs_cache.load_thesaurus_map(THESAURUS_FILENAME)
+    weights = inputs_cache.load_weights(WEIGHTS_MAP_FILENAME)
+    all_maps, report = inputs_cache.load_levels(CM_LA_MINE_FILENAME, THESAURUS_FILENAME, with_unknown=False)
+    for a_map in all_maps.values():
+        a_map.weights = weights["inverse"]
+
+    # l'arbre : identifiants stables, parents et profondeurs calculés une fois
+    the_tree = ThesaurusTree(thesaurus, ROOT_NAME)
+    logger.info(f"thesaurus tree of {len(the_tree)} nodes, levels {the_tree.levels}")
+    node_weights = tree_weights(the_tree, all_maps)
+    global_word_map = build_word_map(the_tree, node_weights)
+
+    if DEBUG:
+        print(global_word_map[(BASE_LVL, "travail")])
+        print(global_word_map[(CONCEPT_LVL, "emploi")])
+        print(global_word_map[(MOTHER_LVL, "emploi")])
+        print(global_word_map[(GD_MOTHER_LVL, "travail")])
+        verif_sum(the_tree, global_word_map, "nickel")
+        verif_sum(the_tree, global_word_map, "travail")
+        # verdict : OK
+        print("mismatches =", verif_all_sums(the_tree, node_weights))
+
+    objects = thesaurus_records(global_word_map)
+    if WRITE_FILES:
+        write_records(objects, f"viz/data/thesaurus.{RECORDS_FORMAT}")
+    else:
+        pprint(objects[:5:])
+
+    max_weight = max(detail.weight for detail in global_word_map.values() if detail.weight is not None)
+    print(f"max_weight={max_weight}")
+
+    if WRITE_FILES:
+        for maps_filename, export_name in MATRIX_EXPORTS.items():
+            if maps_filename == CM_LA_MINE_FILENAME:
+                the_maps = all_maps
+            else:
+                the_maps, _ = inputs_cache.load_levels(maps_filename, THESAURUS_FILENAME, with_unknown=False)
+                for a_map in the_maps.values():
+                    a_map.weights = weights["inverse"]
+            nb_records = write_records(
+                matrix_records(the_maps, global_word_map, MIN_WEIGHT), f"{export_name}.{RECORDS_FORMAT}"
+            )
+            logger.info(f"{nb_records} edges written to {export_name}.{RECORDS_FORMAT}")
+    else:
+        pprint(list(islice(matrix_records(all_maps, global_word_map, MIN_WEIGHT), 5)))
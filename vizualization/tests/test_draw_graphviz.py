@@ -0,0 +1,54 @@
+# pylint: disable =  unused-import, missing-class-docstring, missing-function-docstring, too-few-public-methods, no-self-use
+"""Tests du dessin des graphes de draw_graphviz"""
+
+# %%
+
+import pytest
+import networkx as nx
+from draw_graphviz import LayoutCache, draw_graphviz, NETWORKX_BACKEND, GRAPHVIZ_BACKEND
+
+
+def small_graph():
+    """Un petit graphe pondéré, la valeur de couleur color_value n'est définie que sur a et b"""
+    graph = nx.Graph()
+    graph.add_nodes_from(
+        [("a", {"weight": 4.0}), ("b", {"weight": 2.0}), ("c", {"weight": 1.0}), ("d", {"weight": 1.5})]
+    )
+    graph.add_weighted_edges_from([("a", "b", 3.0), ("b", "c", 1.0), ("a", "c", 2.0), ("c", "d", 1.0)])
+    for node in ("a", "b"):
+        graph.nodes[node]["color_value"] = graph.nodes[node]["weight"]
+    return graph
+
+
+class TestDrawGraphviz:
+    def test_networkx_partial_colors(self, tmp_path):
+        destination = tmp_path / "graph.svg"
+        positions = draw_graphviz(small_graph(), destination, node_color="color_value", backend=NETWORKX_BACKEND)
+        assert set(positions) == {"a", "b", "c", "d"}
+        content = destination.read_text(encoding="utf-8")
+        # les noeuds sans couleur sont remplis comme par graphviz, de leur color
+        circles = [line for line in content.splitlines() if line.startswith("<circle")]
+        assert len(circles) == 4
+        assert sum('fill="white"' in circle for circle in circles) == 2
+
+    def test_graphviz_backend(self, tmp_path):
+        pytest.importorskip("pygraphviz")
+        graph = small_graph()
+        # placement et rendu en un seul appel, sans positions
+        assert draw_graphviz(graph, tmp_path / "direct.svg", node_color="color_value") is None
+        assert (tmp_path / "direct.svg").stat().st_size > 0
+
+        # positions calculées puis relues depuis le cache
+        layouts = LayoutCache(tmp_path / "layouts")
+        positions = draw_graphviz(graph, tmp_path / "cached.svg", layout_cache=layouts, backend=GRAPHVIZ_BACKEND)
+        assert set(positions) == set(graph) and layouts.misses == 1
+        assert draw_graphviz(graph, tmp_path / "cached.svg", layout_cache=layouts) == positions
+        assert layouts.hits == 1
+        # les positions de départ ne changent pas l'entrée du cache
+        draw_graphviz(graph, tmp_path / "cached.svg", layout_cache=layouts, warm_start=positions)
+        assert layouts.hits == 2
+
+        # démarrage à chaud avec neato, noeuds épinglés
+        pinned = draw_graphviz(graph, tmp_path / "pinned.svg", algorithm="neato", warm_start=positions, pin=True)
+        for node, (x, y) in positions.items():
+            assert pinned[node] == pytest.approx((x, y), abs=1.0)
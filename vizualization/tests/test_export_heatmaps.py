@@ -0,0 +1,49 @@
+# pylint: disable =  unused-import, missing-class-docstring, missing-function-docstring, too-few-public-methods, no-self-use
+"""Tests de l'export en lot des heatmaps"""
+
+# %%
+
+import numpy as np
+import pytest
+from cog_maps import CM_SMALL_FILENAME, THESAURUS_FILENAME, WEIGHTS_MAP_FILENAME, BASE_LVL, CogMaps
+from export_heatmaps import HeatmapExporter, downsample, export_heatmaps
+
+
+class TestExportHeatmaps:
+    def test_downsample_small(self):
+        matrix = np.arange(16.0).reshape(4, 4)
+        result, factor = downsample(matrix, max_size=4)
+        assert factor == 1 and result is matrix
+
+    @pytest.mark.parametrize("size, max_size, factor", [(10, 5, 2), (11, 5, 3), (7, 3, 3)])
+    def test_downsample(self, size, max_size, factor):
+        rng = np.random.default_rng(0)
+        matrix = rng.random((size, size))
+        result, result_factor = downsample(matrix, max_size)
+        nb_blocks = -(-size // factor)
+        assert result_factor == factor and result.shape == (nb_blocks, nb_blocks)
+        assert nb_blocks <= max_size
+        # la moyenne de chaque bloc, le dernier bloc incomplet moyenné sur ses seules cases
+        real = np.minimum(factor, size - np.arange(nb_blocks) * factor)
+        assert (result * np.outer(real, real)).sum() == pytest.approx(matrix.sum())
+        last = slice((nb_blocks - 1) * factor, size)
+        assert result[-1, -1] == pytest.approx(matrix[last, last].mean())
+        assert result[0, 0] == pytest.approx(matrix[:factor, :factor].mean())
+
+    def test_export_one_figure(self, tmp_path):
+        thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
+        weights = CogMaps.load_weights(WEIGHTS_MAP_FILENAME)
+        all_maps, _ = CogMaps(CM_SMALL_FILENAME).apply_many(thesaurus)
+        exporter = HeatmapExporter(figsize=(4, 4), max_size=20)
+        written = export_heatmaps(
+            CM_SMALL_FILENAME,
+            {BASE_LVL: all_maps[BASE_LVL]},
+            {"inverse": weights["inverse"]},
+            output_dir=tmp_path,
+            formats=["png"],
+            exporter=exporter,
+        )
+        assert written == [tmp_path / f"{CM_SMALL_FILENAME.stem}_{BASE_LVL}_inverse.png"]
+        assert written[0].read_bytes().startswith(b"\x89PNG")
+        # plus de mots que max_size : matrice réduite par blocs, sans étiquettes
+        assert "blocs de" in exporter.axes.get_title() and not exporter.axes.get_xticks().size
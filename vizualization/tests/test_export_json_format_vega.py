@@ -0,0 +1,66 @@
+# pylint: disable =  unused-import, missing-class-docstring, missing-function-docstring, too-few-public-methods, no-self-use
+"""Tests de l'export json pour vega"""
+
+# %%
+
+import json
+
+import pytest
+from cog_maps import CM_SMALL_FILENAME, THESAURUS_FILENAME, WEIGHTS_MAP_FILENAME, THESAURUS_ROOT, CogMaps, ThesaurusTree
+from export_json_format_vega import (
+    JSON_FORMAT,
+    NDJSON_FORMAT,
+    build_word_map,
+    matrix_records,
+    thesaurus_records,
+    tree_weights,
+    write_records,
+)
+
+
+@pytest.fixture(name="maps_and_words", scope="module")
+def fixture_maps_and_words():
+    """Les niveaux du petit jeu de cartes en pondération inverse et le dictionnaire des mots de l'arbre"""
+    thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
+    weights = CogMaps.load_weights(WEIGHTS_MAP_FILENAME)
+    all_maps, _ = CogMaps(CM_SMALL_FILENAME).apply_many(thesaurus, with_unknown=False)
+    for a_map in all_maps.values():
+        a_map.weights = weights["inverse"]
+    tree = ThesaurusTree(thesaurus, THESAURUS_ROOT)
+    return all_maps, build_word_map(tree, tree_weights(tree, all_maps))
+
+
+class TestExportVega:
+    def test_write_records(self, tmp_path, maps_and_words):
+        _, word_map = maps_and_words
+        records = thesaurus_records(word_map)
+        assert records
+        # depuis un générateur, en JSON compact puis en NDJSON
+        assert write_records(iter(records), tmp_path / "records.json", JSON_FORMAT) == len(records)
+        assert json.loads((tmp_path / "records.json").read_text(encoding="utf-8")) == records
+        assert write_records(iter(records), tmp_path / "records.ndjson", NDJSON_FORMAT) == len(records)
+        lines = (tmp_path / "records.ndjson").read_text(encoding="utf-8").splitlines()
+        assert [json.loads(line) for line in lines] == records
+
+        assert write_records([], tmp_path / "empty.json", JSON_FORMAT) == 0
+        assert json.loads((tmp_path / "empty.json").read_text(encoding="utf-8")) == []
+        with pytest.raises(ValueError):
+            write_records(records, tmp_path / "records.csv", "csv")
+
+    @pytest.mark.parametrize("min_weight", [None, 0.5, 1.0, 2.0])
+    def test_matrix_records_min_weight(self, maps_and_words, min_weight):
+        all_maps, word_map = maps_and_words
+        records = list(matrix_records(all_maps, word_map, min_weight))
+        # les arcs hors diagonale de poids au moins min_weight, niveau par niveau
+        expected = {
+            (lvl, src, dst)
+            for lvl, a_map in all_maps.items()
+            for src, row in a_map.matrix.items()
+            for dst, weight in row.items()
+            if src != dst and weight and (min_weight is None or weight >= min_weight)
+        }
+        assert len(records) == len(expected)
+        assert {(record["level"], record["src_name"], record["dst_name"]) for record in records} == expected
+        for record in records:
+            assert record["src"] == word_map[(record["level"], record["src_name"])].id
+            assert record["dst"] == word_map[(record["level"], record["dst_name"])].id
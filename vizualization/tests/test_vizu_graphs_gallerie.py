@@ -0,0 +1,101 @@
+# pylint: disable =  unused-import, missing-class-docstring, missing-function-docstring, too-few-public-methods, no-self-use
+"""Tests de la génération des graphes de la gallerie"""
+
+# %%
+
+import os
+
+import pytest
+import vizu_graphs_gallerie
+from cog_maps import CM_SMALL_FILENAME, THESAURUS_FILENAME, WEIGHTS_MAP_FILENAME, CogMaps
+from draw_graphviz import LayoutCache, draw_graphviz, NETWORKX_BACKEND
+from vizu_graphs_gallerie import ThresholdSweep, cog_map_to_graph, generate_all_graphs, is_up_to_date
+
+THRESHOLDS = [1.0, 1.5, 2.0]
+
+
+@pytest.fixture(name="inputs", scope="module")
+def fixture_inputs():
+    """Le thésaurus et une seule pondération"""
+    weights = CogMaps.load_weights(WEIGHTS_MAP_FILENAME)
+    return CogMaps.load_thesaurus_map(THESAURUS_FILENAME), {"inverse": weights["inverse"]}
+
+
+def generate(inputs, graph_dir, monkeypatch, **kwargs):
+    """generate_all_graphs du petit jeu de cartes dans graph_dir, avec le moteur networkx"""
+    monkeypatch.setattr(vizu_graphs_gallerie, "GRAPH_DIR", graph_dir)
+    thesaurus, weights_map = inputs
+    return generate_all_graphs(
+        [CM_SMALL_FILENAME], thesaurus, weights_map, thresholds=THRESHOLDS, backend=NETWORKX_BACKEND, **kwargs
+    )
+
+
+class TestGallerie:
+    @pytest.mark.parametrize("weights_name", ["arithmetique", "inverse", "exponentielle"])
+    def test_threshold_sweep(self, weights_name):
+        thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
+        weights = CogMaps.load_weights(WEIGHTS_MAP_FILENAME)[weights_name]
+        all_maps, _ = CogMaps(CM_SMALL_FILENAME).apply_many(thesaurus)
+        for a_map in all_maps.values():
+            a_map.weights = weights
+            sweep = ThresholdSweep(a_map)
+            thresholds = [0.5, 1.0, 1.5, 2.0, 3.0, 5.0]
+            for (threshold, graph), stats in zip(sweep.graphs(thresholds), sweep.stats(thresholds)):
+                expected = cog_map_to_graph(a_map, threshold)
+                assert stats == (threshold, expected.number_of_nodes(), expected.number_of_edges())
+                assert dict(graph.nodes(data="weight")) == pytest.approx(dict(expected.nodes(data="weight")))
+                assert {frozenset((u, v)): w for (u, v, w) in graph.edges(data="weight")} == pytest.approx(
+                    {frozenset((u, v)): w for (u, v, w) in expected.edges(data="weight")}
+                )
+
+    def test_is_up_to_date(self, tmp_path):
+        source, target = tmp_path / "source.csv", tmp_path / "target.svg"
+        source.write_text("source", encoding="utf-8")
+        assert not is_up_to_date(target, [source])
+        target.write_text("target", encoding="utf-8")
+        os.utime(source, ns=(10**9, 10**9))
+        assert is_up_to_date(target, [source])
+        os.utime(source, ns=(2 * 10**18, 2 * 10**18))
+        assert not is_up_to_date(target, [source])
+
+    def test_skip_force_warm_start(self, tmp_path, monkeypatch, inputs):
+        # les dessins, relevés au passage : fichier -> positions de départ
+        starts = {}
+
+        def draw(graph, destination, **kwargs):
+            starts[destination] = kwargs.get("warm_start")
+            return draw_graphviz(graph, destination, **kwargs)
+
+        monkeypatch.setattr(vizu_graphs_gallerie, "draw_graphviz", draw)
+        layouts = LayoutCache(tmp_path / "layouts")
+        report = generate(inputs, tmp_path / "graphs", monkeypatch, layout_cache=layouts)
+        files = sorted((tmp_path / "graphs").iterdir())
+        assert len(files) == len(report) == 4 * len(THRESHOLDS)
+        assert len(starts) == len(files)
+        mtimes = {path: path.stat().st_mtime_ns for path in files}
+        first_starts = dict(starts)
+
+        # tout est à jour : rien n'est redessiné, sauf avec force
+        starts.clear()
+        assert generate(inputs, tmp_path / "graphs", monkeypatch, layout_cache=layouts) == report
+        assert not starts and all(path.stat().st_mtime_ns == mtimes[path] for path in files)
+        generate(inputs, tmp_path / "graphs", monkeypatch, layout_cache=layouts, force=True)
+        assert len(starts) == len(files)
+
+        # seul le seuil supprimé est redessiné, depuis les positions du seuil précédent, relues dans le cache
+        second = f"{tmp_path / 'graphs' / CM_SMALL_FILENAME.stem}_base_inverse_{THRESHOLDS[1]}.svg"
+        assert first_starts[second] is not None
+        os.remove(second)
+        starts.clear()
+        generate(inputs, tmp_path / "graphs", monkeypatch, layout_cache=layouts)
+        assert list(starts) == [second]
+        assert starts[second] == first_starts[second]
+
+    def test_parallel_draw(self, tmp_path, monkeypatch, inputs):
+        serial = generate(inputs, tmp_path / "serial", monkeypatch, jobs=1)
+        parallel = generate(inputs, tmp_path / "parallel", monkeypatch, jobs=2)
+        assert serial == parallel
+        files = sorted(path.name for path in (tmp_path / "serial").iterdir())
+        assert files == sorted(path.name for path in (tmp_path / "parallel").iterdir())
+        for name in files:
+            assert (tmp_path / "serial" / name).read_bytes() == (tmp_path / "parallel" / name).read_bytes()
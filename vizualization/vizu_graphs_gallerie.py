@@ -5,6 +5,8 @@ __author__ = "Romuald Thion"
 
 # %%
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
 from math import isclose, exp
 from collections import Counter, defaultdict
 from functools import partial
@@ -12,13 +14,10 @@ from pathlib import Path
 from pprint import pprint
 from operator import itemgetter
 
+import numpy as np
 import networkx as nx
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
-env = Environment(loader=FileSystemLoader("."), autoescape=select_autoescape())
-template = env.get_template("viz/gallerie.jinja2.html")
-
-
 from cog_maps import (
     CM_SMALL_FILENAME,
     CM_LA_MINE_FILENAME,
@@ -27,9 +26,11 @@ from cog_maps import (
     WEIGHTS_MAP_FILENAME,
     LEVELS,
     DEFAULT_WEIGHTS,
+    CACHE_DIR,
     CogMaps,
 )
-from draw_graphviz import draw_graphviz
+from cog_maps_cache import InputsCache
+from draw_graphviz import GRAPHVIZ_BACKEND, NETWORKX_BACKEND, WARM_START_ALGORITHMS, LayoutCache, draw_graphviz
 
 logger = logging.getLogger(f"COGNITIVE_MAP.{__name__}")
 if __name__ == "__main__":
@@ -66,64 +67,217 @@ def cog_map_to_graph(a_map, threshold):
     return graph
 
 
-def generate_all_graphs(cog_maps_filenames, thesaurus, weights_map, *, thresholds=None):
+class ThresholdSweep:
+    """Balayage des seuils d'une carte : ses arcs hors diagonale sont triés une seule fois par poids décroissant
+
+    Les graphes sont emboîtés, celui d'un seuil est un sous-graphe de celui d'un seuil inférieur : le nombre de noeuds
+    et d'arcs à un seuil s'obtient par dichotomie, le graphe depuis un préfixe des arcs triés. A chaque seuil, le graphe
+    est celui de cog_map_to_graph.
+    """
+
+    def __init__(self, a_map):
+        matrix = a_map.sparse_matrix
+        # la matrice n'est symétrique qu'aux arrondis près et cog_map_to_graph garde un arc si l'un des deux sens passe
+        # le seuil : on garde le max des deux sens
+        symmetric = matrix.maximum(matrix.T).tocoo()
+        upper = symmetric.row < symmetric.col
+        rows, cols, weights = symmetric.row[upper], symmetric.col[upper], symmetric.data[upper]
+        order = np.argsort(-weights, kind="stable")
+        self.words = list(a_map.vocabulary)
+        # pour les noeuds, le poid c'est le nombre de cartes, sur la diagonale
+        self.node_weights = matrix.diagonal().tolist()
+        # les arcs (ligne, colonne, poids) par poids décroissant
+        self.edges = list(zip(rows[order].tolist(), cols[order].tolist(), weights[order].tolist()))
+        # les opposés des poids des arcs, croissants pour la dichotomie
+        self.__edge_keys = -weights[order]
+        # le poids du plus lourd arc de chaque noeud : il est isolé au-delà
+        self.__node_max = np.full(len(self.words), -np.inf)
+        np.maximum.at(self.__node_max, rows, weights)
+        np.maximum.at(self.__node_max, cols, weights)
+        self.__node_keys = np.sort(self.__node_max)
+
+    def counts(self, threshold):
+        """Les nombres de noeuds et d'arcs du graphe au seuil threshold, sans le construire"""
+        nb_nodes = len(self.__node_keys) - int(np.searchsorted(self.__node_keys, threshold, side="left"))
+        nb_edges = int(np.searchsorted(self.__edge_keys, -threshold, side="right"))
+        return nb_nodes, nb_edges
+
+    def graph(self, threshold):
+        """Le graphe au seuil threshold, noeuds dans l'ordre du vocabulaire et arcs par poids décroissant"""
+        _, nb_edges = self.counts(threshold)
+        graph = nx.Graph()
+        graph.add_nodes_from(
+            (self.words[i], {"weight": self.node_weights[i]}) for i in np.flatnonzero(self.__node_max >= threshold)
+        )
+        graph.add_edges_from((self.words[u], self.words[v], {"weight": w}) for (u, v, w) in self.edges[:nb_edges])
+        return graph
+
+    def stats(self, thresholds):
+        """Génère (seuil, nombre de noeuds, nombre d'arcs) pour chaque seuil de thresholds"""
+        for threshold in thresholds:
+            yield (threshold, *self.counts(threshold))
+
+    def graphs(self, thresholds):
+        """Génère (seuil, graphe) pour chaque seuil de thresholds"""
+        for threshold in thresholds:
+            yield threshold, self.graph(threshold)
+
+
+def is_up_to_date(target, sources):
+    """Vrai si le fichier target existe et est plus récent que tous les fichiers sources"""
+    target = Path(target)
+    if not target.is_file():
+        return False
+    return target.stat().st_mtime_ns >= max(Path(source).stat().st_mtime_ns for source in sources)
+
+
+def draw_sweep(draw, drawings, warm_start=True):
+    """Dessine dans l'ordre les (graphe, fichier, positions) d'un balayage des seuils, chaque graphe partant des
+    positions du précédent si warm_start, ou des positions données quand le précédent n'a pas été redessiné"""
+    positions = None
+    for (graph, full_export_name, start) in drawings:
+        if start is not None:
+            positions = start
+        positions = draw(graph, full_export_name, warm_start=positions, return_positions=warm_start)
+
+
+def generate_all_graphs(
+    cog_maps_filenames,
+    thesaurus,
+    weights_map,
+    *,
+    thresholds=None,
+    inputs_cache=None,
+    thesaurus_filename=THESAURUS_FILENAME,
+    weights_filename=WEIGHTS_MAP_FILENAME,
+    jobs=1,
+    force=False,
+    layout_cache=None,
+    warm_start=True,
+    backend=GRAPHVIZ_BACKEND,
+    algorithm="sfdp",
+):
     """Genère un ensemble de graphes
 
+    Avec inputs_cache, les niveaux des cartes sont relus depuis le cache disque, pour le thésaurus de thesaurus_filename
+
     Pour chaque carte de MAPS
         Pour chaque niveau du thesaurus de LEVELS
             Pour chaque poids de WEIGHTS
                     génère un graph pour chaque niveau de threshold entre min et max (inclus)
+
+    Les arcs sont triés une fois par (carte, niveau, poids) par ThresholdSweep, les tailles des graphes du rapport en
+    sont déduites et seuls les graphes à dessiner sont construits. Les dessins sont faits niveau par niveau, répartis
+    sur jobs processus (0 pour tous les coeurs) : seuls les graphes d'un niveau sont en mémoire. Sauf avec force, une
+    image plus récente que les fichiers de cartes, du thésaurus et des poids n'est pas redessinée.
+
+    Avec layout_cache, les positions déjà calculées pour un graphe et des paramètres sont relues. Avec warm_start, les
+    seuils d'un balayage sont dessinés dans l'ordre croissant, chacun depuis les positions du précédent, pour des
+    images stables d'un seuil à l'autre : seulement avec le moteur networkx ou un algorithm graphviz qui part des
+    positions données (WARM_START_ALGORITHMS, pas sfdp). Les positions d'un seuil à jour, non redessiné, sont relues
+    depuis layout_cache. backend choisit le moteur de dessin de draw_graphviz.
     """
     # gère les arguments par défaut
     if thresholds is None:
         thresholds = list(range(2, 6))
     if weights_map is None:
-        weights = {"all_1": DEFAULT_WEIGHTS}
+        weights_map = {"all_1": DEFAULT_WEIGHTS}
+    # sfdp ignore les positions de départ : pas de démarrage à chaud
+    warm_start = warm_start and (backend == NETWORKX_BACKEND or algorithm in WARM_START_ALGORITHMS)
 
     # fonction pour dessiner
-    draw = partial(
-        draw_graphviz,
-        algorithm="sfdp",
-        sep=0.01,
-        fontsize="proportional",  # "proportional",
-        node_color="weight",
-        min_edge_penwidths=1,
-        max_edge_penwidths=10,
-        min_node_size=0.02,
-        max_node_size=1,
-    )
+    gv_args = {
+        "algorithm": algorithm,
+        "sep": 0.01,
+        "fontsize": "proportional",  # "proportional",
+        "node_color": "weight",
+        "min_edge_penwidths": 1,
+        "max_edge_penwidths": 10,
+        "min_node_size": 0.02,
+        "max_node_size": 1,
+        "backend": backend,
+    }
+    draw = partial(draw_graphviz, layout_cache=layout_cache, **gv_args)
+    draw_one_sweep = partial(draw_sweep, draw, warm_start=warm_start)
+    executor = ProcessPoolExecutor(max_workers=jobs or None) if DRAW and jobs != 1 else None
 
     report = {}
     base_indent = 2
-    for filename in cog_maps_filenames:
-        logger.info(f"generate_all_graphs: processing{filename}")
-        cog_maps = CogMaps(filename)
-        all_maps, _ = cog_maps.apply_many(thesaurus)
-        for level_name, a_map in all_maps.items():
-            logger.debug(f"{' '*base_indent*1}->{level_name}")
-            for weights_name, weights in weights_map.items():
-                logger.debug(f"{' '*base_indent*2}->{weights_name}")
-                a_map.weights = weights
-                export_name = f"{GRAPH_DIR / Path(filename).stem}_{level_name}_{weights_name}"
-                # a_map.dump_matrix(f"{export_name}.csv")
-                for threshold in thresholds:
-                    logger.debug(f"{' '*base_indent*3}->{threshold}")
-                    graph = cog_map_to_graph(a_map, threshold)
-                    full_export_name = f"{export_name}_{threshold}.{IMG_FORMAT}"
-                    # on génère au format graphml et graphviz
-                    report[(Path(filename).name, level_name, weights_name, threshold)] = (
-                        Path(full_export_name).name,
-                        graph.number_of_nodes(),
-                        graph.number_of_edges(),
-                    )
-                    if graph.number_of_nodes() == 0:
-                        logger.warning(f"empty graph {export_name}_{threshold}")
-                        continue
-                    # else
-                    # nx.write_graphml(graph, f"{filename}.graphml")
-                    logger.info(f"{' '*base_indent*3}*{full_export_name}*")
-                    if DRAW:
-                        draw(graph, full_export_name)
+    # durées cumulées de chaque étape, en secondes
+    timings = Counter()
+    nb_drawn = 0
+    try:
+        for filename in cog_maps_filenames:
+            logger.info(f"generate_all_graphs: processing{filename}")
+            sources = [filename, thesaurus_filename, weights_filename]
+            start = time.perf_counter()
+            if inputs_cache is None:
+                all_maps, _ = CogMaps(filename).apply_many(thesaurus)
+            else:
+                all_maps, _ = inputs_cache.load_levels(filename, thesaurus_filename)
+            timings["load"] += time.perf_counter() - start
+            for level_name, a_map in all_maps.items():
+                logger.debug(f"{' '*base_indent*1}->{level_name}")
+                # les dessins à faire du niveau, par balayage : [(graphe, fichier, positions de départ)]
+                to_draw = []
+                for weights_name, weights in weights_map.items():
+                    logger.debug(f"{' '*base_indent*2}->{weights_name}")
+                    start = time.perf_counter()
+                    a_map.weights = weights
+                    export_name = f"{GRAPH_DIR / Path(filename).stem}_{level_name}_{weights_name}"
+                    # a_map.dump_matrix(f"{export_name}.csv")
+                    sweep = ThresholdSweep(a_map)
+                    timings["sweep"] += time.perf_counter() - start
+                    to_draw.append([])
+                    # le dernier seuil à jour, non redessiné, dont le suivant doit repartir
+                    skipped = None
+                    for (threshold, nb_nodes, nb_edges) in sweep.stats(sorted(thresholds)):
+                        logger.debug(f"{' '*base_indent*3}->{threshold}")
+                        full_export_name = f"{export_name}_{threshold}.{IMG_FORMAT}"
+                        # on génère au format graphml et graphviz
+                        report[(Path(filename).name, level_name, weights_name, threshold)] = (
+                            Path(full_export_name).name,
+                            nb_nodes,
+                            nb_edges,
+                        )
+                        if nb_nodes == 0:
+                            logger.warning(f"empty graph {export_name}_{threshold}")
+                            continue
+                        # else
+                        # nx.write_graphml(graph, f"{filename}.graphml")
+                        if not force and is_up_to_date(full_export_name, sources):
+                            logger.debug(f"{' '*base_indent*3}*{full_export_name}* up to date, skipped")
+                            skipped = threshold
+                            continue
+                        logger.info(f"{' '*base_indent*3}*{full_export_name}*")
+                        start = time.perf_counter()
+                        graph = sweep.graph(threshold)
+                        positions = None
+                        if warm_start and layout_cache is not None and skipped is not None:
+                            positions = layout_cache.lookup(sweep.graph(skipped), gv_args)
+                        skipped = None
+                        timings["build"] += time.perf_counter() - start
+                        to_draw[-1].append((graph, full_export_name, positions))
+
+                nb_drawn += sum(len(drawings) for drawings in to_draw)
+                start = time.perf_counter()
+                if DRAW and any(to_draw):
+                    GRAPH_DIR.mkdir(parents=True, exist_ok=True)
+                if DRAW and executor is None:
+                    for drawings in to_draw:
+                        draw_one_sweep(drawings)
+                elif DRAW and any(to_draw):
+                    # un balayage par tâche, les positions passent d'un seuil au suivant
+                    # list pour propager les exceptions des dessins
+                    list(executor.map(draw_one_sweep, to_draw))
+                timings["draw"] += time.perf_counter() - start
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    logger.info(f"generate_all_graphs: {nb_drawn} drawn, {len(report) - nb_drawn} skipped or empty")
+    for stage, duration in timings.items():
+        logger.info(f"generate_all_graphs: {stage:<8} {duration:8.2f}s")
     return report
 
 
@@ -139,6 +293,8 @@ def render(content):
     }
     pprint(dimensions)
 
+    env = Environment(loader=FileSystemLoader("."), autoescape=select_autoescape())
+    template = env.get_template("viz/gallerie.jinja2.html")
     html_content = template.render(dimensions=dimensions, content=content)
     # on enregistre le fichier produit sur le disque
     fichier = "viz/gallerie.html"
@@ -149,35 +305,48 @@ def render(content):
 # dossier et format de sortie
 IMG_FORMAT = "svg"  # "png"
 GRAPH_DIR = Path("graphs/")
-Path(GRAPH_DIR).mkdir(parents=True, exist_ok=True)
 # nombre minimal de cooc
 THRESHOLD = 3
 # les deux jeus de données
 DATASETS = [CM_LA_MINE_FILENAME, CM_FUTUR_FILENAME]
 
-THE_THESAURUS = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
-THE_WEIGHTS = CogMaps.load_weights(WEIGHTS_MAP_FILENAME)
-
 DRAW = True
 DEMO = False
+# nombre de processus pour les dessins, 0 pour tous les coeurs
+JOBS = 0
+# moteur de dessin, voir draw_graphviz.BACKENDS
+BACKEND = GRAPHVIZ_BACKEND
 if __name__ == "__main__":
+    # les caches ne sont ouverts qu'à l'exécution du script, pas à l'import du module
+    THE_CACHE = InputsCache()
+    THE_THESAURUS = THE_CACHE.load_thesaurus_map(THESAURUS_FILENAME)
+    THE_WEIGHTS = THE_CACHE.load_weights(WEIGHTS_MAP_FILENAME)
+    THE_LAYOUTS = LayoutCache(CACHE_DIR / "layouts")
     if DEMO:
         report = generate_all_graphs(
             cog_maps_filenames=DATASETS,  # ["input/cartes_cog_small_cooc.csv"],
             thesaurus=THE_THESAURUS,
+            inputs_cache=THE_CACHE,
             weights_map={"exponentielle": THE_WEIGHTS["exponentielle"]},
             thresholds=[float(n) for n in range(9, 10)],
+            jobs=JOBS,
+            layout_cache=THE_LAYOUTS,
+            backend=BACKEND,
         )
     else:
         report = generate_all_graphs(
             cog_maps_filenames=DATASETS,  # DATASETS[0:1],
             thesaurus=THE_THESAURUS,
+            inputs_cache=THE_CACHE,
             weights_map={
                 name: weights
                 for name, weights in THE_WEIGHTS.items()
                 if name in ["arithmetique", "inverse", "exponentielle"]
             },
             thresholds=[float(n) for n in range(6, 12)],
+            jobs=JOBS,
+            layout_cache=THE_LAYOUTS,
+            backend=BACKEND,
         )
     # pprint(report)
     render(report)
@@ -21,10 +21,12 @@ import seaborn as sns
 
 # import sklearn as sk
 import networkx as nx
-import sklearn.cluster as sk
 
 
-from cog_maps import CogMaps, CM_LA_MINE_FILENAME, THESAURUS_FILENAME, WEIGHTS_MAP_FILENAME
+from scipy import sparse
+
+from cog_maps import CogMaps, CM_LA_MINE_FILENAME, THESAURUS_FILENAME, WEIGHTS_MAP_FILENAME, cluster_matrix
+from cog_maps_cache import InputsCache
 
 
 np.set_printoptions(precision=2)
@@ -33,10 +35,11 @@ pd.set_option("display.precision", 2)
 locale.setlocale(locale.LC_ALL, "fr_FR.UTF-8")
 
 # global constants
-weights = CogMaps.load_weights(WEIGHTS_MAP_FILENAME)
-thesaurus = CogMaps.load_thesaurus_map(THESAURUS_FILENAME)
-base_cog_maps = CogMaps(CM_LA_MINE_FILENAME)
-cog_maps, _ = base_cog_maps.apply_many(thesaurus)
+# entrées relues depuis le cache disque, analysées et thésaurus appliqué
+inputs_cache = InputsCache()
+weights = inputs_cache.load_weights(WEIGHTS_MAP_FILENAME)
+thesaurus = inputs_cache.load_thesaurus_map(THESAURUS_FILENAME)
+cog_maps, _ = inputs_cache.load_levels(CM_LA_MINE_FILENAME, THESAURUS_FILENAME)
 
 # level_name: str = "mother",
 # weights_name: str = "pos_3_arith",
@@ -45,18 +48,28 @@ cog_maps, _ = base_cog_maps.apply_many(thesaurus)
 # the_cog_maps.weights = weights[weights_name]
 
 
-def cog_maps_to_df(cog_maps):
-    """Charge une caret cognitive en DataFrame pandas"""
-    df = pd.DataFrame(cog_maps.matrix).fillna(0.0)
+def cog_maps_to_df(cog_maps, filename=None):
+    """Charge une caret cognitive en DataFrame pandas
+
+    Avec filename, la matrice est d'abord écrite dans ce .npy projeté en mémoire, auquel on s'attache sans copie
+    """
     # on trie en gérant les accents
     alpha_words = sorted(cog_maps.words, key=lambda x: unicodedata.normalize("NFD", x))
-    # on réorganise lignes et colonnes
-    df = df.reindex(columns=alpha_words, copy=False).reindex(index=alpha_words, copy=False)
-
-    return df
+    # lignes et colonnes directement dans l'ordre voulu, depuis la matrice creuse
+    if filename is None:
+        matrix, alpha_words = cog_maps.dense_matrix(alpha_words)
+        return pd.DataFrame(matrix, index=alpha_words, columns=alpha_words, copy=False)
+    cog_maps.materialize_matrix(filename, alpha_words)
+    return attach_df(filename)
     # df.describe()
 
 
+def attach_df(filename):
+    """DataFrame pandas sur une matrice écrite par CogMaps.materialize_matrix, sans copie"""
+    matrix, words = CogMaps.attach_matrix(filename)
+    return pd.DataFrame(matrix, index=words, columns=words, copy=False)
+
+
 def heatmap(df: pd.DataFrame, limits=None):
     """Affiche une Heatmap seaborn à partir d'un DataFrame"""
     sns.despine()
@@ -70,15 +83,7 @@ def heatmap(df: pd.DataFrame, limits=None):
     plt.show()
 
 
-def normalize_sym(m):
-    """normalisation symétrique : divise chaque valeur (i,j) par la valeur de sqrt(i,i) et sqrt(j,j), autrement dit (i,j) devient (i,j)/sqrt((i,i) * (j,j)).
-
-    Utilisé pour obtenir le Symmetric Normalized Laplacian"""
-    dsqrt = np.diag(np.power(m.diagonal(), -0.5))
-    return dsqrt @ m @ dsqrt
-
-
-def clusterize(df: pd.DataFrame, n_clusters=5, normalize=False, threshold=0.05):
+def clusterize(df: pd.DataFrame, n_clusters=5, normalize=False, threshold=0.05, spectral=False):
     # https://scikit-learn.org/stable/modules/classes.html#module-sklearn.cluster
 
     # choix d'un algo de clustering
@@ -86,22 +91,15 @@ def clusterize(df: pd.DataFrame, n_clusters=5, normalize=False, threshold=0.05):
     # clustering = sk.AffinityPropagation(random_state=None, damping = 0.5, affinity="precomputed")
     # clustering = sk.AgglomerativeClustering(n_clusters=n_clusters)
     # clustering = sk.DBSCAN(metric="precomputed")
-    clustering = sk.KMeans(n_clusters)
 
     # choix de la variante qu'on va clusteriser
     #  - distance/affinité
     #  - seuillage
     #  - normalisation
-
-    data = df.values.copy()
-
-    if normalize:
-        data = normalize_sym(data)
-    data[data < threshold] = 0.0
-    # data = np.exp(1-data)
-    # np.fill_diagonal(tdata, 0)
-
-    clusters = clustering.fit_predict(data)
+    # le tout sur la matrice creuse, voir cog_maps.cluster_matrix, directement CogMaps.clusterize depuis une carte
+    clusters = cluster_matrix(
+        sparse.csr_matrix(df.values), n_clusters, normalize=normalize, threshold=threshold, spectral=spectral
+    )
     # à chaque index de clustering, la liste des mots
     clusters_idx = defaultdict(list)
     for i, cluster in enumerate(clusters):
@@ -123,7 +121,19 @@ def test():
     pprint(idx)
 
 
-def main():
+def sweep(all_n_clusters=range(2, 11), level_name="mother", weights_name="pos_6_arith", jobs=0):
+    """Balayage du nombre de clusters, pour choisir n_clusters en une seule exécution : l'affinité normalisée et son
+    plongement spectral sont calculés une fois, puis un k-means par nombre de clusters sur jobs processus"""
+    the_cog_maps = cog_maps[level_name]
+    the_cog_maps.weights = weights[weights_name]
+    results, _ = the_cog_maps.clusterize_sweep(all_n_clusters, normalize=True, spectral=True, jobs=jobs)
+    print(f"{'clusters':>8} {'silhouette':>10} {'modularité':>10} {'temps (ms)':>10}")
+    for n_clusters, result in results.items():
+        print(f"{n_clusters:>8} {result.silhouette:>10.3f} {result.modularity:>10.3f} {result.duration:>10.1f}")
+    return results
+
+
+def main(n_clusters=5):
     """Fonction principale :
     1. chargement
     2. clustering
@@ -138,13 +148,11 @@ def main():
     # the_df = cog_maps_to_df(CogMaps("input/cartes_cog_small_cooc.csv"))
     # heatmap(the_df_to_cluster)
 
-    the_df_to_cluster = the_df.copy()
-
-    # le résultat du clustering
-    the_clusters_idx = clusterize(the_df_to_cluster, n_clusters=5, normalize=True)
+    # le résultat du clustering, sur la matrice creuse de la carte et dans l'ordre des mots du DataFrame
+    the_clusters_idx = the_cog_maps.clusterize(n_clusters=n_clusters, words=list(the_df.index), normalize=True)
     # on va réidenxer selont l'ordre donné par les clusters
     sorted_index = [word for _, words in sorted(the_clusters_idx.items()) for word in words]
-    the_df_clustered = the_df_to_cluster.reindex(index=sorted_index, columns=sorted_index)
+    the_df_clustered = the_df.reindex(index=sorted_index, columns=sorted_index)
 
     # on va mettre une petite ligne entre les clusters
     limits = list(accumulate([len(cat) for _, cat in sorted(the_clusters_idx.items())]))
@@ -155,5 +163,11 @@ def main():
         print(idx, clust)
 
 
+# balayage du nombre de clusters au lieu de la heatmap
+SWEEP = False
+
 if __name__ == "__main__":
-    main()
+    if SWEEP:
+        sweep()
+    else:
+        main()